@@ -0,0 +1,65 @@
+"""Time-to-first-token for N simultaneous questions, blocking vs. async retrieval.
+
+Run from the backend dir:  python -m benchmarks.bench_async_retrieval [--questions 50]
+
+"before" replays the previous implementation, which called the blocking
+qdrant_search() inside the async generator; "after" is the current
+chat_rag.async_get_answer_and_docs(). Upstream latency is simulated with the
+fakes in benchmarks/fakes.py, so no network or API keys are needed.
+"""
+import time
+import asyncio
+import argparse
+from benchmarks import fakes
+from src.utils import clients, index_qdrant, chat_rag
+from src.utils.openai_utils import stream_completion
+
+
+async def blocking_get_answer_and_docs(question: str):
+    docs = index_qdrant.qdrant_search(query=question)
+    docs_dict = [doc.payload for doc in docs]
+    yield {"event_type": "on_retriever_end", "content": docs_dict}
+    async for chunk in stream_completion(question, docs_dict):
+        yield {"event_type": "on_chat_model_stream", "content": chunk}
+    yield {"event_type": "done"}
+
+
+async def time_to_first_token(answer_fn, question, started):
+    async for event in answer_fn(question):
+        if event["event_type"] == "on_chat_model_stream":
+            return time.perf_counter() - started
+
+
+async def run(answer_fn, label, questions):
+    started = time.perf_counter()
+    ttfts = sorted(await asyncio.gather(*[
+        time_to_first_token(answer_fn, f"{label} question {i}", started) for i in range(questions)
+    ]))
+    return {
+        "p50_ms": 1000 * ttfts[len(ttfts) // 2],
+        "p95_ms": 1000 * ttfts[int(len(ttfts) * 0.95) - 1],
+        "max_ms": 1000 * ttfts[-1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--embed-latency", type=float, default=0.15)
+    parser.add_argument("--search-latency", type=float, default=0.05)
+    parser.add_argument("--first-token-latency", type=float, default=0.3)
+    args = parser.parse_args()
+
+    clients.registry.set("openai", fakes.FakeOpenAI(args.embed_latency))
+    clients.registry.set("async_openai", fakes.FakeAsyncOpenAI(args.embed_latency, args.first_token_latency))
+    clients.registry.set("qdrant", fakes.FakeQdrant(args.search_latency))
+    clients.registry.set("async_qdrant", fakes.FakeAsyncQdrant(args.search_latency))
+
+    for label, answer_fn in (("before", blocking_get_answer_and_docs), ("after", chat_rag.async_get_answer_and_docs)):
+        result = asyncio.run(run(answer_fn, label, args.questions))
+        print(f"{label:>6}: {args.questions} questions  "
+              + "  ".join(f"{k}={v:.0f}" for k, v in result.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Multiplexed, cancellable /async_read versus the old one-question-at-a-time loop.
+
+Run from the backend dir:  python -m benchmarks.bench_cancellation [--questions 5 --interval 1.0]
+
+A reader turns a page every --interval seconds and asks about it, before
+the previous answer has finished. Each answer streams --tokens tokens from
+the fake OpenAI client, with no WebSocket involved. Three runs are compared:
+
+- "sequential": the original protocol, which plain-text questions still
+  get. A question waits for every earlier answer.
+- "supersede": JSON questions with "supersede": true. Each new question
+  cancels the answer still streaming.
+- "multiplexed": JSON questions with request ids, all answered concurrently.
+
+For each run the script reports time to first token of the last question,
+the tokens generated upstream and how many streams were abandoned. It also
+counts the tokens generated after a simulated disconnect.
+"""
+import time
+import json
+import asyncio
+import argparse
+from benchmarks import fakes
+from src.utils import clients, index_qdrant
+from src.utils.chat_rag import async_get_answer_and_docs
+from src.utils.question_mux import QuestionMultiplexer
+
+
+def install_fake(args):
+    fake = fakes.FakeAsyncOpenAI(embed_latency=args.embed_latency, first_token_latency=args.first_token_latency,
+                                 token_latency=args.token_latency, tokens=args.tokens)
+    clients.registry.set("async_openai", fake)
+    return fake
+
+
+class Recorder:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token = {}
+
+    async def send(self, event):
+        if event["event_type"] == "on_chat_model_stream":
+            self.first_token.setdefault(event.get("request_id"), time.perf_counter() - self.started)
+
+
+async def sequential(args, questions):
+    recorder, pending, asked = Recorder(), asyncio.Queue(), {}
+
+    async def reader():
+        for i, question in enumerate(questions):
+            asked[i] = time.perf_counter() - recorder.started
+            await pending.put((i, question))
+            await asyncio.sleep(args.interval)
+
+    reading = asyncio.create_task(reader())
+    for _ in questions:
+        i, question = await pending.get()
+        async for event in async_get_answer_and_docs(question):
+            await recorder.send({**event, "request_id": i})
+    await reading
+    last = len(questions) - 1
+    return recorder.first_token[last] - asked[last]
+
+
+async def multiplexed(args, questions, supersede):
+    recorder = Recorder()
+    mux = QuestionMultiplexer(async_get_answer_and_docs, recorder.send, max_in_flight=len(questions))
+    asked = 0.0
+    for i, question in enumerate(questions):
+        asked = time.perf_counter() - recorder.started
+        message = json.dumps({"type": "question", "request_id": i, "question": question, "supersede": supersede})
+        await mux.handle(message)
+        if i < len(questions) - 1:
+            await asyncio.sleep(args.interval)
+    while mux.tasks:
+        await asyncio.sleep(0.01)
+    return max(recorder.first_token.values()) - asked
+
+
+async def disconnect(args, fake):
+    mux = QuestionMultiplexer(async_get_answer_and_docs, Recorder().send)
+    await mux.handle("What is this page about?")
+    await asyncio.sleep(args.first_token_latency + args.embed_latency + 10 * args.token_latency)
+    before = fake.tokens_streamed
+    await mux.close()
+    await asyncio.sleep(1.0)
+    return fake.tokens_streamed - before
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=5)
+    parser.add_argument("--interval", type=float, default=1.0)
+    parser.add_argument("--tokens", type=int, default=150)
+    parser.add_argument("--embed-latency", type=float, default=0.1)
+    parser.add_argument("--first-token-latency", type=float, default=0.3)
+    parser.add_argument("--token-latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    async def run():
+        await index_qdrant.async_ensure_collection_exists(index_qdrant.collection_name)
+        for label in ("sequential", "supersede", "multiplexed"):
+            fake = install_fake(args)
+            questions = [f"{label}: what happens on page {i}?" for i in range(args.questions)]
+            if label == "sequential":
+                last_ttft = await sequential(args, questions)
+            else:
+                last_ttft = await multiplexed(args, questions, supersede=label == "supersede")
+            print(f"{label:<12} last question first token {1000 * last_ttft:7.0f}ms   "
+                  f"tokens generated {fake.tokens_streamed:5}/{args.questions * args.tokens}   "
+                  f"streams abandoned {fake.streams_abandoned}")
+        fake = install_fake(args)
+        print(f"disconnect   tokens generated after close: {await disconnect(args, fake)}")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Per-call latency with warm (registry) clients versus a new client per call.
+
+Run from the backend dir:  python -m benchmarks.bench_client_pool [--calls 200]
+
+A local HTTPS server with a throwaway self-signed certificate stands in for the
+upstream APIs, so "cold" includes the TCP and TLS handshakes a fresh client
+pays on every call. Rows cover a plain download (httpx, sync and async), an
+OpenAI SDK embeddings call, and building a boto3 client (no request is sent).
+Requires the openssl CLI to create the certificate.
+"""
+import os
+import ssl
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+import statistics
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._reply(b"x" * 1024, "application/octet-stream")
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = {
+            "object": "list",
+            "data": [{"object": "embedding", "index": 0, "embedding": [0.0] * 8}],
+            "model": "text-embedding-ada-002",
+            "usage": {"prompt_tokens": 1, "total_tokens": 1},
+        }
+        self._reply(json.dumps(body).encode(), "application/json")
+
+    def _reply(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(workdir):
+    cert, key = os.path.join(workdir, "cert.pem"), os.path.join(workdir, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-keyout", key, "-out", cert, "-subj", "/CN=localhost",
+         "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1"],
+        check=True, capture_output=True,
+    )
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, cert
+
+
+def measure(calls, fn):
+    fn()  # the first warm call opens the connection; don't count it
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        fn()
+        timings.append(1000 * (time.perf_counter() - start))
+    return timings
+
+
+async def ameasure(calls, fn):
+    await fn()
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        await fn()
+        timings.append(1000 * (time.perf_counter() - start))
+    return timings
+
+
+def report(label, cold, warm):
+    p50_cold, p50_warm = statistics.median(cold), statistics.median(warm)
+    p95 = lambda values: sorted(values)[int(0.95 * (len(values) - 1))]
+    print(f"{label:<22} cold p50 {p50_cold:7.2f}ms p95 {p95(cold):7.2f}ms   "
+          f"warm p50 {p50_warm:7.2f}ms p95 {p95(warm):7.2f}ms   x{p50_cold / p50_warm:5.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        server, cert = start_server(workdir)
+        url = f"https://localhost:{server.server_address[1]}"
+
+        # The registry's clients verify with the default trust store; point it at the test cert
+        os.environ["SSL_CERT_FILE"] = cert
+        os.environ["OPENAI_API_KEY"] = "sk-benchmark"
+        os.environ["OPENAI_BASE_URL"] = f"{url}/v1"
+
+        import httpx
+        import boto3
+        from openai import OpenAI
+        from src.utils import clients
+
+        def cold_get():
+            with httpx.Client(verify=cert) as client:
+                client.get(f"{url}/image").raise_for_status()
+
+        def warm_get():
+            clients.http_client().get(f"{url}/image").raise_for_status()
+
+        report("download (sync)", measure(args.calls, cold_get), measure(args.calls, warm_get))
+
+        async def run_async():
+            async def cold():
+                async with httpx.AsyncClient(verify=cert) as client:
+                    (await client.get(f"{url}/image")).raise_for_status()
+
+            async def warm():
+                (await clients.async_http_client().get(f"{url}/image")).raise_for_status()
+
+            report("download (async)", await ameasure(args.calls, cold), await ameasure(args.calls, warm))
+            await clients.registry.aclose()
+
+        asyncio.run(run_async())
+
+        def cold_embed():
+            with OpenAI(http_client=httpx.Client(verify=cert)) as client:
+                client.embeddings.create(model="text-embedding-ada-002", input="hello")
+
+        def warm_embed():
+            clients.openai_client().embeddings.create(model="text-embedding-ada-002", input="hello")
+
+        report("openai embeddings", measure(args.calls, cold_embed), measure(args.calls, warm_embed))
+
+        def cold_boto3():
+            boto3.client("s3", region_name="us-east-2")
+
+        def warm_boto3():
+            clients.boto3_client("s3", "us-east-2")
+
+        report("boto3 client (build)", measure(min(args.calls, 50), cold_boto3), measure(args.calls, warm_boto3))
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
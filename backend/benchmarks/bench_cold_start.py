@@ -0,0 +1,88 @@
+"""Import time of the modules app.py loads, and a check that importing them makes no network calls.
+
+Run from the backend dir:  python -m benchmarks.bench_cold_start [--budget-seconds 3]
+
+Each run imports the modules in a fresh interpreter (as a new container would)
+with outbound connections blocked and counted. Exits non-zero if any run opens
+a connection or the median import time exceeds the budget. The one-time
+warmup() is timed separately against embedded (in-memory) Qdrant.
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+APP_MODULES = [
+    "src.utils.chat_rag",
+    "src.utils.index_qdrant",
+    "src.utils.indexing_jobs",
+    "src.utils.image_events",
+    "src.utils.connection_manager",
+    "src.utils.upload_s3",
+]
+
+IMPORT_PROBE = """
+import json, socket, time, importlib
+attempts = []
+def blocked(self, address, *args, **kwargs):
+    attempts.append(repr(address))
+    raise OSError("network disabled during import")
+socket.socket.connect = blocked
+socket.socket.connect_ex = blocked
+started = time.perf_counter()
+for name in {modules!r}:
+    importlib.import_module(name)
+print(json.dumps({{"seconds": time.perf_counter() - started, "connections": attempts}}))
+"""
+
+WARMUP_PROBE = """
+import json, time, asyncio
+from benchmarks import fakes
+from src.utils import index_qdrant
+started = time.perf_counter()
+asyncio.run(index_qdrant.warmup())
+print(json.dumps({"seconds": time.perf_counter() - started}))
+"""
+
+
+def run_probe(code, env):
+    output = subprocess.run(
+        [sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    # A real-looking remote Qdrant, so an eager client or collection check would try to connect
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "sk-benchmark",
+        "QDRANT_URL": "http://qdrant.invalid:6333",
+        "EMBEDDING_CACHE_PATH": "",
+    }
+    runs = [run_probe(IMPORT_PROBE.format(modules=APP_MODULES), env) for _ in range(args.runs)]
+    seconds = [run["seconds"] for run in runs]
+    connections = sorted({address for run in runs for address in run["connections"]})
+    median = statistics.median(seconds)
+    print(f"import: median {median:.3f}s  min {min(seconds):.3f}s  max {max(seconds):.3f}s  "
+          f"({args.runs} runs, budget {args.budget_seconds:.1f}s)")
+    print(f"connections attempted during import: {len(connections)} {connections if connections else ''}")
+
+    warmup = run_probe(WARMUP_PROBE, {**env, "QDRANT_URL": ":memory:"})
+    print(f"warmup (embedded Qdrant): {warmup['seconds']:.3f}s")
+
+    if connections or median > args.budget_seconds:
+        print("FAIL")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
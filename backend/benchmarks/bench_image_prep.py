@@ -0,0 +1,61 @@
+"""Image normalization before vision calls: bytes, time and estimated tokens per setting.
+
+Run from the backend dir:  python -m benchmarks.bench_image_prep [--repeat 5]
+
+A synthetic camera frame is generated: a UXGA (1600x1200) JPEG of a book
+page on a darker desk, rotated through EXIF like the XIAO camera can
+produce. It is normalized with several settings. For each setting the
+script prints output bytes and size, normalize time, the estimated upload
+time saved, and an estimate of OpenAI high-detail image tokens
+(85 + 170 per 512px tile after scaling to 2048 and 768).
+"""
+import math
+import time
+import argparse
+from io import BytesIO
+from PIL import Image
+from src.utils.image_prep import IMAGE_UPLINK_MBPS, normalize_image
+from tests.fakes import camera_frame
+
+
+def vision_tokens(width, height):
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    frame = camera_frame()
+    with Image.open(BytesIO(frame)) as image:
+        size = image.size
+    print(f"input: JPEG {size[0]}x{size[1]}, {len(frame)} bytes, ~{vision_tokens(*size)} tokens")
+    settings = [
+        ("jpeg 1280", {}),
+        ("jpeg 1024", {"max_edge": 1024}),
+        ("webp 1280", {"image_format": "webp"}),
+        ("jpeg 1280 gray", {"grayscale": True}),
+        ("jpeg 1280 gray crop", {"grayscale": True, "crop_text": True}),
+        ("jpeg 960 gray crop", {"max_edge": 960, "grayscale": True, "crop_text": True}),
+    ]
+    for label, options in settings:
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            result = normalize_image(frame, **options)
+            timings.append(time.perf_counter() - started)
+        seconds = sorted(timings)[len(timings) // 2]
+        upload_saved = (len(frame) - result.bytes_out) * 8 / (IMAGE_UPLINK_MBPS * 1e6)
+        print(f"{label:<20} {result.mime_type:<10} {result.size[0]:4}x{result.size[1]:<4} "
+              f"{result.bytes_out:7} bytes ({100 * result.bytes_out / len(frame):3.0f}%)  "
+              f"{1000 * seconds:5.1f}ms  upload saved {1000 * upload_saved:4.0f}ms @ {IMAGE_UPLINK_MBPS:g} Mbps  "
+              f"~{vision_tokens(*result.size)} tokens")
+
+
+if __name__ == "__main__":
+    main()
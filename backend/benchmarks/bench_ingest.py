@@ -0,0 +1,40 @@
+"""Chunks/second of the batched ingestion pipeline across batch sizes and concurrency.
+
+Run from the backend dir:  python -m benchmarks.bench_ingest [--chunks 2000]
+
+Embedding requests go to a fake AsyncOpenAI with a fixed per-request latency;
+points are upserted into embedded (in-memory) Qdrant.
+"""
+import asyncio
+import argparse
+from langchain_core.documents import Document
+from benchmarks import fakes
+from src.utils import clients, index_qdrant
+from src.utils.ingest_pipeline import ingest_documents
+
+
+async def run(chunks, batch_size, concurrency):
+    collection = f"bench_{batch_size}_{concurrency}"
+    await index_qdrant.async_ensure_collection_exists(collection)
+    docs = [Document(page_content=f"{collection} chunk {i}", metadata={"source": "bench"}) for i in range(chunks)]
+    return await ingest_documents(index_qdrant.get_async_client(), collection, docs, batch_size, concurrency)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--embed-latency", type=float, default=0.2)
+    parser.add_argument("--batch-sizes", default="16,64,256")
+    parser.add_argument("--concurrency", default="1,4,8")
+    args = parser.parse_args()
+
+    clients.registry.set("async_openai", fakes.FakeAsyncOpenAI(embed_latency=args.embed_latency))
+    for batch_size in map(int, args.batch_sizes.split(",")):
+        for concurrency in map(int, args.concurrency.split(",")):
+            stats = asyncio.run(run(args.chunks, batch_size, concurrency))
+            print(f"batch_size={batch_size:<4} concurrency={concurrency:<2} "
+                  f"{stats['chunks_per_second']:8.1f} chunks/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Overhead of the in-process metrics, plus a sample /metrics scrape.
+
+Run from the backend dir:  python -m benchmarks.bench_metrics [--iterations 200000]
+
+Reports the cost per span(), per histogram observation and per event passed
+through timed_stream(), and how long rendering takes with many label sets.
+Then it answers a few questions through async_get_answer_and_docs (fake
+upstreams, embedded Qdrant) and prints the resulting scrape.
+"""
+import time
+import asyncio
+import argparse
+from benchmarks import fakes
+from src.utils import clients, index_qdrant
+from src.utils.chat_rag import async_get_answer_and_docs
+from src.utils.metrics import MetricsRegistry, metrics, span, timed_stream
+
+
+def per_call_ns(iterations, fn):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return 1e9 * (time.perf_counter() - started) / iterations
+
+
+def bare():
+    pass
+
+
+def spanned():
+    with span("bench", "noop"):
+        pass
+
+
+async def events(count):
+    for _ in range(count):
+        yield {"event_type": "on_chat_model_stream", "content": "x"}
+    yield {"event_type": "done"}
+
+
+async def drain(stream):
+    async for _ in stream:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument("--label-sets", type=int, default=200)
+    parser.add_argument("--questions", type=int, default=5)
+    args = parser.parse_args()
+
+    baseline = per_call_ns(args.iterations, bare)
+    print(f"span()               {per_call_ns(args.iterations, spanned) - baseline:8.0f} ns/call")
+
+    histogram = MetricsRegistry().histogram("bench_seconds", "bench", ("route",))
+    print(f"Histogram.observe()  {per_call_ns(args.iterations, lambda: histogram.observe(0.1, route='a')):8.0f} ns/call")
+
+    started = time.perf_counter()
+    asyncio.run(drain(events(args.iterations)))
+    plain = time.perf_counter() - started
+    started = time.perf_counter()
+    asyncio.run(drain(timed_stream("bench", events(args.iterations))))
+    print(f"timed_stream()       {1e9 * (time.perf_counter() - started - plain) / args.iterations:8.0f} ns/event")
+
+    registry = MetricsRegistry()
+    many = registry.histogram("bench_many_seconds", "bench", ("route",))
+    for i in range(args.label_sets):
+        many.observe(0.1, route=f"r{i}")
+    started = time.perf_counter()
+    body = registry.render()
+    print(f"render()             {1000 * (time.perf_counter() - started):8.2f} ms for {args.label_sets} label sets "
+          f"({len(body) / 1024:.0f} KiB)")
+
+    clients.registry.set("async_openai", fakes.FakeAsyncOpenAI(embed_latency=0.02, first_token_latency=0.05))
+
+    async def answer():
+        await index_qdrant.async_ensure_collection_exists(index_qdrant.collection_name)
+        for i in range(args.questions):
+            await drain(timed_stream("async_chat", async_get_answer_and_docs(f"bench question {i}")))
+
+    asyncio.run(answer())
+    print("\nSample scrape:")
+    for line in metrics.render().splitlines():
+        if "_bucket" not in line and not line.startswith("# HELP"):
+            print(f"  {line}")
+
+
+if __name__ == "__main__":
+    main()
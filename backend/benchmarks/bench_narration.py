@@ -0,0 +1,91 @@
+"""Streaming narration versus one Polly call after the full explanation.
+
+Run from the backend dir:  python -m benchmarks.bench_narration [--runs 3]
+
+process_image runs against the fake clients from bench_page_cache, with the
+page cache disabled. The explanation streams an 80-word, five-sentence text
+word by word, and Polly's fake latency grows with the length of the text.
+For NARRATION_MODE "full" and "streaming", the script reports:
+
+- when the first audio is available to the client: the on_image_audio URL
+  in full mode, the first on_image_audio_chunk in streaming mode;
+- when the explanation finished;
+- when the whole request finished.
+
+In streaming mode it also checks that the chunks arrive in order and
+that, joined together, they match the MP3 uploaded to S3.
+"""
+import time
+import base64
+import asyncio
+import argparse
+from benchmarks import fakes
+from benchmarks.bench_image_prep import camera_frame
+from src.utils import clients, upload_s3
+from src.utils.page_cache import page_cache
+
+EXPLANATION = (
+    "This part of the story is about a fox who wants to find her way home. "
+    "She walks through the forest and feels a little scared of the dark. "
+    "Then she remembers what her mother told her about following the river. "
+    "She listens for the sound of water and follows it step by step. "
+    "In the end she finds her family waiting for her near the big old tree."
+)
+
+
+async def run_once(args, mode, seed):
+    upload_s3.NARRATION_MODE = mode
+    s3 = fakes.FakeS3(latency=0.1)
+    clients.registry.set("gemini:gemini-1.5-pro", fakes.FakeGemini(latency=args.ocr_latency))
+    clients.registry.set("async_openai", fakes.FakeAsyncOpenAI(first_token_latency=0.5, token_latency=args.token_latency,
+                                                               image_latency=args.image_latency, text=EXPLANATION))
+    clients.registry.set("async_http", fakes.FakeAsyncHttp(content=camera_frame(320, 320), latency=0.2))
+    clients.registry.set(f"boto3:s3:{upload_s3.S3_REGION}", s3)
+    clients.registry.set(f"boto3:polly:{upload_s3.S3_REGION}",
+                         fakes.FakePolly(latency=args.polly_latency, latency_per_char=args.polly_latency_per_char))
+
+    started = time.perf_counter()
+    seen, chunks = {}, []
+
+    async def emit(event_type, content):
+        seen.setdefault(event_type, time.perf_counter() - started)
+        if event_type == "on_image_audio_chunk":
+            chunks.append(content)
+
+    await upload_s3.process_image(camera_frame(seed=seed), emit=emit)
+    total = time.perf_counter() - started
+    first_audio = seen.get("on_image_audio_chunk", seen.get("on_image_audio"))
+    check = ""
+    if chunks:
+        in_order = [chunk["index"] for chunk in chunks] == list(range(len(chunks)))
+        uploaded = next(data for key, data in s3.objects.items() if key.endswith(".mp3"))
+        joined = b"".join(base64.b64decode(chunk["audio"]) for chunk in chunks)
+        check = f"  {len(chunks)} chunks, in order: {in_order}, match upload: {joined == uploaded}"
+    return first_audio, seen["on_image_explanation"], total, check
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--ocr-latency", type=float, default=1.0)
+    parser.add_argument("--token-latency", type=float, default=0.04)
+    parser.add_argument("--image-latency", type=float, default=3.0)
+    parser.add_argument("--polly-latency", type=float, default=0.25)
+    parser.add_argument("--polly-latency-per-char", type=float, default=0.002)
+    args = parser.parse_args()
+    page_cache.max_entries = 0
+
+    async def run():
+        for mode in ("full", "streaming"):
+            results = [await run_once(args, mode, seed) for seed in range(args.runs)]
+            first_audio = sorted(r[0] for r in results)[len(results) // 2]
+            explained = sorted(r[1] for r in results)[len(results) // 2]
+            total = sorted(r[2] for r in results)[len(results) // 2]
+            print(f"{mode:<10} first audio {1000 * first_audio:6.0f}ms   explanation done {1000 * explained:6.0f}ms   "
+                  f"request done {1000 * total:6.0f}ms{results[-1][3]}")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
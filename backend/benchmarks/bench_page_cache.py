@@ -0,0 +1,108 @@
+"""Page cache for repeated camera scans: latency and upstream calls per capture.
+
+Run from the backend dir:  python -m benchmarks.bench_page_cache
+
+process_image runs against fake Gemini, OpenAI (explanation and DALL-E),
+HTTP, S3 and Polly clients with fixed latencies. The script replays a
+reading session with the camera capturing every 30 seconds:
+
+- a page is captured several times while it is being read, each time with
+  fresh sensor noise and a small lighting change;
+- one capture is also shifted a few pixels, as when the book is nudged;
+- an earlier page is revisited at the end.
+
+For each capture it prints how it was answered (miss, frame or text) and
+its latency. It then checks that the frame hash never matches a different
+page, over --pages synthetic pages with the same layout.
+"""
+import time
+import random
+import asyncio
+import argparse
+from io import BytesIO
+from PIL import Image, ImageEnhance
+from benchmarks import fakes
+from benchmarks.bench_image_prep import camera_frame
+from src.utils import clients
+from src.utils.upload_s3 import process_image, S3_REGION
+from src.utils.page_cache import page_cache, perceptual_hash
+
+
+def recapture(frame: bytes, seed: int, shift: int = 0):
+    rng = random.Random(seed)
+    image = Image.open(BytesIO(frame))
+    exif = image.getexif()
+    if shift:
+        image = image.transform(image.size, Image.AFFINE, (1, 0, shift, 0, 1, shift), fillcolor=(90, 80, 70))
+    image = ImageEnhance.Brightness(image).enhance(rng.uniform(0.9, 1.1))
+    image = Image.blend(image, Image.effect_noise(image.size, 30).convert("RGB"), 0.08)
+    output = BytesIO()
+    image.save(output, format="JPEG", quality=90, exif=exif)
+    return output.getvalue()
+
+
+def install_fakes(args):
+    gemini = fakes.FakeGemini(latency=args.ocr_latency)
+    openai = fakes.FakeAsyncOpenAI(first_token_latency=0.5, token_latency=0.02, tokens=60,
+                                   image_latency=args.image_latency)
+    polly = fakes.FakePolly(latency=0.5)
+    clients.registry.set("gemini:gemini-1.5-pro", gemini)
+    clients.registry.set("async_openai", openai)
+    clients.registry.set("async_http", fakes.FakeAsyncHttp(content=camera_frame(320, 320), latency=0.2))
+    clients.registry.set(f"boto3:s3:{S3_REGION}", fakes.FakeS3(latency=0.1))
+    clients.registry.set(f"boto3:polly:{S3_REGION}", polly)
+    return gemini, openai, polly
+
+
+async def session(args):
+    gemini, openai, polly = install_fakes(args)
+    pages = {i: camera_frame(seed=i) for i in range(3)}
+    # (page, capture seed, shift in pixels)
+    captures = [(0, 1, 0), (0, 2, 0), (0, 3, 0), (1, 4, 0), (1, 5, 0), (1, 6, 4), (1, 7, 0), (2, 8, 0), (2, 9, 0), (0, 10, 0)]
+    latencies = {"miss": [], "frame": [], "text": []}
+    for number, (page, seed, shift) in enumerate(captures, 1):
+        gemini.text = f"Text of page {page}. " * 20
+        frame = recapture(pages[page], seed, shift)
+        started = time.perf_counter()
+        result = await process_image(frame)
+        elapsed = time.perf_counter() - started
+        answered = result["page_cache"] or "miss"
+        latencies[answered].append(elapsed)
+        print(f"  capture {number:2}: page {page}{' (shifted)' if shift else '          '}  "
+              f"{answered:<5} {1000 * elapsed:6.0f}ms")
+    for answered, values in latencies.items():
+        if values:
+            print(f"  {answered:<5} {len(values):2} captures, mean {1000 * sum(values) / len(values):6.0f}ms")
+    stats = page_cache.stats()
+    print(f"  hit rate {stats['hit_rate']:.0%}; upstream calls: {gemini.calls} OCR, "
+          f"{openai.images_generated} DALL-E, {polly.calls} Polly")
+
+
+def false_matches(pages):
+    hashes = [perceptual_hash(camera_frame(seed=100 + i)) for i in range(pages)]
+    distances = [(a ^ b).bit_count() for i, a in enumerate(hashes) for b in hashes[i + 1:]]
+    matches = sum(1 for distance in distances if distance <= page_cache.max_distance)
+    print(f"  {pages} pages: closest pair {min(distances)} bits apart (threshold {page_cache.max_distance}), "
+          f"{matches} false matches")
+    frame = camera_frame()
+    started = time.perf_counter()
+    for _ in range(20):
+        perceptual_hash(frame)
+    print(f"  perceptual hash {1000 * (time.perf_counter() - started) / 20:.1f}ms per UXGA frame")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ocr-latency", type=float, default=1.5)
+    parser.add_argument("--image-latency", type=float, default=3.0)
+    parser.add_argument("--pages", type=int, default=20)
+    args = parser.parse_args()
+
+    print("Reading session:")
+    asyncio.run(session(args))
+    print("Distinct pages:")
+    false_matches(args.pages)
+
+
+if __name__ == "__main__":
+    main()
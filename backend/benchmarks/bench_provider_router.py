@@ -0,0 +1,235 @@
+"""Hedged, deadline-aware provider routing: behaviour checks and tail latency of process_image.
+
+Run from the backend dir:  python -m benchmarks.bench_provider_router [--requests 60] [--concurrency 6]
+
+Router checks, with FakeProviders that inject delays and failures:
+
+- a call slower than the provider's p95 is hedged, the alternate answers
+  and the slow attempt is cancelled; a normal call is not hedged;
+- a failing provider fails over at once;
+- repeated failures open the circuit, so the provider is skipped without
+  being called, and after the reset time one trial call closes it again;
+- the deadline ends a call on time, without opening any circuit;
+- with every circuit open, a call fails immediately.
+
+process_image then runs against fake clients where Gemini OCR, GPT-4o
+and Polly each have a 4% chance of a multi-second stall. The same requests
+run with hedging off and on, and the script prints the latency percentiles
+of the whole request. It also replays a Gemini outage (failover, then the
+circuit opening) and a request whose deadline passes before DALL-E answers.
+
+Exits non-zero on any failed check.
+"""
+import sys
+import time
+import asyncio
+import argparse
+from benchmarks import fakes
+from benchmarks.bench_image_prep import camera_frame
+from src.utils import clients, upload_s3
+from src.utils.metrics import metrics
+from src.utils.page_cache import page_cache
+from src.utils.provider_router import (ROUTER_MIN_SAMPLES, Deadline, DeadlineExceeded, Provider, ProviderRouter,
+                                       ProviderUnavailable)
+
+EXPLANATION = (
+    "This page is about a girl who finds an old map in her attic. "
+    "She is curious and a little nervous about where it leads. "
+    "She decides to follow it with her best friend after school. "
+    "Along the way they learn to trust each other and stay brave."
+)
+
+
+def check(failures, ok: bool, description: str):
+    print(f"  {'ok  ' if ok else 'FAIL'} {description}")
+    if not ok:
+        failures.append(description)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def timed(call):
+    started = time.perf_counter()
+    try:
+        result = await call
+    except Exception as e:
+        result = e
+    return result, time.perf_counter() - started
+
+
+async def router_checks(failures):
+    # Hedging: the primary usually answers in 50ms; call 25 takes 2s
+    primary = fakes.FakeProvider("primary", latency=lambda call: 2.0 if call == ROUTER_MIN_SAMPLES + 5 else 0.05)
+    alternate = fakes.FakeProvider("alternate", latency=0.1)
+    router = ProviderRouter("check", [Provider("primary", primary), Provider("alternate", alternate)], hedge_after=1.0)
+    for _ in range(ROUTER_MIN_SAMPLES + 4):
+        await router.call()
+    check(failures, alternate.calls == 0, f"calls within the p95 ({1000 * router.providers[0].p95():.0f}ms) are not hedged")
+    (result, provider), elapsed = await timed(router.call())
+    await asyncio.sleep(0)
+    check(failures, provider == "alternate" and elapsed < 0.3 and primary.cancelled == 1,
+          f"a 2s call is hedged after the p95 and answered by the alternate in {1000 * elapsed:.0f}ms; "
+          f"the slow attempt is cancelled")
+
+    # Failover and circuit breaker: the primary is down and fails after 20ms
+    primary = fakes.FakeProvider("primary", latency=0.05, faults=fakes.Faults(down=True, failure_latency=0.02))
+    alternate = fakes.FakeProvider("alternate", latency=0.1)
+    router = ProviderRouter("check", [Provider("primary", primary), Provider("alternate", alternate)], hedge_after=1.0)
+    router.providers[0].breaker.reset_seconds = 2.0
+    (result, provider), elapsed = await timed(router.call())
+    check(failures, provider == "alternate" and elapsed < 0.2,
+          f"a failing provider fails over at once ({1000 * elapsed:.0f}ms)")
+    for _ in range(9):
+        await router.call()
+    breaker = router.providers[0].breaker
+    check(failures, primary.calls == breaker.failure_threshold and breaker.state == "open"
+          and router.stats()["rejected"] == 10 - breaker.failure_threshold,
+          f"after {breaker.failure_threshold} failures the circuit opens: {primary.calls} calls to the primary "
+          f"out of 10, {router.stats()['rejected']} skipped")
+    primary.faults.down = False
+    await asyncio.sleep(2.0)
+    (result, provider), _ = await timed(router.call())
+    check(failures, provider == "primary" and breaker.state == "closed",
+          "after the reset time a trial call reaches the recovered provider and closes the circuit")
+
+    # Deadline: both providers stall
+    primary = fakes.FakeProvider("primary", latency=5.0)
+    alternate = fakes.FakeProvider("alternate", latency=5.0)
+    router = ProviderRouter("check", [Provider("primary", primary), Provider("alternate", alternate)], hedge_after=0.1)
+    error, elapsed = await timed(router.call(deadline=Deadline(0.3)))
+    await asyncio.sleep(0)
+    check(failures, isinstance(error, DeadlineExceeded) and 0.29 < elapsed < 0.4
+          and all(p.breaker.state == "closed" and p.breaker.failures == 0 for p in router.providers)
+          and primary.cancelled == alternate.cancelled == 1,
+          f"a 300ms deadline ends the call after {1000 * elapsed:.0f}ms, cancels both attempts and opens no circuit")
+
+    for p in router.providers:
+        for _ in range(p.breaker.failure_threshold):
+            p.breaker.record_failure()
+    error, elapsed = await timed(router.call())
+    check(failures, isinstance(error, ProviderUnavailable) and elapsed < 0.005 and primary.calls == 1,
+          f"with every circuit open a call fails in {1000 * elapsed:.1f}ms without calling anyone")
+
+
+def install_fakes(ocr_faults, openai_faults, polly_faults, image_latency=0.5):
+    gemini = fakes.FakeGemini(latency=0.4, text="Text of the page. " * 20, faults=ocr_faults)
+    openai = fakes.FakeAsyncOpenAI(first_token_latency=0.3, token_latency=0.01, text=EXPLANATION,
+                                   image_latency=image_latency, speech_latency=0.3, faults=openai_faults)
+    clients.registry.set("gemini:gemini-1.5-pro", gemini)
+    clients.registry.set("gemini:gemini-1.5-flash", fakes.FakeGemini(latency=0.5, token_latency=0.01, text=EXPLANATION))
+    clients.registry.set("async_openai", openai)
+    clients.registry.set("async_http", fakes.FakeAsyncHttp(content=camera_frame(320, 320), latency=0.1))
+    clients.registry.set(f"boto3:s3:{upload_s3.S3_REGION}", fakes.FakeS3(latency=0.05))
+    clients.registry.set(f"boto3:polly:{upload_s3.S3_REGION}", fakes.FakePolly(latency=0.2, faults=polly_faults))
+    return gemini, openai
+
+
+# DALL-E is never hedged (a second image costs as much as the first)
+HEDGED = [router for router in upload_s3.routers if router.hedge]
+
+
+def reset_routers(hedge: bool):
+    for router in upload_s3.routers:
+        router.hedge = hedge and router in HEDGED
+        router._counters = dict.fromkeys(router._counters, 0)
+        for provider in router.providers:
+            provider.latencies.clear()
+            provider.breaker.record_success()
+
+
+async def tail_latency(args, hedge: bool):
+    # The same seeds in both runs, so both see the same stalls
+    install_fakes(fakes.Faults(tail_rate=0.04, tail_latency=5.0, seed=1),
+                  fakes.Faults(tail_rate=0.04, tail_latency=5.0, models=("gpt-4o",), seed=2),
+                  fakes.Faults(tail_rate=0.04, tail_latency=3.0, seed=3))
+    reset_routers(hedge)
+    frames = [camera_frame(640, 480, seed=seed) for seed in range(args.requests + ROUTER_MIN_SAMPLES)]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, incomplete = [], 0
+
+    async def one(frame, measured=True):
+        nonlocal incomplete
+        async with semaphore:
+            result, elapsed = await timed(upload_s3.process_image(frame))
+        if not measured:
+            return
+        latencies.append(elapsed)
+        if isinstance(result, Exception) or not all(result.get(f) for f in ("text", "explanation_text", "image_url", "mp3_url")):
+            incomplete += 1
+
+    # A running server has seen enough calls to know each provider's p95
+    await asyncio.gather(*(one(frame, measured=False) for frame in frames[:ROUTER_MIN_SAMPLES]))
+    for router in upload_s3.routers:
+        router._counters = dict.fromkeys(router._counters, 0)
+    await asyncio.gather(*(one(frame) for frame in frames[ROUTER_MIN_SAMPLES:]))
+    hedges = {router.operation: router.stats()["hedges"] for router in upload_s3.routers if router.stats()["hedges"]}
+    print(f"  hedging {'on ' if hedge else 'off'}  p50 {percentile(latencies, 0.5):5.2f}s  "
+          f"p95 {percentile(latencies, 0.95):5.2f}s  p99 {percentile(latencies, 0.99):5.2f}s  "
+          f"max {max(latencies):5.2f}s  incomplete {incomplete}  hedges {hedges}")
+    return latencies
+
+
+async def outage(failures):
+    gemini, _ = install_fakes(fakes.Faults(down=True, failure_latency=0.3), fakes.Faults(), fakes.Faults())
+    reset_routers(True)
+    ocr = upload_s3.ocr_router
+    threshold = ocr.providers[0].breaker.failure_threshold
+    answered = []
+    for seed in range(threshold + 3):
+        result = await upload_s3.process_image(camera_frame(640, 480, seed=100 + seed))
+        answered.append((result["providers"].get("ocr"), result["timings"]["ocr"]["duration_ms"]))
+    print("  Gemini down: " + ", ".join(f"{provider.split(':')[1]} {ms:.0f}ms" for provider, ms in answered))
+    check(failures, all(provider == "openai:gpt-4o" for provider, _ in answered) and gemini.faults.calls == threshold,
+          f"every page is still read; Gemini is called {gemini.faults.calls} times, then its circuit opens")
+    gemini.faults.down = False
+    ocr.providers[0].breaker.reset_seconds = 0.5
+    await asyncio.sleep(0.5)
+    result = await upload_s3.process_image(camera_frame(640, 480, seed=200))
+    check(failures, result["providers"].get("ocr") == "gemini:gemini-1.5-pro" and ocr.providers[0].breaker.state == "closed",
+          "Gemini is used again once it recovers and the reset time has passed")
+
+
+async def deadline(failures):
+    install_fakes(fakes.Faults(), fakes.Faults(), fakes.Faults(), image_latency=10.0)
+    reset_routers(True)
+    result, elapsed = await timed(upload_s3.process_image(camera_frame(640, 480, seed=300), deadline=Deadline(3.0)))
+    check(failures, not isinstance(result, Exception) and elapsed < 3.3 and result.get("explanation_text")
+          and result.get("mp3_url") and result.get("image_url") is None,
+          f"with a 3s deadline and a 10s DALL-E, the request returns after {elapsed:.2f}s with text, "
+          f"explanation and audio but no illustration")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=6)
+    args = parser.parse_args()
+    page_cache.max_entries = 0
+    failures = []
+
+    async def run():
+        print("ProviderRouter:")
+        await router_checks(failures)
+        print(f"process_image, {args.requests} requests, {args.concurrency} at a time, 4% stalls per upstream:")
+        off = await tail_latency(args, hedge=False)
+        on = await tail_latency(args, hedge=True)
+        check(failures, percentile(on, 0.95) < percentile(off, 0.95), "hedging lowers the p95")
+        print("Outage:")
+        await outage(failures)
+        print("Deadline:")
+        await deadline(failures)
+
+    asyncio.run(run())
+    samples = [line for line in metrics.render().splitlines()
+               if line.startswith('readbuddy_provider_seconds_count{operation="ocr"')]
+    check(failures, bool(samples), f"per-provider latency histograms: {'; '.join(samples)}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""Illustration renditions for the reader display and the PWA: bytes, transfer time and HTTP behaviour.
+
+Run from the backend dir:  python -m benchmarks.bench_renditions [--link-kbps 2000]
+
+A synthetic 1024x1024 illustration (gradients, shapes and some grain, like
+DALL-E output) is resized to the 240x240 BMP that process_image stores.
+For each rendition format the script prints the bytes, the render time and
+the transfer time over a --link-kbps link (the ESP32's effective Wi-Fi
+download rate). It also checks that the RGB565 bytes decode back to the
+source image.
+
+The /images/{image_id} route from app.py is then mounted on a small FastAPI
+app (app.py itself needs modal), over a fake S3, and the script checks:
+
+- format selection through ?format= and the Accept header, and 406;
+- ETag and If-None-Match, which answer 304 without a render;
+- byte ranges (first chunk, resume, suffix), If-Range and 416;
+- one render per (image, format), also for concurrent requests;
+- 404 for an unknown image.
+
+Exits non-zero on any failure.
+"""
+import sys
+import math
+import time
+import random
+import asyncio
+import argparse
+from io import BytesIO
+import numpy as np
+from PIL import Image, ImageDraw
+from fastapi import FastAPI, Request, Query
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+from benchmarks import fakes
+from src.utils import clients, renditions
+from src.utils.upload_s3 import (ILLUSTRATION_FILE_NAME, S3_REGION, _resize_to_bmp, download_asset, illustration_key,
+                                 image_id_from_key, upload_to_s3)
+from src.utils.renditions import (FORMATS, RenditionStore, choose_format, not_modified_response, render,
+                                  rendition_response, valid_image_id)
+
+
+def illustration(size=1024, seed=0):
+    rng = random.Random(seed)
+    gradient = np.linspace(0, 1, size)[None, :, None] * np.array([120, 60, -80]) + np.array([90, 150, 220])
+    image = Image.fromarray(np.repeat(gradient, size, axis=0).clip(0, 255).astype(np.uint8))
+    draw = ImageDraw.Draw(image)
+    for _ in range(25):
+        x, y, r = rng.randrange(size), rng.randrange(size), rng.randrange(30, 200)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        (draw.ellipse if rng.random() < 0.5 else draw.rectangle)((x - r, y - r, x + r, y + r), fill=color)
+    grain = Image.effect_noise((size, size), 20).convert("RGB")
+    output = BytesIO()
+    Image.blend(image, grain, 0.06).save(output, format="PNG")
+    return output.getvalue()
+
+
+def rgb565_to_image(data: bytes, size):
+    packed = np.frombuffer(data, dtype=">u2" if renditions.RENDITION_RGB565_BYTE_ORDER == "big" else "<u2")
+    packed = packed.reshape(size[1], size[0]).astype(np.uint32)
+    red, green, blue = (packed >> 11) & 0x1F, (packed >> 5) & 0x3F, packed & 0x1F
+    pixels = np.stack([red * 255 // 31, green * 255 // 63, blue * 255 // 31], axis=-1)
+    return Image.fromarray(pixels.astype(np.uint8))
+
+
+def psnr(a, b):
+    mse = np.mean((np.asarray(a, dtype=np.float64) - np.asarray(b, dtype=np.float64)) ** 2)
+    return math.inf if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+
+def check(failures, ok: bool, description: str):
+    print(f"  {'ok  ' if ok else 'FAIL'} {description}")
+    if not ok:
+        failures.append(description)
+
+
+def formats(args, source, failures):
+    reference = Image.open(BytesIO(source)).convert("RGB")
+    print(f"{'format':<8} {'bytes':>8} {'render':>9} {'transfer':>10}  quality")
+    for image_format in FORMATS:
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            data = render(source, image_format)
+        elapsed = (time.perf_counter() - started) / args.repeat
+        if image_format == "rgb565":
+            decoded = rgb565_to_image(data, renditions.RENDITION_SIZE)
+        else:
+            decoded = Image.open(BytesIO(data)).convert("RGB")
+        transfer = len(data) * 8 / (args.link_kbps * 1000)
+        print(f"{image_format:<8} {len(data):8} {1000 * elapsed:7.1f}ms {1000 * transfer:8.0f}ms  "
+              f"PSNR {psnr(reference, decoded):5.1f} dB")
+        if image_format == "rgb565":
+            check(failures, len(data) == 2 * 240 * 240 and psnr(reference, decoded) > 35,
+                  "RGB565 is 2 bytes per pixel and decodes back to the source")
+
+
+# The /images route of app.py, on its own app
+def rendition_app(store):
+    app = FastAPI()
+
+    @app.get("/images/{image_id}")
+    async def get_image_rendition(image_id: str, http_request: Request, image_format: str = Query(None, alias="format")):
+        image_format = choose_format(image_format, http_request.headers.get("accept"))
+        if image_format is None:
+            return JSONResponse(content={"error": f"Supported formats: {', '.join(FORMATS)}"}, status_code=406)
+        if not valid_image_id(image_id):
+            return JSONResponse(content={"error": f"Image {image_id} not found"}, status_code=404)
+        not_modified = not_modified_response(image_id, image_format, http_request.headers)
+        if not_modified is not None:
+            return not_modified
+        rendition = await store.get(image_id, image_format, lambda: download_asset(illustration_key(image_id)))
+        if rendition is None:
+            return JSONResponse(content={"error": f"Image {image_id} not found"}, status_code=404)
+        return rendition_response(rendition, http_request.headers)
+
+    return app
+
+
+def http(source, failures):
+    s3 = fakes.FakeS3(latency=0.05)
+    clients.registry.set(f"boto3:s3:{S3_REGION}", s3)
+    key = upload_to_s3(BytesIO(source), ILLUSTRATION_FILE_NAME, "image/bmp")["key"]
+    image_id = image_id_from_key(key)
+    store = RenditionStore()
+    client = TestClient(rendition_app(store))
+    url = f"/images/{image_id}"
+
+    response = client.get(url, params={"format": "rgb565"})
+    check(failures, response.status_code == 200 and response.headers["content-type"] == "image/x-rgb565"
+          and len(response.content) == 115200 and response.headers["x-image-width"] == "240",
+          f"?format=rgb565: {len(response.content)} bytes, loaded from S3 once ({store.stats()['source_loads']})")
+    etag = response.headers["etag"]
+
+    negotiated = {accept: client.get(url, headers={"Accept": accept}).headers.get("content-type")
+                  for accept in ("image/webp,image/*;q=0.8", "image/x-rgb565", "image/avif,image/jpeg;q=0.9",
+                                 "text/html,*/*;q=0.1")}
+    check(failures, list(negotiated.values()) == ["image/webp", "image/x-rgb565", "image/jpeg", "image/jpeg"],
+          f"Accept picks the format: {negotiated}")
+    check(failures, client.get(url, headers={"Accept": "image/avif"}).status_code == 406
+          and client.get(url, params={"format": "gif"}).status_code == 406, "unsupported formats get 406")
+
+    renders = store.stats()["renders"]
+    response = client.get(url, params={"format": "rgb565"}, headers={"If-None-Match": etag})
+    check(failures, response.status_code == 304 and not response.content and store.stats()["renders"] == renders,
+          "If-None-Match answers 304 without rendering")
+    response = client.get(url, params={"format": "jpeg"}, headers={"If-None-Match": etag})
+    check(failures, response.status_code == 200, "the ETag of one format does not match another")
+
+    full = client.get(url, params={"format": "rgb565"}).content
+    ranges = {
+        "bytes=0-4095": (206, full[:4096], "bytes 0-4095/115200"),
+        "bytes=100000-": (206, full[100000:], "bytes 100000-115199/115200"),
+        "bytes=-200": (206, full[-200:], "bytes 115000-115199/115200"),
+        "bytes=115100-999999": (206, full[115100:], "bytes 115100-115199/115200"),
+        "bytes=200000-": (416, b"", "bytes */115200"),
+        "bytes=0-1,5-9": (200, full, None),
+    }
+    for header, (status, body, content_range) in ranges.items():
+        response = client.get(url, params={"format": "rgb565"}, headers={"Range": header})
+        check(failures, response.status_code == status and response.content == body
+              and response.headers.get("content-range") == content_range,
+              f"Range {header}: {response.status_code} {response.headers.get('content-range')}")
+    response = client.get(url, params={"format": "rgb565"}, headers={"Range": "bytes=0-99", "If-Range": '"stale"'})
+    check(failures, response.status_code == 200 and response.content == full, "If-Range with another ETag sends the whole image")
+
+    check(failures, store.stats()["renders"] == 3, f"one render per format ({store.stats()['renders']} for 3 formats)")
+
+    async def concurrent():
+        cold = RenditionStore()
+        await asyncio.gather(*(cold.get(image_id, "webp", lambda: download_asset(key)) for _ in range(20)))
+        return cold.stats()
+
+    stats = asyncio.run(concurrent())
+    check(failures, stats["renders"] == 1 and stats["source_loads"] == 1,
+          f"20 concurrent cold requests: {stats['source_loads']} download, {stats['renders']} render")
+
+    check(failures, client.get("/images/" + "0" * 64).status_code == 404
+          and client.get("/images/../etc").status_code == 404, "unknown images get 404")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--link-kbps", type=float, default=2000, help="device download rate, kbit/s")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    source = _resize_to_bmp(illustration()).getvalue()
+    print(f"source: 240x240 BMP, {len(source)} bytes, {1000 * len(source) * 8 / (args.link_kbps * 1000):.0f}ms "
+          f"at {args.link_kbps:.0f} kbit/s")
+    failures = []
+    formats(args, source, failures)
+    print("/images endpoint:")
+    http(source, failures)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Conversation session store: prompt history size, memory cap and persistence.
+
+Run from the backend dir:  python -m benchmarks.bench_sessions [--questions 200]
+
+1. One long reading session goes through async_get_answer_and_docs, using
+   the fake OpenAI client and embedded Qdrant. After each answer the script
+   prints the history tokens the next prompt would carry, next to the tokens
+   of the full uncompacted history.
+2. Many sessions are written into a store with a small memory cap, to show
+   the cap holds and how fast appends are.
+3. A store backed by SQLite is reopened to show that sessions survive.
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+from benchmarks import fakes
+from src.utils import clients, index_qdrant
+from src.utils.chat_rag import async_get_answer_and_docs
+from src.utils.context_packer import count_tokens
+from src.utils.openai_utils import format_history
+from src.utils.session_store import SessionStore, session_store
+
+
+async def long_session(questions, answer_tokens):
+    clients.registry.set("async_openai", fakes.FakeAsyncOpenAI(
+        embed_latency=0, first_token_latency=0, token_latency=0, tokens=answer_tokens
+    ))
+    await index_qdrant.async_ensure_collection_exists(index_qdrant.collection_name)
+    session_id = "bench-reading-session"
+    full_history, peak = [], 0
+    for i in range(questions):
+        question = f"What does paragraph {i} of the chapter say about the main character?"
+        answer = []
+        async for event in async_get_answer_and_docs(question, session_id):
+            if event["event_type"] == "on_chat_model_stream":
+                answer.append(event["content"])
+        full_history += [{"role": "user", "content": question}, {"role": "assistant", "content": "".join(answer)}]
+        # Let the background compaction finish before the next question
+        await asyncio.gather(*list(session_store._tasks))
+        history_tokens = count_tokens(format_history(*session_store.history(session_id)))
+        peak = max(peak, history_tokens)
+        if (i + 1) in (1, 5, 10, 50, 100, questions):
+            print(f"  after {i + 1:4} questions: prompt history {history_tokens:5} tokens, "
+                  f"uncompacted {count_tokens(format_history('', full_history)):7} tokens")
+    print(f"  peak prompt history {peak} tokens; {session_store.stats()['compactions']} compactions")
+
+
+def memory_cap(sessions, max_bytes):
+    store = SessionStore(max_sessions=sessions, max_bytes=max_bytes)
+    answer = "An answer of moderate length about the reading. " * 10
+    started = time.perf_counter()
+    for i in range(sessions):
+        store.append(f"session-{i}", f"question {i}", answer)
+    elapsed = time.perf_counter() - started
+    stats = store.stats()
+    print(f"  {sessions} sessions into a {max_bytes / 2**20:.1f} MiB cap: {stats['sessions']} kept, "
+          f"{stats['evicted']} evicted, {stats['bytes'] / 2**20:.2f} MiB held, "
+          f"{1e6 * elapsed / sessions:.1f} us/append")
+
+
+def persistence(sessions):
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "sessions.sqlite3")
+        store = SessionStore(path=path)
+        started = time.perf_counter()
+        for i in range(sessions):
+            store.append(f"session-{i}", f"question {i}", f"answer {i}")
+        write = time.perf_counter() - started
+        reopened = SessionStore(path=path)
+        started = time.perf_counter()
+        restored = sum(1 for i in range(sessions) if reopened.history(f"session-{i}")[1])
+        read = time.perf_counter() - started
+        print(f"  {restored}/{sessions} sessions restored after reopening; "
+              f"{1e6 * write / sessions:.0f} us/write, {1e6 * read / sessions:.0f} us/load")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--answer-tokens", type=int, default=60)
+    parser.add_argument("--sessions", type=int, default=20000)
+    parser.add_argument("--max-bytes", type=int, default=2 * 1024 * 1024)
+    args = parser.parse_args()
+
+    print("Long reading session:")
+    asyncio.run(long_session(args.questions, args.answer_tokens))
+    print("Memory cap:")
+    memory_cap(args.sessions, args.max_bytes)
+    print("Persistence:")
+    persistence(min(args.sessions, 2000))
+
+
+if __name__ == "__main__":
+    main()
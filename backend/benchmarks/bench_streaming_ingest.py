@@ -0,0 +1,62 @@
+"""Peak Python memory of upload_file() on generated 10- and 1,000-page PDFs.
+
+Run from the backend dir:  python -m benchmarks.bench_streaming_ingest
+
+Exits non-zero if the large document's peak exceeds the small one's by more
+than --max-growth-mib, i.e. if ingestion memory is no longer flat in document
+size. The difference is the spool buffer (a 10-page PDF fits in a shorter
+read) and pypdf's cross-reference table, a few hundred bytes per page; pages
+are read PDF_READER_PAGES at a time, each batch with a fresh reader.
+"""
+import os
+import sys
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+
+# Small batches so even the 10-page document fills the embedding pipeline
+os.environ.setdefault("EMBEDDING_CACHE_MEMORY_ITEMS", "0")
+os.environ.setdefault("INGEST_BATCH_SIZE", "4")
+os.environ.setdefault("INGEST_CONCURRENCY", "2")
+
+from fastapi import UploadFile
+from benchmarks import fakes
+from src.utils import clients, index_qdrant
+
+
+async def ingest(path):
+    with open(path, "rb") as f:
+        return await index_qdrant.upload_file(UploadFile(file=f, filename="book.pdf"))
+
+
+def measure(pages):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "book.pdf")
+        fakes.write_pdf(path, pages)
+        tracemalloc.start()
+        result = asyncio.run(ingest(path))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    print(f"{pages:>5} pages: peak {peak / 2**20:6.1f} MiB  {result}")
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--small", type=int, default=10)
+    parser.add_argument("--large", type=int, default=1000)
+    parser.add_argument("--max-growth-mib", type=float, default=1.5)
+    args = parser.parse_args()
+
+    clients.registry.set("async_openai", fakes.FakeAsyncOpenAI(embed_latency=0.0))
+    clients.registry.set("async_qdrant", fakes.FakeAsyncQdrant())
+
+    small, large = measure(args.small), measure(args.large)
+    growth = (large - small) / 2**20
+    print(f"peak growth {args.small} -> {args.large} pages: {growth:.2f} MiB (limit {args.max_growth_mib})")
+    sys.exit(0 if growth <= args.max_growth_mib else 1)
+
+
+if __name__ == "__main__":
+    main()
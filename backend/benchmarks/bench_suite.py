@@ -0,0 +1,264 @@
+"""Ingestion and retrieval benchmark suite, written to JSON for comparing runs.
+
+Run from the backend dir:
+    python -m benchmarks.bench_suite [--output bench_results.json] [--baseline previous.json]
+
+Everything runs offline:
+- the corpus is generated from a fixed seed;
+- embeddings and completions come from the fakes in benchmarks/fakes.py (deterministic vectors and tokens);
+- vectors go to embedded Qdrant (":memory:") through the app's own client accessors.
+
+Sections:
+- chunking: chars/s and chunks/s of the splitter for each --chunk-sizes x --overlaps
+  (the row with index_qdrant's settings is marked "current");
+- ingest: chunks/s of ingest_documents (embed + upsert) for each chunk size;
+- search: async_qdrant_search latency percentiles for each --k;
+- e2e: async_get_answer_and_docs time-to-first-token and total time, answer cache off.
+
+With --baseline, each metric is compared to the earlier results file. Metrics
+that got worse by more than --tolerance are listed. With --fail-on-regression
+the script then exits non-zero.
+"""
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import subprocess
+from datetime import datetime, timezone
+import numpy as np
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from benchmarks import fakes
+from src.utils import clients, index_qdrant, chat_rag
+from src.utils.answer_cache import answer_cache
+from src.utils.ingest_pipeline import ingest_documents
+
+WORDS = ("reading", "buddy", "vector", "page", "camera", "image", "text", "audio", "speech", "model",
+         "chapter", "answer", "question", "context", "search", "index", "chunk", "token", "stream", "device")
+
+
+def make_corpus(documents, words_per_document, seed=0):
+    rng = random.Random(seed)
+    docs = []
+    for i in range(documents):
+        sentences, count = [], 0
+        while count < words_per_document:
+            length = rng.randint(6, 18)
+            sentences.append(" ".join(rng.choice(WORDS) for _ in range(length)).capitalize() + ".")
+            count += length
+            if rng.random() < 0.1:
+                sentences.append("\n\n")
+        docs.append(Document(page_content=" ".join(sentences), metadata={"source": f"bench-doc-{i}"}))
+    return docs
+
+
+def percentiles(samples_ms):
+    return {
+        "p50_ms": float(np.percentile(samples_ms, 50)),
+        "p95_ms": float(np.percentile(samples_ms, 95)),
+        "p99_ms": float(np.percentile(samples_ms, 99)),
+        "mean_ms": float(np.mean(samples_ms)),
+    }
+
+
+def splitter(chunk_size, overlap):
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=overlap, length_function=len)
+
+
+def bench_chunking(corpus, chunk_sizes, overlaps, repeats):
+    current = (index_qdrant.text_splitter._chunk_size, index_qdrant.text_splitter._chunk_overlap)
+    chars = sum(len(doc.page_content) for doc in corpus)
+    rows = []
+    for chunk_size in chunk_sizes:
+        for overlap in overlaps:
+            if overlap >= chunk_size:
+                continue
+            text_splitter = splitter(chunk_size, overlap)
+            timings = []
+            for _ in range(repeats):
+                started = time.perf_counter()
+                chunks = text_splitter.split_documents(corpus)
+                timings.append(time.perf_counter() - started)
+            seconds = min(timings)
+            rows.append({
+                "chunk_size": chunk_size,
+                "overlap": overlap,
+                "current": (chunk_size, overlap) == current,
+                "chunks": len(chunks),
+                "chars_per_second": chars / seconds,
+                "chunks_per_second": len(chunks) / seconds,
+            })
+    return rows
+
+
+async def bench_ingest(corpus, chunk_sizes, overlap, batch_size, concurrency):
+    rows = []
+    for chunk_size in chunk_sizes:
+        collection = f"bench_suite_{chunk_size}"
+        await index_qdrant.async_ensure_collection_exists(collection)
+        chunks = splitter(chunk_size, min(overlap, chunk_size - 1)).split_documents(corpus)
+        stats = await ingest_documents(index_qdrant.get_async_client(), collection, chunks, batch_size, concurrency)
+        rows.append({
+            "chunk_size": chunk_size,
+            "chunks": stats["chunks"],
+            "chunks_per_second": stats["chunks_per_second"],
+        })
+    return rows
+
+
+async def bench_search(queries, ks):
+    rows = []
+    for k in ks:
+        await index_qdrant.async_qdrant_search(queries[0], limit=k)  # warm the collection
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            await index_qdrant.async_qdrant_search(query, limit=k)
+            timings.append(1000 * (time.perf_counter() - started))
+        rows.append({"k": k, "queries": len(queries), **percentiles(timings)})
+    return rows
+
+
+async def bench_e2e(questions):
+    first_token, total = [], []
+    for question in questions:
+        started, first = time.perf_counter(), None
+        async for event in chat_rag.async_get_answer_and_docs(question):
+            if event["event_type"] == "on_chat_model_stream" and first is None:
+                first = 1000 * (time.perf_counter() - started)
+        first_token.append(first)
+        total.append(1000 * (time.perf_counter() - started))
+    return {
+        "questions": len(questions),
+        "ttft": percentiles(first_token),
+        "total": percentiles(total),
+    }
+
+
+# Flatten results into {"search[k=4].p95_ms": value, ...} for comparison
+def flatten(results):
+    flat = {}
+    for section, value in results.items():
+        rows = value if isinstance(value, list) else [value]
+        for row in rows:
+            labels = ",".join(f"{key}={row[key]}" for key in ("chunk_size", "overlap", "k") if key in row)
+            prefix = f"{section}[{labels}]" if labels else section
+            for key, metric in row.items():
+                if isinstance(metric, dict):
+                    flat.update({f"{prefix}.{key}.{inner}": v for inner, v in metric.items()})
+                elif key.endswith(("_ms", "_per_second")):
+                    flat[f"{prefix}.{key}"] = metric
+    return flat
+
+
+def compare(results, baseline, tolerance):
+    current, previous = flatten(results), flatten(baseline["results"])
+    regressions = []
+    for name, value in sorted(current.items()):
+        before = previous.get(name)
+        if not before:
+            continue
+        change = (value - before) / before
+        # Latencies should go down, throughputs up
+        worse = change if name.endswith("_ms") else -change
+        marker = "  REGRESSION" if worse > tolerance else ""
+        print(f"  {name:<48} {before:12.2f} -> {value:12.2f}  {change:+7.1%}{marker}")
+        if marker:
+            regressions.append(name)
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", default=None, help="earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="relative change counted as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--words-per-document", type=int, default=5000)
+    parser.add_argument("--chunk-sizes", default="200,500,1000,2000")
+    parser.add_argument("--overlaps", default="20,100")
+    parser.add_argument("--k", default="4,8,16")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="fake embedding latency (s)")
+    parser.add_argument("--first-token-latency", type=float, default=0.0, help="fake LLM latency (s)")
+    args = parser.parse_args()
+
+    chunk_sizes = [int(size) for size in args.chunk_sizes.split(",")]
+    overlaps = [int(overlap) for overlap in args.overlaps.split(",")]
+    ks = [int(k) for k in args.k.split(",")]
+
+    clients.registry.set("openai", fakes.FakeOpenAI(args.embed_latency))
+    clients.registry.set("async_openai", fakes.FakeAsyncOpenAI(
+        args.embed_latency, args.first_token_latency, token_latency=0.0
+    ))
+    # Every question must reach the model, not replay a cached answer
+    answer_cache.max_entries = 0
+
+    corpus = make_corpus(args.documents, args.words_per_document)
+    rng = random.Random(1)
+    queries = [" ".join(rng.choice(WORDS) for _ in range(8)) for _ in range(args.queries)]
+
+    async def retrieval():
+        ingest = await bench_ingest(corpus, chunk_sizes, overlaps[0], args.batch_size, args.concurrency)
+        # Searches and answers run against the collection built with index_qdrant's chunk size
+        index_qdrant.collection_name = f"bench_suite_{min(chunk_sizes, key=lambda size: abs(size - 1000))}"
+        search = await bench_search(queries, ks)
+        e2e = await bench_e2e(queries[:args.questions])
+        await clients.registry.aclose()
+        return ingest, search, e2e
+
+    results = {"chunking": bench_chunking(corpus, chunk_sizes, overlaps, args.repeats)}
+    results["ingest"], results["search"], results["e2e"] = asyncio.run(retrieval())
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for row in results["chunking"]:
+        print(f"chunking size={row['chunk_size']:<5} overlap={row['overlap']:<4} {row['chunks']:6} chunks "
+              f"{row['chars_per_second'] / 1e6:7.2f} Mchar/s{'  (current)' if row['current'] else ''}")
+    for row in results["ingest"]:
+        print(f"ingest   size={row['chunk_size']:<5} {row['chunks']:6} chunks {row['chunks_per_second']:9.1f} chunks/s")
+    for row in results["search"]:
+        print(f"search   k={row['k']:<3} p50 {row['p50_ms']:7.2f}ms p95 {row['p95_ms']:7.2f}ms p99 {row['p99_ms']:7.2f}ms")
+    e2e = results["e2e"]
+    print(f"e2e      ttft p50 {e2e['ttft']['p50_ms']:7.2f}ms p95 {e2e['ttft']['p95_ms']:7.2f}ms   "
+          f"total p50 {e2e['total']['p50_ms']:7.2f}ms")
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.baseline} ({baseline['meta'].get('git_commit')}):")
+        regressions = compare(results, baseline, args.tolerance)
+        print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Recall@k, search latency and memory for each Qdrant collection profile.
+
+Run from the backend dir:  python -m benchmarks.bench_vector_profiles [--points 5000] [--url http://localhost:6333]
+
+Points are synthetic clustered unit vectors (so nearest neighbours are
+meaningful) and recall is measured against exact cosine top-k from NumPy.
+
+Without --url this runs against embedded Qdrant (":memory:"). Embedded mode
+accepts every profile setting but always searches exactly, so its recall and
+latency are the same for each profile; the "model" column then estimates
+recall from quantization alone by replaying the quantized-candidates +
+rescoring search in NumPy. Point --url at a Qdrant server to measure HNSW and
+quantization for real. RAM/disk columns are estimates from the profile:
+float32 vectors, int8 or 1-bit codes, and ~2*m links per point for HNSW.
+"""
+import time
+import argparse
+import numpy as np
+from qdrant_client import QdrantClient, models
+from src.utils.collection_profiles import PROFILES
+
+
+def make_vectors(points, queries, dim, clusters, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=points + queries)
+    vectors = centers[labels] + 0.6 * rng.normal(size=(points + queries, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors[:points], vectors[points:]
+
+
+def exact_top_k(data, queries, k):
+    scores = queries @ data.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+# Replays Qdrant's quantized search: rank by the compressed vectors, optionally rescore the oversampled top
+def modelled_top_k(profile, data, queries, k):
+    if profile.quantization == "scalar":
+        lo, hi = np.quantile(data, [0.005, 0.995])
+        codes = np.clip(np.round((data - lo) / (hi - lo) * 255), 0, 255)
+        approx = queries @ (codes * (hi - lo) / 255 + lo).T
+    elif profile.quantization == "binary":
+        approx = np.sign(queries) @ np.sign(data).T
+    else:
+        return exact_top_k(data, queries, k)
+    if not profile.rescore:
+        return np.argsort(-approx, axis=1)[:, :k]
+    candidates = np.argsort(-approx, axis=1)[:, :int(k * max(profile.oversampling, 1.0))]
+    exact = np.einsum("qd,qcd->qc", queries, data[candidates])
+    return np.take_along_axis(candidates, np.argsort(-exact, axis=1)[:, :k], axis=1)
+
+
+def recall(found, truth):
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+
+def estimated_memory(profile, points, dim):
+    vectors = points * dim * 4
+    codes = {"scalar": points * dim, "binary": points * dim // 8}.get(profile.quantization, 0)
+    graph = points * profile.hnsw_m * 2 * 4
+    ram = graph + codes + (0 if profile.on_disk_vectors else vectors)
+    disk = vectors if profile.on_disk_vectors else 0
+    return ram, disk
+
+
+def wait_until_indexed(client, name, timeout=600):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if client.get_collection(name).status == models.CollectionStatus.GREEN:
+            return
+        time.sleep(0.5)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--url", default=None, help="Qdrant server URL (default: embedded :memory:)")
+    parser.add_argument("--profiles", default=",".join(PROFILES))
+    args = parser.parse_args()
+
+    data, queries = make_vectors(args.points, args.queries, args.dim, args.clusters)
+    truth = exact_top_k(data, queries, args.k)
+    client = QdrantClient(url=args.url) if args.url else QdrantClient(location=":memory:")
+    mode = args.url or "embedded :memory: (exact search)"
+    print(f"{args.points} points x {args.dim} dims, {args.queries} queries, k={args.k}, qdrant: {mode}")
+    print(f"{'profile':<18} {'recall':>7} {'model':>7} {'p50 ms':>8} {'p99 ms':>8} {'RAM MiB':>8} {'disk MiB':>9}")
+
+    for name in args.profiles.split(","):
+        profile = PROFILES[name]
+        collection = f"bench_profile_{name}"
+        if client.collection_exists(collection):
+            client.delete_collection(collection)
+        client.create_collection(collection, **profile.create_collection_kwargs(size=args.dim))
+        for start in range(0, args.points, 256):
+            batch = data[start:start + 256]
+            client.upsert(collection, points=models.Batch(
+                ids=list(range(start, start + len(batch))), vectors=batch.tolist()
+            ), wait=True)
+        if args.url:
+            wait_until_indexed(client, collection)
+
+        found, latencies = [], []
+        for query in queries:
+            started = time.perf_counter()
+            hits = client.search(collection, query_vector=query.tolist(), limit=args.k,
+                                 search_params=profile.search_params())
+            latencies.append(1000 * (time.perf_counter() - started))
+            found.append([hit.id for hit in hits])
+        modelled = recall(modelled_top_k(profile, data, queries, args.k), truth)
+        ram, disk = estimated_memory(profile, args.points, args.dim)
+        print(f"{name:<18} {recall(found, truth):7.3f} {modelled:7.3f} {np.percentile(latencies, 50):8.2f} "
+              f"{np.percentile(latencies, 99):8.2f} {ram / 2**20:8.1f} {disk / 2**20:9.1f}")
+        client.delete_collection(collection)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+import os
+from langchain_openai import OpenAIEmbeddings
+
+# Point the app modules at local stand-ins before they are imported
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("QDRANT_URL", ":memory:")
+os.environ.setdefault("EMBEDDING_CACHE_PATH", "")
+
+# The fakes themselves live with the tests; benchmarks use them through this module
+from tests.fakes import (  # noqa: E402,F401
+    EMBEDDING_DIM, PDF_LINE, FakeAsyncHttp, FakeAsyncOpenAI, FakeAsyncQdrant, FakeGemini, FakeOpenAI, FakePolly,
+    FakeProvider, FakeProviderError, FakeQdrant, FakeS3, Faults, fake_vector, write_pdf,
+)
+
+# QdrantVectorStore embeds a probe text at construction time, and ingestion goes
+# through the LangChain embedder, so route both to the deterministic vectors
+OpenAIEmbeddings.embed_documents = lambda self, texts: [fake_vector(t) for t in texts]
+OpenAIEmbeddings.embed_query = lambda self, text: fake_vector(text)
@@ -0,0 +1,141 @@
+"""Parity check: the local index backends against Qdrant on a shared fixture.
+
+Run from the backend dir:  python -m benchmarks.parity_local_index [--points 5000]
+
+The same clustered vectors (with payloads) are upserted into embedded Qdrant
+(":memory:") and into both local backends through the client calls the app
+makes. Some points are then deleted. The script compares top-k ids and
+payloads per query, scrolling by metadata.source, and the ingestion pipeline
+end to end (fake embeddings). The exact "numpy" backend must return the same
+top-k as Qdrant. The approximate "mmap" backend is reported as recall@k and
+must reach --min-recall. Exits non-zero on any mismatch.
+"""
+import sys
+import time
+import uuid
+import asyncio
+import argparse
+import tempfile
+import numpy as np
+from qdrant_client import QdrantClient, AsyncQdrantClient, models
+from langchain_core.documents import Document
+from benchmarks import fakes
+from benchmarks.bench_vector_profiles import make_vectors, recall
+from src.utils import clients
+from src.utils.collection_profiles import collection_profile
+from src.utils.local_index import LocalIndexClient, AsyncLocalIndexClient
+from src.utils.ingest_pipeline import ingest_documents, existing_chunk_ids
+
+COLLECTION = "parity"
+
+
+def load(client, data):
+    client.create_collection(COLLECTION, **collection_profile().create_collection_kwargs(size=data.shape[1]))
+    for start in range(0, len(data), 256):
+        client.upsert(COLLECTION, points=[
+            models.PointStruct(
+                id=str(uuid.UUID(int=i)),
+                vector=data[i].tolist(),
+                payload={"page_content": f"chunk {i}", "metadata": {"source": f"doc{i % 7}", "page": i}},
+            )
+            for i in range(start, min(start + 256, len(data)))
+        ], wait=True)
+    # Drop every 10th point, so deleted points must not come back from searches
+    client.delete(COLLECTION, points_selector=models.PointIdsList(
+        points=[str(uuid.UUID(int=i)) for i in range(0, len(data), 10)]
+    ), wait=True)
+
+
+def top_k(client, queries, k):
+    found, latencies = [], []
+    for query in queries:
+        started = time.perf_counter()
+        hits = client.search(COLLECTION, query_vector=query.tolist(), limit=k,
+                             search_params=collection_profile().search_params())
+        latencies.append(1000 * (time.perf_counter() - started))
+        found.append([(str(hit.id), hit.payload["page_content"]) for hit in hits])
+    return found, latencies
+
+
+def scrolled(client, source):
+    ids, offset = set(), None
+    source_filter = models.Filter(
+        must=[models.FieldCondition(key="metadata.source", match=models.MatchValue(value=source))]
+    )
+    while True:
+        points, offset = client.scroll(COLLECTION, scroll_filter=source_filter, limit=100, offset=offset,
+                                       with_payload=False, with_vectors=False)
+        ids.update(str(point.id) for point in points)
+        if offset is None:
+            return ids
+
+
+async def ingested(client):
+    collection = "parity_ingest"
+    await client.create_collection(collection, **collection_profile().create_collection_kwargs())
+    docs = [Document(page_content=f"ingest chunk {i}", metadata={"source": "ingest"}) for i in range(300)]
+    await ingest_documents(client, collection, docs, batch_size=64, concurrency=4)
+    hits = await client.search(collection, query_vector=fakes.fake_vector("ingest chunk 42"), limit=3)
+    return await existing_chunk_ids(client, collection, "ingest"), [str(hit.id) for hit in hits]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=50)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--min-recall", type=float, default=0.9)
+    args = parser.parse_args()
+
+    data, queries = make_vectors(args.points, args.queries, args.dim, args.clusters)
+    clients.registry.set("async_openai", fakes.FakeAsyncOpenAI(embed_latency=0))
+    failures = []
+
+    with tempfile.TemporaryDirectory() as workdir:
+        backends = {
+            "qdrant": (QdrantClient(location=":memory:"), AsyncQdrantClient(location=":memory:")),
+            "numpy": (LocalIndexClient(f"{workdir}/numpy"), None),
+            "mmap": (LocalIndexClient(f"{workdir}/mmap", approximate=True), None),
+        }
+        results = {}
+        for name, (client, async_client) in backends.items():
+            async_client = async_client or AsyncLocalIndexClient(client)
+            started = time.perf_counter()
+            load(client, data)
+            load_seconds = time.perf_counter() - started
+            found, latencies = top_k(client, queries, args.k)
+            results[name] = {
+                "found": found,
+                "scroll": [scrolled(client, f"doc{i}") for i in range(7)],
+                "ingest": asyncio.run(ingested(async_client)),
+            }
+            print(f"{name:<7} load {load_seconds:6.2f}s   search p50 {np.percentile(latencies, 50):7.2f}ms "
+                  f"p99 {np.percentile(latencies, 99):7.2f}ms")
+
+        reference = results["qdrant"]
+        for name in ("numpy", "mmap"):
+            result = results[name]
+            same = sum(f == r for f, r in zip(result["found"], reference["found"]))
+            hit_recall = recall([[i for i, _ in f] for f in result["found"]],
+                                [[i for i, _ in r] for r in reference["found"]])
+            print(f"{name:<7} identical top-{args.k} {same}/{len(queries)}   recall@{args.k} {hit_recall:.3f}   "
+                  f"scroll {'ok' if result['scroll'] == reference['scroll'] else 'MISMATCH'}   "
+                  f"ingest {'ok' if result['ingest'] == reference['ingest'] else 'MISMATCH'}")
+            if name == "numpy" and same != len(queries):
+                failures.append(f"numpy top-{args.k} differs from qdrant for {len(queries) - same} queries")
+            if name == "mmap" and hit_recall < args.min_recall:
+                failures.append(f"mmap recall@{args.k} {hit_recall:.3f} < {args.min_recall}")
+            if result["scroll"] != reference["scroll"]:
+                failures.append(f"{name} scroll by metadata.source differs from qdrant")
+            if result["ingest"] != reference["ingest"]:
+                failures.append(f"{name} ingestion differs from qdrant")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
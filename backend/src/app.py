@@ -1,13 +1,24 @@
+import os
 import json
+import base64
+import asyncio
 from modal import Image, App, asgi_app, Secret
 from pydantic import BaseModel
-from fastapi import FastAPI, WebSocket, UploadFile, File
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, WebSocket, UploadFile, File, Request, Query
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from src.utils.chat_rag import get_answer_and_docs, async_get_answer_and_docs, async_get_text
-from src.utils.index_qdrant import upload_webpage, upload_file
-from src.utils.upload_s3 import upload_to_s3, process_image, process_image_from_url
-from typing import List
+from src.utils.index_qdrant import upload_webpage, spool_upload, upload_spooled_file, warmup
+from src.utils.indexing_jobs import IndexingJobManager
+from src.utils.image_events import ImageRequestHub
+from src.utils.connection_manager import ConnectionManager
+from src.utils.clients import registry
+from src.utils.metrics import metrics, timed_stream
+from src.utils.session_store import session_store
+from src.utils.page_cache import page_cache
+from src.utils.question_mux import QuestionMultiplexer, cancel_on_disconnect
+from src.utils.upload_s3 import upload_to_s3, process_image, process_image_from_url, download_asset, illustration_key, routers
+from src.utils.renditions import rendition_store, rendition_response, not_modified_response, choose_format, valid_image_id, FORMATS
 from starlette.websockets import WebSocketDisconnect, WebSocketState
 
 app = App("readbuddy-backend")
@@ -19,8 +30,62 @@ app.image = Image.debian_slim().poetry_install_from_file("./pyproject.toml")
 
 def endpoint():
 
-    # List to store active WebSocket connections
-    active_websockets: List[WebSocket] = []
+    # Connected WebSocket clients, each with its own bounded send queue
+    connections = ConnectionManager()
+
+    # Indexing runs in a bounded background worker pool so it can't starve chat requests
+    indexing_jobs = IndexingJobManager()
+
+    # Image requests run in the background; their stage events are buffered for late subscribers
+    image_requests = ImageRequestHub()
+
+    # Gauges are read from the live objects when /metrics is scraped
+    metrics.gauge(
+        "readbuddy_websockets_active", "Open WebSocket connections per endpoint group.", ("endpoint",),
+        function=lambda: {
+            ("chat",): len(connections.clients),
+            ("job_events",): sum(len(job.subscribers) for job in indexing_jobs.jobs.values()),
+            ("image_events",): sum(len(request.subscribers) for request in image_requests.requests.values()),
+        },
+    )
+    metrics.gauge(
+        "readbuddy_queue_depth", "Items waiting in internal queues.", ("queue",),
+        function=lambda: {
+            ("websocket_send",): connections.stats()["queued"],
+            ("indexing",): indexing_jobs.stats()["queued"],
+        },
+    )
+    metrics.gauge(
+        "readbuddy_page_cache_entries", "Scanned pages whose results are cached for re-scans.",
+        function=lambda: page_cache.stats()["entries"],
+    )
+    metrics.gauge(
+        "readbuddy_provider_circuit_open", "1 while a provider's circuit breaker refuses calls (open or half-open).",
+        ("operation", "provider"),
+        function=lambda: {
+            (router.operation, provider.name): int(provider.breaker.state != "closed")
+            for router in routers for provider in router.providers
+        },
+    )
+    metrics.gauge(
+        "readbuddy_rendition_cache_bytes", "Illustration sources and renditions held in memory.",
+        function=lambda: rendition_store.stats()["bytes"],
+    )
+    metrics.gauge(
+        "readbuddy_chat_sessions", "Conversation sessions held in memory.",
+        function=lambda: session_store.stats()["sessions"],
+    )
+    metrics.gauge(
+        "readbuddy_chat_session_bytes", "Approximate size of the conversation sessions held in memory.",
+        function=lambda: session_store.stats()["bytes"],
+    )
+    metrics.gauge(
+        "readbuddy_tasks_running", "Background tasks currently running.", ("kind",),
+        function=lambda: {
+            ("indexing",): indexing_jobs.stats()["running"],
+            ("image_request",): sum(1 for request in image_requests.requests.values() if request.state == "running"),
+        },
+    )
 
     app = FastAPI(
         title="ReadBuddy API",
@@ -42,6 +107,20 @@ def endpoint():
         allow_methods=["*"],
     )
 
+    # Clients are created lazily; open them and check the collection once per container
+    @app.on_event("startup")
+    async def startup_warmup():
+        try:
+            await warmup()
+        except Exception as e:
+            # Requests still create the clients on demand, so a failed warmup isn't fatal
+            print(f"Warmup failed: {e}")
+
+    # Close the shared upstream connection pools when the container stops
+    @app.on_event("shutdown")
+    async def close_clients():
+        await registry.aclose()
+
     class Message(BaseModel):
         message: str
 
@@ -50,69 +129,64 @@ def endpoint():
 
 
     # WebSocket endpoint for start stop read: Keeps track of connected clients
+    # Clients may pass ?device=...&room=... so broadcasts can target them.
+    # Questions on one connection share a conversation; pass ?session=... to resume it after reconnecting.
+    # Plain-text questions are answered one at a time as before; clients that send JSON questions
+    # can have several in flight and cancel them by request id (see QuestionMultiplexer)
     @app.websocket('/async_read')
-    async def async_read(websocket: WebSocket):
+    async def async_read(websocket: WebSocket, device: str = None, room: str = None, session: str = None):
         await websocket.accept()
 
-        # Add the WebSocket to the list of active connections
-        active_websockets.append(websocket)
+        # Register the WebSocket with the connection manager
+        client = connections.connect(websocket, device, room)
+        session_id = session or client.id
+
+        # Each answer streams from its own task, so new questions and cancels are read meanwhile
+        questions = QuestionMultiplexer(
+            lambda question: timed_stream("async_read", async_get_answer_and_docs(question, session_id)),
+            lambda event: connections.send(client, event),
+        )
 
         try:
             while True:
-                # Receive a question from the client
-                question = await websocket.receive_text()
+                # Receive a question (or a cancel) from the client
+                await questions.handle(await websocket.receive_text())
 
-                # Stream answer and docs back to the client
-                async for event in async_get_answer_and_docs(question):
-                    if event["event_type"] == "done":
-                        continue
-                    else:
-                        await websocket.send_text(json.dumps(event))
-                
         except WebSocketDisconnect:
             print("WebSocket connection was closed by the client.")
         except Exception as e:
             print(f"WebSocket error: {e}")
         finally:
-            # Ensure WebSocket is removed and closed properly
-            if websocket in active_websockets:
-                active_websockets.remove(websocket)
-                
-            # Try to close the WebSocket if it hasn't already been closed
-            try:
-                await websocket.close()
-            except RuntimeError:
-                print("WebSocket was already closed.")
+            # Abort the answers still streaming, then unregister the client; its sender task closes the WebSocket
+            await questions.close()
+            await connections.disconnect(client, flush=False)
 
 
     # WebSocket endpoint for submit question: Keeps track of connected clients
+    # One question per connection; pass ?session=... to answer it within an ongoing conversation
     @app.websocket('/async_chat')
-    async def async_chat(websocket: WebSocket):
+    async def async_chat(websocket: WebSocket, device: str = None, room: str = None, session: str = None):
         await websocket.accept()
 
-        # Add the WebSocket to the list of active connections
-        active_websockets.append(websocket)
+        # Register the WebSocket with the connection manager
+        client = connections.connect(websocket, device, room)
 
         try:
             # Receive a question from the client
             question = await websocket.receive_text()
 
             # Stream answer and docs back to the client
-            async for event in async_get_answer_and_docs(question):
-                if event["event_type"] == "done":
-                    # Send the final message if the connection is still open
-                    try:
-                        await websocket.send_text(json.dumps({"final": True}))
-                    except Exception as send_error:
-                        print(f"Error sending final message: {send_error}")
-                    break
-                else:
-                    # Send messages as long as the connection is open
-                    try:
-                        await websocket.send_text(json.dumps(event))
-                    except Exception as send_error:
-                        print(f"Error sending event message: {send_error}")
+            async def stream_answer():
+                async for event in timed_stream("async_chat", async_get_answer_and_docs(question, session)):
+                    if event["event_type"] == "done":
+                        # Send the final message if the connection is still open
+                        await connections.send(client, {"final": True})
                         break
+                    else:
+                        await connections.send(client, event)
+
+            # A client that leaves mid-answer cancels the upstream calls instead of letting them run on
+            await cancel_on_disconnect(websocket, stream_answer())
 
         except WebSocketDisconnect:
             # Handle the client disconnecting
@@ -120,15 +194,14 @@ def endpoint():
         except Exception as e:
             print(f"WebSocket error: {e}")
         finally:
-            # Remove WebSocket from active connections if it's still there
-            if websocket in active_websockets:
-                active_websockets.remove(websocket)
+            # Deliver whatever is still queued, then close the WebSocket
+            await connections.disconnect(client)
 
-            # Try to close the WebSocket, but handle if it was already closed
-            try:
-                await websocket.close()
-            except Exception as close_error:
-                print(f"Error closing WebSocket: {close_error}")
+
+    # Prometheus scrape endpoint: upstream call spans, stream timings, websocket and queue gauges
+    @app.get("/metrics", description="Prometheus metrics")
+    async def get_metrics():
+        return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 
     # POST endpoint for chat, synchronous version
@@ -143,112 +216,186 @@ def endpoint():
         return JSONResponse(content=response_content, status_code=200)
 
 
-    # POST endpoint for uploading a webpage
+    # POST endpoint for uploading a webpage: queues an indexing job and returns its id
     @app.post("/indexingURL", description="Index a webpage through this endpoint")
-    def indexing_URL(url: Message):
+    async def indexing_URL(url: Message):
         try:
-            response = upload_webpage(url.message)
-            return JSONResponse(content={"response": response}, status_code=200)
-        except Exception as e:
-            return JSONResponse(content={"error": str(e)}, status_code=400)
+            job = indexing_jobs.submit(
+                "url", url.message, lambda on_progress: upload_webpage(url.message, on_progress)
+            )
+        except asyncio.QueueFull:
+            return JSONResponse(content={"error": "Indexing queue is full, please retry later."}, status_code=429)
+        return JSONResponse(
+            content={"job_id": job.id, "response": f"Indexing job {job.id} queued."}, status_code=202
+        )
 
 
-    # POST endpoint for uploading a document (PDF or TXT)
+    # POST endpoint for uploading a document (PDF or TXT): queues an indexing job and returns its id
     @app.post("/indexingDoc", description="Index a pdf or txt file through this endpoint")
-    def indexing_Doc(file: UploadFile = File(...)):
+    async def indexing_Doc(file: UploadFile = File(...)):
         try:
-            response = upload_file(file)
-            return JSONResponse(content={"response": response}, status_code=200)
+            # The UploadFile is closed once this request returns, so spool it before queueing
+            path = await asyncio.to_thread(spool_upload, file)
         except Exception as e:
             return JSONResponse(content={"error": str(e)}, status_code=400)
+        try:
+            job = indexing_jobs.submit(
+                "doc", file.filename, lambda on_progress: upload_spooled_file(path, file.filename, on_progress)
+            )
+        except asyncio.QueueFull:
+            os.remove(path)
+            return JSONResponse(content={"error": "Indexing queue is full, please retry later."}, status_code=429)
+        return JSONResponse(
+            content={"job_id": job.id, "response": f"Indexing job {job.id} queued."}, status_code=202
+        )
+
+
+    # GET endpoint for indexing job state, chunk counts and throughput
+    @app.get("/jobs/{job_id}", description="Get the status of an indexing job")
+    async def get_job(job_id: str):
+        job = indexing_jobs.get(job_id)
+        if job is None:
+            return JSONResponse(content={"error": f"Job {job_id} not found"}, status_code=404)
+        return JSONResponse(content=job.to_dict(), status_code=200)
+
+
+    # WebSocket endpoint streaming progress events for an indexing job until it finishes
+    @app.websocket('/jobs/{job_id}/events')
+    async def job_events(websocket: WebSocket, job_id: str):
+        await websocket.accept()
+        try:
+            if indexing_jobs.get(job_id) is None:
+                await websocket.send_text(json.dumps({"event_type": "error", "content": f"Job {job_id} not found"}))
+            async for event in indexing_jobs.subscribe(job_id):
+                await websocket.send_text(json.dumps(event))
+        except WebSocketDisconnect:
+            print("Job events WebSocket closed by the client.")
+        finally:
+            try:
+                await websocket.close()
+            except RuntimeError:
+                pass
 
 
+    # POST endpoint for uploading an image to S3; pass device/room to target specific clients
     @app.post("/uploadS3", description="Upload image to S3 bucket")
-    async def upload_image_to_s3(file: UploadFile = File(...)):
+    async def upload_image_to_s3(file: UploadFile = File(...), device: str = None, room: str = None):
         file_name = file.filename
-        result = upload_to_s3(file.file, file_name)  # Pass content instead of file object
-        
-        # Broadcast message to all active WebSocket clients
-        disconnected_clients = []
-        for websocket in active_websockets:
-            try:
-                # Pass the file content (bytes) to async_get_text
-                async for event in async_get_text():
-                    if event["event_type"] == "done":
-                        continue
-                    else:
-                        await websocket.send_text(json.dumps(event))
+        # Stored under the hash of its content; the upload runs in a worker thread
+        result = await asyncio.to_thread(upload_to_s3, file.file, file_name, file.content_type or "application/octet-stream")
 
-            except Exception as e:
-                print(f"Failed to send to WebSocket: {e}")
-                disconnected_clients.append(websocket)
+        # Compute the events once and fan them out to the targeted clients
+        if connections.has_clients(device, room):
+            async for event in async_get_text():
+                if event["event_type"] == "done":
+                    continue
+                connections.broadcast(event, device, room)
 
-        # Remove disconnected clients from the list
-        for websocket in disconnected_clients:
-            active_websockets.remove(websocket)
-        
         return result
 
 
-    @app.post("/process_image", description="Process image using GPT-4 API")
-    async def process_image_endpoint(file: UploadFile = File(...)):
-        try:
-            # Call the process_image function from image_processing.py
-            result = await process_image(file)
+    # Run an image pipeline for a request, publishing each stage's result as it arrives
+    def start_image_request(process, *args, device=None, room=None):
+        async def run(request):
+            async def emit(event_type, content):
+                event = {"event_type": event_type, "request_id": request.id, "content": content}
+                image_requests.publish(request, event)
+                connections.broadcast(event, device, room)
 
-            # Broadcast message to all active WebSocket clients
-            disconnected_clients = []
-            for websocket in active_websockets:
-                try:
-                    event = {
-                        "event_type": "on_image_process",
-                        "content": result
-                    }
-                    await websocket.send_text(json.dumps(event))
+            result = await process(*args, emit=emit)
+            request.result = result
+            await emit("on_image_process", result)
 
-                except Exception as e:
-                    print(f"Failed to send to WebSocket: {e}")
-                    disconnected_clients.append(websocket)
+        return image_requests.start(run)
 
-            # Remove disconnected clients from the list
-            for websocket in disconnected_clients:
-                active_websockets.remove(websocket)
 
-            return {"message": "Image processed successfully", "response": result}
+    # POST endpoint for image processing: returns a request id right away, results stream as events
+    @app.post("/process_image", description="Process image using GPT-4 API")
+    async def process_image_endpoint(file: UploadFile = File(...), device: str = None, room: str = None):
+        try:
+            # The UploadFile is closed once this request returns, so read it first
+            image_bytes = await file.read()
+            request = start_image_request(process_image, image_bytes, device=device, room=room)
+            return {"message": "Image accepted", "request_id": request.id}
 
         except Exception as e:
             print(f"Error processing image: {e}")
             return {"error": str(e)}
 
 
+    # POST endpoint for image processing from a URL: returns a request id right away
     @app.post("/process_image_url", description="Process image from URL using GPT-4 API")
-    async def process_image_url_endpoint(image_url: ImageUrl):
+    async def process_image_url_endpoint(image_url: ImageUrl, device: str = None, room: str = None):
         try:
-            # Call the process_image_from_url function
-            result = await process_image_from_url(image_url.url)
-
-            # Broadcast message to all active WebSocket clients
-            disconnected_clients = []
-            for websocket in active_websockets:
-                try:
-                    event = {
-                        "event_type": "on_image_process",
-                        "content": result
-                    }
-                    await websocket.send_text(json.dumps(event))
-
-                except Exception as e:
-                    print(f"Failed to send to WebSocket: {e}")
-                    disconnected_clients.append(websocket)
-
-            # Remove disconnected clients from the list
-            for websocket in disconnected_clients:
-                active_websockets.remove(websocket)
-
-            return {"message": "Image processed successfully", "response": result}
+            request = start_image_request(process_image_from_url, image_url.url, device=device, room=room)
+            return {"message": "Image accepted", "request_id": request.id}
 
         except Exception as e:
             print(f"Error processing image: {e}")
             return {"error": str(e)}
 
+
+    # GET endpoint for an image request's state and the results produced so far
+    @app.get("/process_image/{request_id}", description="Get the partial result of an image request")
+    async def get_image_request(request_id: str):
+        request = image_requests.get(request_id)
+        if request is None:
+            return JSONResponse(content={"error": f"Request {request_id} not found"}, status_code=404)
+        return JSONResponse(content=request.to_dict(), status_code=200)
+
+
+    # GET endpoint streaming an image request's narration as one chunked MP3 while it is generated.
+    # Sentences are sent in order as Polly finishes them; a page answered from the page cache has
+    # no chunks, its on_image_audio URL holds the whole narration
+    @app.get("/process_image/{request_id}/audio", description="Stream the narration of an image request as MP3")
+    async def image_request_audio(request_id: str):
+        if image_requests.get(request_id) is None:
+            return JSONResponse(content={"error": f"Request {request_id} not found"}, status_code=404)
+
+        async def segments():
+            async for event in image_requests.subscribe(request_id):
+                if event["event_type"] == "on_image_audio_chunk":
+                    yield base64.b64decode(event["content"]["audio"])
+
+        return StreamingResponse(segments(), media_type="audio/mpeg")
+
+
+    # GET endpoint for a generated illustration in the format the client can use best: raw RGB565
+    # for the reader's 240x240 display, JPEG or WebP for the PWA, or the original BMP. The format comes
+    # from ?format= or the Accept header; image_id is the content hash from the image URL (or image_id
+    # in the process_image result). Supports If-None-Match and byte ranges
+    @app.get("/images/{image_id}", description="Get a generated illustration as RGB565, JPEG, WebP or BMP")
+    async def get_image_rendition(image_id: str, http_request: Request, image_format: str = Query(None, alias="format")):
+        image_format = choose_format(image_format, http_request.headers.get("accept"))
+        if image_format is None:
+            return JSONResponse(content={"error": f"Supported formats: {', '.join(FORMATS)}"}, status_code=406)
+        if not valid_image_id(image_id):
+            return JSONResponse(content={"error": f"Image {image_id} not found"}, status_code=404)
+        not_modified = not_modified_response(image_id, image_format, http_request.headers)
+        if not_modified is not None:
+            return not_modified
+        rendition = await rendition_store.get(image_id, image_format,
+                                              lambda: download_asset(illustration_key(image_id)))
+        if rendition is None:
+            return JSONResponse(content={"error": f"Image {image_id} not found"}, status_code=404)
+        return rendition_response(rendition, http_request.headers)
+
+
+    # WebSocket endpoint streaming an image request's events, replaying those already sent
+    @app.websocket('/process_image/{request_id}/events')
+    async def image_request_events(websocket: WebSocket, request_id: str):
+        await websocket.accept()
+        try:
+            if image_requests.get(request_id) is None:
+                await websocket.send_text(json.dumps({"event_type": "error", "content": f"Request {request_id} not found"}))
+            async for event in image_requests.subscribe(request_id):
+                await websocket.send_text(json.dumps(event))
+        except WebSocketDisconnect:
+            print("Image events WebSocket closed by the client.")
+        finally:
+            try:
+                await websocket.close()
+            except RuntimeError:
+                pass
+
     return app
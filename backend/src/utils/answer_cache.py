@@ -0,0 +1,117 @@
+import os
+import time
+import uuid
+from array import array
+from collections import OrderedDict, defaultdict
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()  # This will load the .env file and make the variables available to os.getenv
+
+
+def _unit(vector):
+    norm = sum(v * v for v in vector) ** 0.5 or 1.0
+    return array("f", (v / norm for v in vector))
+
+
+def _cosine(a, b):
+    return sum(x * y for x, y in zip(a, b))
+
+
+class AnswerCache:
+    """Cache of streamed RAG answers for near-duplicate questions.
+
+    Entries are scoped to the exact set of retrieved document ids and to an
+    optional ``scope`` (the previous question, for a follow-up), and a question
+    hits when its embedding is within ``threshold`` cosine similarity of a cached
+    question in that scope. Re-indexing a document invalidates every answer built on it.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 1000, ttl_seconds: float = 86400):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._by_doc_set = defaultdict(set)
+        self._by_doc = defaultdict(set)
+        self._counters = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95")),
+            max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "1000")),
+            ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400")),
+        )
+
+    def lookup(self, question_vector, doc_ids, scope: str = None):
+        """Return the cached ``{"content", "chunks"}`` for a similar question over the same docs."""
+        if self.max_entries <= 0:
+            return None
+        question_vector = _unit(question_vector)
+        now = time.time()
+        best, best_score = None, self.threshold
+        for entry_id in list(self._by_doc_set.get((frozenset(doc_ids), scope), ())):
+            entry = self._entries[entry_id]
+            if now - entry["created_at"] > self.ttl_seconds:
+                self._remove(entry_id)
+                continue
+            score = _cosine(question_vector, entry["vector"])
+            if score >= best_score:
+                best, best_score = entry_id, score
+        if best is None:
+            self._counters["misses"] += 1
+            return None
+        self._counters["hits"] += 1
+        self._entries.move_to_end(best)
+        return self._entries[best]
+
+    def store(self, question_vector, doc_ids, content, chunks, scope: str = None):
+        if self.max_entries <= 0:
+            return
+        entry_id = uuid.uuid4().hex
+        doc_ids = frozenset(doc_ids)
+        self._entries[entry_id] = {
+            "vector": _unit(question_vector),
+            "doc_ids": doc_ids,
+            "group": (doc_ids, scope),
+            "content": content,
+            "chunks": list(chunks),
+            "created_at": time.time(),
+        }
+        self._by_doc_set[(doc_ids, scope)].add(entry_id)
+        for doc_id in doc_ids:
+            self._by_doc[doc_id].add(entry_id)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate_documents(self, doc_ids):
+        """Drop every cached answer that was built from any of ``doc_ids``."""
+        for doc_id in doc_ids:
+            for entry_id in list(self._by_doc.get(str(doc_id), ())):
+                self._remove(entry_id)
+                self._counters["invalidations"] += 1
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        group = entry["group"]
+        self._by_doc_set[group].discard(entry_id)
+        if not self._by_doc_set[group]:
+            del self._by_doc_set[group]
+        for doc_id in entry["doc_ids"]:
+            self._by_doc[doc_id].discard(entry_id)
+            if not self._by_doc[doc_id]:
+                del self._by_doc[doc_id]
+
+    def stats(self):
+        lookups = self._counters["hits"] + self._counters["misses"]
+        return {
+            **self._counters,
+            "entries": len(self._entries),
+            "hit_rate": self._counters["hits"] / lookups if lookups else 0.0,
+        }
+
+
+answer_cache = AnswerCache.from_env()
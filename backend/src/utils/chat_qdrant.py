@@ -9,115 +9,30 @@ from langchain_community.document_loaders import WebBaseLoader
 from langchain_core.chat_history import BaseChatMessageHistory
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 # from langchain_core.output_parsers import StrOutputParser
+from langchain_core.messages import HumanMessage
 from langchain_core.runnables import RunnableWithMessageHistory # , RunnablePassthrough, RunnableParallel
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 from langchain_qdrant import QdrantVectorStore  # Updated from Qdrant
-from qdrant_client import QdrantClient, models
+from qdrant_client import QdrantClient
+from src.utils.collection_profiles import collection_profile
 
 # Load environment variables from .env file
 load_dotenv()  # This will load the .env file and make the variables available to os.getenv
 
 os.environ["USER_AGENT"] = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36"
-os.environ["LANGCHAIN_API_KEY"] = os.getenv("LANGCHAIN_API_KEY")
-os.environ["LANGCHAIN_TRACING_V2"] = "true"
-os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
-
-llm = ChatOpenAI(model="gpt-4o", temperature=0)
-
-# Load, chunk and index the contents of the blog.
-loader = WebBaseLoader(
-    web_paths=("https://lilianweng.github.io/posts/2023-06-23-agent/",),
-    bs_kwargs=dict(
-        parse_only=bs4.SoupStrainer(
-            class_=("post-content", "post-title", "post-header")
-        )
-    ),
-)
-
-docs = loader.load()
-# print("doc size: ", len(docs[0].page_content))
-# print("page 1 content: ", docs[0].page_content[:500])
 
 qdrant_api_key = os.getenv("QDRANT_API_KEY")
 qdrant_url = os.getenv("QDRANT_URL")
 collection_name = "NewChats"
 
-client = QdrantClient(
-    url=qdrant_url,
-    api_key=qdrant_api_key
-)
-
-
-def create_collection(collection_name):
-    client.create_collection(
-        collection_name=collection_name,
-        vectors_config=models.VectorParams(size=1536, distance=models.Distance.COSINE)
-    )
-    print(f"Collection {collection_name} created successfully")
-
-
-if not client.collection_exists(collection_name=collection_name):
-    create_collection(collection_name)
-
-vectorstore = QdrantVectorStore(
-    client=client,
-    collection_name=collection_name,
-    embedding=OpenAIEmbeddings(
-        api_key=os.getenv("OPENAI_API_KEY")
-    )
-)
-
 text_splitter = RecursiveCharacterTextSplitter(
     chunk_size=500, 
     chunk_overlap=50, 
     length_function=len
 )
 
-splits = text_splitter.split_documents(docs)
-vectorstore.add_documents(splits)
-
-# Retrieve and generate using the relevant snippets of the blog.
-retriever = vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": 6})
-# retrieved_docs = retriever.invoke("What are the approaches to Task Decomposition?")
-# print("len(retrieved_docs): ",len(retrieved_docs))
-# print("retrieved doc 1 content: ", retrieved_docs[0].page_content)
-
-# prompt = hub.pull("rlm/rag-prompt")
-#
-# def format_docs(docs):
-#     return "\n\n".join(doc.page_content for doc in docs)
-#
-# rag_chain_from_docs = (
-#     RunnablePassthrough.assign(context=(lambda x: format_docs(x["context"])))
-#     # {"context": retriever | format_docs, "question": RunnablePassthrough()}
-#     | prompt
-#     | llm
-#     | StrOutputParser()
-# )
-#
-# rag_chain_with_source = RunnableParallel(
-#     {"context": retriever, "question": RunnablePassthrough()}
-# ).assign(answer=rag_chain_from_docs)
-#         
-# print(rag_chain_with_source.invoke("What is Task Decomposition"))
-# 
-# output = {}
-# curr_key = None
-# for chunk in rag_chain_with_source.stream("What is Task Decomposition"):
-#     for key in chunk:
-#         if key not in output:
-#             output[key] = chunk[key]
-#         else:
-#             output[key] += chunk[key]
-#         if key != curr_key:
-#             print(f"\n\n{key}: {chunk[key]}", end="", flush=True)
-#         else:
-#             print(chunk[key], end="", flush=True)
-#         curr_key = key
-# print(output)
-
 ### Contextualize question ###
 contextualize_q_system_prompt = """Given a chat history and the latest user question \
 which might reference context in the chat history, formulate a standalone question \
@@ -131,10 +46,6 @@ contextualize_q_prompt = ChatPromptTemplate.from_messages(
     ]
 )
 
-history_aware_retriever = create_history_aware_retriever(
-    llm, retriever, contextualize_q_prompt
-)
-
 ### Answer question ###
 qa_system_prompt = """You are an assistant for question-answering tasks. \
 Use the following pieces of retrieved context to answer the question. \
@@ -149,9 +60,6 @@ qa_prompt = ChatPromptTemplate.from_messages(
         ("human", "{input}"),
     ]
 )
-question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
-
-rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
 
 ### Statefully manage chat history ###
 store = {}
@@ -163,26 +71,125 @@ def get_session_history(session_id: str) -> BaseChatMessageHistory:
     return store[session_id]
 
 
-conversational_rag_chain = RunnableWithMessageHistory(
-    rag_chain,
-    get_session_history,
-    input_messages_key="input",
-    history_messages_key="chat_history",
-    output_messages_key="answer",
-)
+def create_collection(client, collection_name):
+    client.create_collection(
+        collection_name=collection_name,
+        **collection_profile().create_collection_kwargs()
+    )
+    print(f"Collection {collection_name} created successfully")
 
-from langchain_core.messages import HumanMessage
 
-chat_history = []
+# Index the blog and run two example RAG queries; only runs when executed as a script
+def main():
+    os.environ["LANGCHAIN_API_KEY"] = os.getenv("LANGCHAIN_API_KEY")
+    os.environ["LANGCHAIN_TRACING_V2"] = "true"
+    os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
+
+    llm = ChatOpenAI(model="gpt-4o", temperature=0)
+
+    # Load, chunk and index the contents of the blog.
+    loader = WebBaseLoader(
+        web_paths=("https://lilianweng.github.io/posts/2023-06-23-agent/",),
+        bs_kwargs=dict(
+            parse_only=bs4.SoupStrainer(
+                class_=("post-content", "post-title", "post-header")
+            )
+        ),
+    )
+
+    docs = loader.load()
+    # print("doc size: ", len(docs[0].page_content))
+    # print("page 1 content: ", docs[0].page_content[:500])
+
+    client = QdrantClient(
+        url=qdrant_url,
+        api_key=qdrant_api_key
+    )
+
+    if not client.collection_exists(collection_name=collection_name):
+        create_collection(client, collection_name)
+
+    vectorstore = QdrantVectorStore(
+        client=client,
+        collection_name=collection_name,
+        embedding=OpenAIEmbeddings(
+            api_key=os.getenv("OPENAI_API_KEY")
+        )
+    )
+
+    splits = text_splitter.split_documents(docs)
+    vectorstore.add_documents(splits)
+
+    # Retrieve and generate using the relevant snippets of the blog.
+    retriever = vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": 6})
+    # retrieved_docs = retriever.invoke("What are the approaches to Task Decomposition?")
+    # print("len(retrieved_docs): ",len(retrieved_docs))
+    # print("retrieved doc 1 content: ", retrieved_docs[0].page_content)
+
+    # prompt = hub.pull("rlm/rag-prompt")
+    #
+    # def format_docs(docs):
+    #     return "\n\n".join(doc.page_content for doc in docs)
+    #
+    # rag_chain_from_docs = (
+    #     RunnablePassthrough.assign(context=(lambda x: format_docs(x["context"])))
+    #     # {"context": retriever | format_docs, "question": RunnablePassthrough()}
+    #     | prompt
+    #     | llm
+    #     | StrOutputParser()
+    # )
+    #
+    # rag_chain_with_source = RunnableParallel(
+    #     {"context": retriever, "question": RunnablePassthrough()}
+    # ).assign(answer=rag_chain_from_docs)
+    #         
+    # print(rag_chain_with_source.invoke("What is Task Decomposition"))
+    # 
+    # output = {}
+    # curr_key = None
+    # for chunk in rag_chain_with_source.stream("What is Task Decomposition"):
+    #     for key in chunk:
+    #         if key not in output:
+    #             output[key] = chunk[key]
+    #         else:
+    #             output[key] += chunk[key]
+    #         if key != curr_key:
+    #             print(f"\n\n{key}: {chunk[key]}", end="", flush=True)
+    #         else:
+    #             print(chunk[key], end="", flush=True)
+    #         curr_key = key
+    # print(output)
+
+    history_aware_retriever = create_history_aware_retriever(
+        llm, retriever, contextualize_q_prompt
+    )
+
+    question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
+
+    rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
+
+    conversational_rag_chain = RunnableWithMessageHistory(
+        rag_chain,
+        get_session_history,
+        input_messages_key="input",
+        history_messages_key="chat_history",
+        output_messages_key="answer",
+    )
+
+    chat_history = []
+
+    question = "What is Task Decomposition?"
+    ai_msg_1 = rag_chain.invoke({"input": question, "chat_history": chat_history})
+    chat_history.extend([HumanMessage(content=question), ai_msg_1["answer"]])
+
+    second_question = "What are common ways of doing it?"
+    ai_msg_2 = rag_chain.invoke({"input": second_question, "chat_history": chat_history})
 
-question = "What is Task Decomposition?"
-ai_msg_1 = rag_chain.invoke({"input": question, "chat_history": chat_history})
-chat_history.extend([HumanMessage(content=question), ai_msg_1["answer"]])
+    print(ai_msg_2["answer"])
+    for document in ai_msg_2["context"]:
+        print(document)
+        print()
 
-second_question = "What are common ways of doing it?"
-ai_msg_2 = rag_chain.invoke({"input": second_question, "chat_history": chat_history})
 
-print(ai_msg_2["answer"])
-for document in ai_msg_2["context"]:
-    print(document)
-    print()
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,52 @@
-from io import BytesIO
 import os
-import base64
-import requests
+import re
+import asyncio
 from langchain_core.prompts.chat import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough, RunnableParallel
+from langchain_core.runnables import RunnablePassthrough, RunnableParallel, RunnableLambda
+from langchain_core.documents import Document
 from langchain_openai import ChatOpenAI
 from fastapi import UploadFile
 from operator import itemgetter
 from dotenv import load_dotenv
-from openai import OpenAI
-from .index_qdrant import vector_store, qdrant_search
-from .openai_utils import stream_completion
+from .index_qdrant import get_vector_store, async_qdrant_search, qdrant_search, uses_local_index
+from .openai_utils import stream_completion, async_get_embedding, summarize_history
+from .collection_profiles import collection_profile
+from .clients import async_openai_client, http_client, async_http_client
+from .answer_cache import answer_cache
+from .session_store import session_store
+from .metrics import span
+from .image_prep import prepare_image
 
 # Load environment variables from .env file
 load_dotenv()  # This will load the .env file and make the variables available to os.getenv
 
 openai_api_key=os.getenv("OPENAI_API_KEY")
 
-model = ChatOpenAI(
-    model_name="gpt-4o",
-    openai_api_key=openai_api_key,
-    temperature=0,
-)
+# In a session, a question is retrieved together with the previous one only when it reads like a
+# follow-up: at most FOLLOW_UP_MAX_WORDS words, led by a pronoun, or (on its own) no document
+# scoring FOLLOW_UP_MIN_SCORE
+FOLLOW_UP_MAX_WORDS = int(os.getenv("FOLLOW_UP_MAX_WORDS", "5"))
+FOLLOW_UP_MIN_SCORE = float(os.getenv("FOLLOW_UP_MIN_SCORE", "0.8"))
+_follow_up_leads = {"it", "its", "this", "that", "these", "those", "they", "them", "their", "he", "him", "his",
+                    "she", "her", "there", "and", "but", "so", "also"}
+_word = re.compile(r"[\w']+")
+
+# The chat model is created on first use so importing this module stays cheap
+model = None
+
+
+def get_model():
+    global model
+    if model is None:
+        model = ChatOpenAI(
+            model_name="gpt-4o",
+            openai_api_key=openai_api_key,
+            temperature=0,
+            http_client=http_client(),
+            http_async_client=async_http_client(),
+        )
+    return model
+
 
 prompt_template = """
 Answer the question based on the context, in a concise manner, in markdown and using bullet points where applicable.
@@ -33,34 +58,34 @@ Answer:
 
 prompt = ChatPromptTemplate.from_template(prompt_template)
 
-retriever = vector_store.as_retriever()
-
 
 # Function to fetch the image from the URL and encode it to base64
-def encode_image_to_base64(image_url: str):
+async def encode_image_to_base64(image_url: str):
     # Fetch the image from the URL
-    response = requests.get(image_url)
+    with span("http", "image_download"):
+        response = await async_http_client().get(image_url)
     if response.status_code != 200:
         raise Exception(f"Failed to fetch image from URL: {image_url}")
 
-    # Read the image and convert it to base64
-    image_data = BytesIO(response.content)
-    base64_image = base64.b64encode(image_data.getvalue()).decode('utf-8')
-    
-    # Convert to a data URL format
-    base64_img_str = f"data:image/png;base64,{base64_image}"
-    
-    return base64_img_str
+    # Downscale and re-encode the image (in a worker thread), then convert it to a data URL labelled with the real format
+    return (await prepare_image(response.content, "openai_vision_json")).to_data_url()
 
 
 def create_chain():
+    if uses_local_index():
+        # QdrantVectorStore needs a real Qdrant client; search the local index directly instead
+        retriever = RunnableLambda(lambda question: [Document(**doc.payload) for doc in qdrant_search(question)])
+    else:
+        retriever = get_vector_store().as_retriever(
+            search_kwargs={"search_params": collection_profile().search_params()}
+        )
     chain = (
         {
             "context": retriever.with_config(top_k=4),
             "question": RunnablePassthrough(),
         }
         | RunnableParallel({
-            "response": prompt | model,
+            "response": prompt | get_model(),
             "context": itemgetter("context"),
             })
     )
@@ -69,7 +94,9 @@ def create_chain():
 
 def get_answer_and_docs(question: str):
     chain = create_chain()
-    response = chain.invoke(question)
+    # Retrieval and the gpt-4o call run inside the LangChain chain, so they share one span
+    with span("openai", "rag_chain"):
+        response = chain.invoke(question)
     answer = response["response"].content
     context = response["context"]
     return {
@@ -98,20 +125,80 @@ def get_answer_and_docs(question: str):
 #     }
 
 
-async def async_get_answer_and_docs(question: str):
-    docs = qdrant_search(query=question)
+def _is_follow_up(question: str) -> bool:
+    words = _word.findall(question.lower())
+    return len(words) <= FOLLOW_UP_MAX_WORDS or words[0] in _follow_up_leads
+
+
+# With ``session_id`` the answer sees the session's history (running summary plus recent
+# messages) and the exchange is recorded; older messages are summarized in the background
+async def async_get_answer_and_docs(question: str, session_id: str = None):
+    summary, messages = await session_store.async_history(session_id) if session_id else ("", [])
+    has_history = bool(summary or messages)
+
+    # Follow-ups ("what does that word mean?") are retrieved together with the previous question;
+    # a question that stands on its own is searched as it is
+    previous = next((m["content"] for m in reversed(messages) if m["role"] == "user"), None)
+    retrieval_query = f"{previous}\n{question}" if previous else question
+    # Either way the cache compares the bare question, within the scope of the previous one
+    if previous and _is_follow_up(question):
+        question_vector, cache_vector = await asyncio.gather(
+            async_get_embedding(retrieval_query), async_get_embedding(question)
+        )
+        docs = await async_qdrant_search(query=retrieval_query, query_vector=question_vector)
+    else:
+        cache_vector = await async_get_embedding(question)
+        docs = await async_qdrant_search(query=question, query_vector=cache_vector)
+        if previous and max((doc.score for doc in docs), default=0.0) < FOLLOW_UP_MIN_SCORE:
+            docs = await async_qdrant_search(
+                query=retrieval_query, query_vector=await async_get_embedding(retrieval_query)
+            )
+    doc_ids = [str(doc.id) for doc in docs]
+
+    # Near-duplicate question over the same documents (and, for a follow-up, after the same
+    # previous question): replay the stored answer. The running summary is not part of the key;
+    # history that is only a summary (no previous question left in it) is not cached.
+    cacheable = previous is not None or not has_history
+    cached = answer_cache.lookup(cache_vector, doc_ids, scope=previous) if cacheable else None
+    if cached is not None:
+        if session_id:
+            await session_store.async_append(session_id, question, "".join(cached["chunks"]))
+        yield {
+            "event_type": "on_retriever_end",
+            "content": cached["content"]
+        }
+        for chunk in cached["chunks"]:
+            yield {
+                "event_type": "on_chat_model_stream",
+                "content": chunk
+            }
+        yield {
+            "event_type": "done"
+        }
+        return
+
     docs_dict = [doc.payload for doc in docs]
     yield {
         "event_type": "on_retriever_end",
         "content": docs_dict
     }
 
-    async for chunk in stream_completion(question, docs_dict):
+    chunks = []
+    history = (summary, messages) if has_history else None
+    async for chunk in stream_completion(question, docs_dict, [doc.score for doc in docs], history):
+        chunks.append(chunk)
         yield {
             "event_type": "on_chat_model_stream",
             "content": chunk
     }
 
+    # Only complete answers are cached; a disconnect mid-stream never reaches here
+    if cacheable:
+        answer_cache.store(cache_vector, doc_ids, docs_dict, chunks, scope=previous)
+    if session_id:
+        await session_store.async_append(session_id, question, "".join(chunks))
+        session_store.schedule_compaction(session_id, summarize_history)
+
     yield {
         "event_type": "done"
     }
@@ -121,28 +208,29 @@ async def async_get_answer_and_docs(question: str):
 async def async_get_text():
     try:
         # Convert the file content (bytes) to a base64-encoded string
-        base64_img = encode_image_to_base64("https://metalbyexample.com/wp-content/uploads/figure-65.png")
-        client = OpenAI(api_key=openai_api_key)
+        base64_img = await encode_image_to_base64("https://metalbyexample.com/wp-content/uploads/figure-65.png")
+        client = async_openai_client()
         # Create a chat completion request with the base64-encoded image
-        response = client.chat.completions.create(
-            model='gpt-4o',
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": "Return JSON document with data. Only return JSON not other text"},
-                            {
-                                "type": "image_url",
-                                # for online images
-                                # "image_url": {"url": image_url}
-                                "image_url": {"url": base64_img}
-                            }
-                        ],
-                }
-            ],
-            temperature=0,
-            max_tokens=500,
-        )
+        with span("openai", "vision_json"):
+            response = await client.chat.completions.create(
+                model='gpt-4o',
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": "Return JSON document with data. Only return JSON not other text"},
+                                {
+                                    "type": "image_url",
+                                    # for online images
+                                    # "image_url": {"url": image_url}
+                                    "image_url": {"url": base64_img}
+                                }
+                            ],
+                    }
+                ],
+                temperature=0,
+                max_tokens=500,
+            )
 
         # Yield the response from OpenAI
         yield {
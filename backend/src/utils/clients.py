@@ -0,0 +1,127 @@
+import os
+import inspect
+import threading
+import boto3
+import httpx
+from botocore.config import Config
+from openai import OpenAI, AsyncOpenAI
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()  # This will load the .env file and make the variables available to os.getenv
+
+HTTP_POOL_MAX_CONNECTIONS = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "100"))
+HTTP_POOL_MAX_KEEPALIVE = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", "60"))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "60"))
+
+
+class ClientRegistry:
+    """Process-wide cache of upstream clients, created on first use and then reused.
+
+    Reusing a client keeps its connection pool, so repeat calls skip DNS and the
+    TCP/TLS handshake. ``set`` replaces a client (benchmarks install fakes this way).
+    """
+
+    def __init__(self):
+        self._clients = {}
+        # Re-entrant: a factory may fetch another client (OpenAI wraps the shared HTTP client)
+        self._lock = threading.RLock()
+
+    def get(self, name: str, factory):
+        client = self._clients.get(name)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(name)
+                if client is None:
+                    client = self._clients[name] = factory()
+        return client
+
+    def set(self, name: str, client):
+        self._clients[name] = client
+
+    def clear(self):
+        """Forget every client (the next call of each accessor builds a new one)."""
+        with self._lock:
+            self._clients.clear()
+
+    async def aclose(self):
+        """Close every client's connection pool; used at application shutdown."""
+        clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            try:
+                if isinstance(client, httpx.AsyncClient):
+                    await client.aclose()
+                elif isinstance(client, AsyncOpenAI):
+                    await client.close()
+                elif hasattr(client, "close"):
+                    # AsyncQdrantClient.close() is a coroutine, QdrantClient.close() is not
+                    result = client.close()
+                    if inspect.isawaitable(result):
+                        await result
+            except Exception as e:
+                print(f"Error closing client: {e}")
+
+
+registry = ClientRegistry()
+
+
+def _limits():
+    return httpx.Limits(
+        max_connections=HTTP_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    )
+
+
+# Pooled HTTP clients shared by the OpenAI SDK, LangChain and plain downloads
+def http_client() -> httpx.Client:
+    return registry.get("http", lambda: httpx.Client(
+        limits=_limits(), timeout=HTTP_TIMEOUT_SECONDS, follow_redirects=True
+    ))
+
+
+# Connections of an AsyncClient belong to the event loop that opened them
+def async_http_client() -> httpx.AsyncClient:
+    return registry.get("async_http", lambda: httpx.AsyncClient(
+        limits=_limits(), timeout=HTTP_TIMEOUT_SECONDS, follow_redirects=True
+    ))
+
+
+def openai_client() -> OpenAI:
+    return registry.get("openai", lambda: OpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client()
+    ))
+
+
+def async_openai_client() -> AsyncOpenAI:
+    return registry.get("async_openai", lambda: AsyncOpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"), http_client=async_http_client()
+    ))
+
+
+# boto3 clients are thread-safe once built; building one costs tens of milliseconds
+def boto3_client(service: str, region_name: str):
+    return registry.get(f"boto3:{service}:{region_name}", lambda: boto3.client(
+        service,
+        aws_access_key_id=os.getenv("AWS_ACCESS_KEY"),
+        aws_secret_access_key=os.getenv("AWS_SECRET_KEY"),
+        region_name=region_name,
+        config=Config(max_pool_connections=HTTP_POOL_MAX_CONNECTIONS, tcp_keepalive=True),
+    ))
+
+
+# Configures the Gemini SDK once and reuses the model (and its gRPC channel)
+def gemini_model(model_name: str):
+    def create():
+        api_key = os.getenv("GOOGLE_GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("Google Gemini API key is missing. Please set it in the .env file.")
+
+        # Imported here: the SDK is slow to import and only the OCR step needs it
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        return genai.GenerativeModel(model_name=model_name)
+
+    return registry.get(f"gemini:{model_name}", create)
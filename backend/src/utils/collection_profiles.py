@@ -0,0 +1,105 @@
+import os
+from qdrant_client import models
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()  # This will load the .env file and make the variables available to os.getenv
+
+QDRANT_COLLECTION_PROFILE = os.getenv("QDRANT_COLLECTION_PROFILE", "default")
+EMBEDDING_DIMENSIONS = 1536
+
+
+class CollectionProfile:
+    """Vector index settings for a Qdrant collection: HNSW, quantization and storage placement.
+
+    Quantized profiles keep the compressed vectors in RAM and, with ``rescore``,
+    re-rank ``oversampling`` times as many candidates using the original vectors,
+    which can then live on disk. ``search_ef`` None leaves hnsw_ef to Qdrant's default.
+    """
+
+    def __init__(self, name: str, hnsw_m: int = 16, hnsw_ef_construct: int = 100, search_ef: int = None,
+                 quantization: str = None, rescore: bool = True, oversampling: float = 1.0,
+                 on_disk_vectors: bool = False, on_disk_payload: bool = False):
+        if quantization not in (None, "scalar", "binary"):
+            raise ValueError(f"Unknown quantization {quantization!r}, expected scalar, binary or None")
+        self.name = name
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construct = hnsw_ef_construct
+        self.search_ef = search_ef
+        self.quantization = quantization
+        self.rescore = rescore
+        self.oversampling = oversampling
+        self.on_disk_vectors = on_disk_vectors
+        self.on_disk_payload = on_disk_payload
+
+    def create_collection_kwargs(self, size: int = EMBEDDING_DIMENSIONS):
+        """Keyword arguments for ``create_collection`` (besides the collection name)."""
+        kwargs = {
+            "vectors_config": models.VectorParams(
+                size=size, distance=models.Distance.COSINE, on_disk=self.on_disk_vectors
+            ),
+            "hnsw_config": models.HnswConfigDiff(m=self.hnsw_m, ef_construct=self.hnsw_ef_construct),
+            "on_disk_payload": self.on_disk_payload,
+        }
+        if self.quantization == "scalar":
+            kwargs["quantization_config"] = models.ScalarQuantization(
+                scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
+            )
+        elif self.quantization == "binary":
+            kwargs["quantization_config"] = models.BinaryQuantization(
+                binary=models.BinaryQuantizationConfig(always_ram=True)
+            )
+        return kwargs
+
+    # None when the profile changes nothing, so searches send no params at all
+    def search_params(self):
+        params = {}
+        if self.search_ef is not None:
+            params["hnsw_ef"] = self.search_ef
+        if self.quantization:
+            params["quantization"] = models.QuantizationSearchParams(
+                rescore=self.rescore, oversampling=self.oversampling
+            )
+        return models.SearchParams(**params) if params else None
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+PROFILES = {
+    # float32 vectors and payloads in RAM: what every collection used before profiles existed
+    "default": CollectionProfile("default"),
+    # int8 copies in RAM (4x smaller), originals in RAM for rescoring
+    "scalar": CollectionProfile("scalar", search_ef=128, quantization="scalar", oversampling=2.0),
+    # int8 copies in RAM; originals and payloads on disk, read only to rescore the top candidates
+    "scalar_on_disk": CollectionProfile(
+        "scalar_on_disk", search_ef=128, quantization="scalar", oversampling=2.0,
+        on_disk_vectors=True, on_disk_payload=True
+    ),
+    # 1 bit per dimension in RAM (32x smaller); needs rescoring and more oversampling for recall
+    "binary": CollectionProfile(
+        "binary", search_ef=128, quantization="binary", oversampling=3.0, on_disk_vectors=True, on_disk_payload=True
+    ),
+    # Smallest footprint: sparser graph and binary codes, no rescoring
+    "binary_no_rescore": CollectionProfile(
+        "binary_no_rescore", hnsw_m=8, search_ef=128, quantization="binary", rescore=False,
+        on_disk_vectors=True, on_disk_payload=True
+    ),
+}
+
+
+# Profile named by QDRANT_COLLECTION_PROFILE, with optional HNSW overrides from the environment
+def collection_profile(name: str = None) -> CollectionProfile:
+    name = name or QDRANT_COLLECTION_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"Unknown collection profile {name!r}, expected one of {sorted(PROFILES)}")
+    profile = PROFILES[name]
+    overrides = {
+        "hnsw_m": os.getenv("QDRANT_HNSW_M"),
+        "hnsw_ef_construct": os.getenv("QDRANT_HNSW_EF_CONSTRUCT"),
+        "search_ef": os.getenv("QDRANT_SEARCH_EF"),
+    }
+    overrides = {key: int(value) for key, value in overrides.items() if value}
+    if not overrides:
+        return profile
+    return CollectionProfile(**{**profile.to_dict(), **overrides})
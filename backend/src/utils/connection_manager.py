@@ -0,0 +1,174 @@
+import os
+import json
+import uuid
+import asyncio
+import itertools
+from collections import deque
+from dotenv import load_dotenv
+from fastapi import WebSocket
+
+# Load environment variables from .env file
+load_dotenv()  # This will load the .env file and make the variables available to os.getenv
+
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "100"))
+# What to do when a client's send queue is full: drop_oldest, drop_newest or disconnect
+WS_SLOW_CLIENT_POLICY = os.getenv("WS_SLOW_CLIENT_POLICY", "drop_oldest")
+WS_FLUSH_TIMEOUT_SECONDS = float(os.getenv("WS_FLUSH_TIMEOUT_SECONDS", "5"))
+
+SLOW_CLIENT_POLICIES = ("drop_oldest", "drop_newest", "disconnect")
+
+
+class Client:
+    def __init__(self, websocket: WebSocket, device: str = None, room: str = None, queue_size: int = WS_SEND_QUEUE_SIZE):
+        self.id = uuid.uuid4().hex
+        self.websocket = websocket
+        self.device = device
+        self.room = room
+        self.queue_size = queue_size
+        # Direct replies (answer tokens) and broadcasts wait in separate lanes, so the slow
+        # client policy only ever drops broadcasts. The sender sends both in the order queued
+        self.direct = deque()
+        self.broadcasts = deque()
+        self.readable = asyncio.Event()
+        self.writable = asyncio.Event()
+        self.closing = False
+        self.task = None
+        self.dropped = 0
+        self._sequence = itertools.count()
+
+    def put(self, lane: deque, message: str):
+        lane.append((next(self._sequence), message))
+        self.readable.set()
+
+    def queued(self) -> int:
+        return len(self.direct) + len(self.broadcasts)
+
+
+class ConnectionManager:
+    """Registry of connected WebSocket clients, each drained by its own sender task.
+
+    Messages are serialized once and put on per-client bounded queues, so a slow
+    client only ever delays itself. Direct sends wait for room and are never
+    dropped. When a client's broadcast queue is full a broadcast applies
+    ``policy``: drop its oldest queued broadcast, drop the new one, or
+    disconnect it.
+    """
+
+    def __init__(self, queue_size: int = WS_SEND_QUEUE_SIZE, policy: str = WS_SLOW_CLIENT_POLICY):
+        if policy not in SLOW_CLIENT_POLICIES:
+            raise ValueError(f"Unknown slow client policy {policy!r}, expected one of {SLOW_CLIENT_POLICIES}")
+        self.queue_size = queue_size
+        self.policy = policy
+        self.clients = {}
+        self._counters = {"sent": 0, "dropped": 0, "disconnected_slow": 0}
+        self._closing = set()
+
+    def connect(self, websocket: WebSocket, device: str = None, room: str = None) -> Client:
+        """Register an accepted WebSocket and start its sender task."""
+        client = Client(websocket, device, room, self.queue_size)
+        client.task = asyncio.create_task(self._sender(client))
+        self.clients[client.id] = client
+        return client
+
+    async def disconnect(self, client: Client, flush: bool = True):
+        """Unregister a client; with ``flush`` its queued messages are sent before closing."""
+        self.clients.pop(client.id, None)
+        if client.task is None or client.task.done():
+            return
+        if flush:
+            client.closing = True
+            client.readable.set()
+            try:
+                await asyncio.wait_for(client.task, WS_FLUSH_TIMEOUT_SECONDS)
+                return
+            except asyncio.TimeoutError:
+                print(f"Timed out flushing WebSocket client {client.id}")
+        client.task.cancel()
+
+    async def send(self, client: Client, event: dict):
+        """Queue an event for one client, waiting while its queue is full."""
+        message = json.dumps(event)
+        while client.id in self.clients:
+            if len(client.direct) < client.queue_size:
+                client.put(client.direct, message)
+                return
+            client.writable.clear()
+            await client.writable.wait()
+
+    def broadcast(self, event: dict, device: str = None, room: str = None) -> int:
+        """Queue an event for every client (or those matching device/room); returns how many got it."""
+        message = json.dumps(event)
+        delivered = 0
+        for client in list(self.clients.values()):
+            if device is not None and client.device != device:
+                continue
+            if room is not None and client.room != room:
+                continue
+            if self._offer(client, message):
+                delivered += 1
+        return delivered
+
+    def has_clients(self, device: str = None, room: str = None) -> bool:
+        return any(
+            (device is None or client.device == device) and (room is None or client.room == room)
+            for client in self.clients.values()
+        )
+
+    def _offer(self, client: Client, message: str) -> bool:
+        if len(client.broadcasts) < client.queue_size:
+            client.put(client.broadcasts, message)
+            return True
+
+        client.dropped += 1
+        self._counters["dropped"] += 1
+        if self.policy == "drop_oldest":
+            client.broadcasts.popleft()
+            client.put(client.broadcasts, message)
+            return True
+        if self.policy == "disconnect":
+            print(f"Disconnecting slow WebSocket client {client.id}")
+            self._counters["disconnected_slow"] += 1
+            task = asyncio.create_task(self.disconnect(client, flush=False))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+        return False
+
+    async def _sender(self, client: Client):
+        try:
+            while True:
+                if not client.direct and not client.broadcasts:
+                    if client.closing:
+                        break
+                    client.readable.clear()
+                    await client.readable.wait()
+                    continue
+                # Whichever lane holds the message queued first
+                if not client.broadcasts or (client.direct and client.direct[0][0] < client.broadcasts[0][0]):
+                    _, message = client.direct.popleft()
+                    client.writable.set()
+                else:
+                    _, message = client.broadcasts.popleft()
+                await client.websocket.send_text(message)
+                self._counters["sent"] += 1
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"Failed to send to WebSocket: {e}")
+        finally:
+            self.clients.pop(client.id, None)
+            # Unblock any send() still waiting for room in the queue
+            client.direct.clear()
+            client.broadcasts.clear()
+            client.writable.set()
+            try:
+                await client.websocket.close()
+            except Exception:
+                pass
+
+    def stats(self):
+        return {
+            **self._counters,
+            "clients": len(self.clients),
+            "queued": sum(client.queued() for client in self.clients.values()),
+            "policy": self.policy,
+        }
@@ -0,0 +1,181 @@
+import os
+import re
+from dotenv import load_dotenv
+from .metrics import metrics
+
+# Load environment variables from .env file
+load_dotenv()  # This will load the .env file and make the variables available to os.getenv
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_DEDUP_SIMILARITY = float(os.getenv("CONTEXT_DEDUP_SIMILARITY", "0.9"))
+COMPLETION_MODEL = "gpt-4o"
+
+# Overlaps shorter than this are treated as coincidence, not splitter overlap
+MIN_OVERLAP_CHARS = 8
+# Don't bother appending a truncated block with less room than this left
+MIN_TRUNCATED_TOKENS = 64
+
+CONTEXT_TOKENS = metrics.counter(
+    "readbuddy_context_tokens_total",
+    "Tokens of retrieved context before packing (naive) and as sent to the model (packed).",
+    ("stage",),
+)
+CONTEXT_CHUNKS_DROPPED = metrics.counter(
+    "readbuddy_context_chunks_dropped_total",
+    "Retrieved chunks folded into another block (merged), dropped as near-duplicates, or truncated.",
+    ("reason",),
+)
+
+_encoding = None
+
+
+class _ApproximateEncoding:
+    """Stand-in when tiktoken's BPE files can't be loaded: ~4 characters per token."""
+
+    def encode(self, text):
+        return range(0, len(text), 4)
+
+    def decode_prefix(self, text, tokens):
+        return text[:4 * tokens]
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.encoding_for_model(COMPLETION_MODEL)
+        except Exception as e:
+            # tiktoken downloads its encoding on first use; estimate rather than fail the request
+            print(f"tiktoken unavailable, estimating token counts: {e}")
+            _encoding = _ApproximateEncoding()
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    return len(_get_encoding().encode(text))
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    encoding = _get_encoding()
+    if isinstance(encoding, _ApproximateEncoding):
+        return encoding.decode_prefix(text, max_tokens)
+    return encoding.decode(encoding.encode(text)[:max_tokens])
+
+
+def _overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of ``left`` that is a prefix of ``right``."""
+    for size in range(min(len(left), len(right)) - 1, MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _merge(left: str, right: str):
+    """Join two chunks of the same source if one contains or runs into the other."""
+    if right in left:
+        return left
+    if left in right:
+        return right
+    size = _overlap(left, right)
+    if size:
+        return left + right[size:]
+    size = _overlap(right, left)
+    if size:
+        return right + left[size:]
+    return None
+
+
+def _shingles(text: str):
+    words = re.findall(r"\w+", text.lower())
+    return {tuple(words[i:i + 3]) for i in range(max(len(words) - 2, 1))}
+
+
+# Share of ``candidate``'s shingles already present in ``kept``
+def _containment(candidate, kept) -> float:
+    return len(candidate & kept) / len(candidate) if candidate else 0.0
+
+
+def pack_context(docs, scores=None, budget: int = None):
+    """Assemble the prompt context from retrieved chunk payloads.
+
+    Chunks of the same source (and page) that overlap or touch are merged back
+    together, near-duplicates are dropped, and the highest-scoring blocks are
+    packed into ``budget`` tokens. Returns ``(context, stats)``.
+    """
+    budget = CONTEXT_TOKEN_BUDGET if budget is None else budget
+    scores = list(scores) if scores is not None else [float(len(docs) - i) for i in range(len(docs))]
+
+    # Merge overlapping chunks of the same source; a merged block keeps its best score
+    blocks = []
+    for doc, score in zip(docs, scores):
+        text = (doc.get("page_content") or "").strip()
+        if not text:
+            continue
+        metadata = doc.get("metadata") or {}
+        key = (metadata.get("source"), metadata.get("page"))
+        block = {"key": key, "text": text, "score": score}
+        merged = True
+        while merged:
+            merged = False
+            for other in blocks:
+                if other["key"] != key or key == (None, None):
+                    continue
+                joined = _merge(other["text"], block["text"])
+                if joined is not None:
+                    blocks.remove(other)
+                    block = {"key": key, "text": joined, "score": max(score, other["score"], block["score"])}
+                    merged = True
+                    break
+        blocks.append(block)
+    merged_chunks = sum(1 for doc in docs if (doc.get("page_content") or "").strip()) - len(blocks)
+
+    # Highest score first; drop blocks that mostly repeat one already kept
+    blocks.sort(key=lambda block: block["score"], reverse=True)
+    kept, kept_shingles = [], []
+    for block in blocks:
+        shingles = _shingles(block["text"])
+        if any(_containment(shingles, other) >= CONTEXT_DEDUP_SIMILARITY for other in kept_shingles):
+            continue
+        kept.append(block)
+        kept_shingles.append(shingles)
+    duplicates = len(blocks) - len(kept)
+
+    parts, used, truncated = [], 0, 0
+    for block in kept:
+        tokens = count_tokens(block["text"])
+        if used + tokens <= budget:
+            parts.append(block["text"])
+            used += tokens
+            continue
+        if budget - used >= MIN_TRUNCATED_TOKENS:
+            parts.append(_truncate(block["text"], budget - used))
+            truncated += 1
+        break
+    context = "\n\n".join(parts)
+
+    naive_context = "\n".join(doc.get("page_content") or "" for doc in docs)
+    naive_tokens = count_tokens(naive_context)
+    context_tokens = count_tokens(context)
+    # Block separators can outweigh the savings on small results; never send more than the plain join
+    packed = context_tokens <= naive_tokens
+    if not packed:
+        context, context_tokens = naive_context, naive_tokens
+        merged_chunks = duplicates = truncated = 0
+
+    CONTEXT_TOKENS.inc(naive_tokens, stage="naive")
+    CONTEXT_TOKENS.inc(context_tokens, stage="packed")
+    CONTEXT_CHUNKS_DROPPED.inc(merged_chunks, reason="merged")
+    CONTEXT_CHUNKS_DROPPED.inc(duplicates, reason="duplicate")
+    CONTEXT_CHUNKS_DROPPED.inc(truncated, reason="truncated")
+    return context, {
+        "chunks": len(docs),
+        "packed": packed,
+        "merged": merged_chunks,
+        "duplicates": duplicates,
+        "blocks": len(parts) if packed else len(docs),
+        "truncated": truncated,
+        "naive_tokens": naive_tokens,
+        "context_tokens": context_tokens,
+        "tokens_saved": naive_tokens - context_tokens,
+    }
@@ -0,0 +1,251 @@
+import os
+import re
+import time
+import sqlite3
+import asyncio
+import hashlib
+import tempfile
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Callable, List, Optional
+from langchain_core.embeddings import Embeddings
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()  # This will load the .env file and make the variables available to os.getenv
+
+DEFAULT_DISK_PATH = os.path.join(tempfile.gettempdir(), "readbuddy_embeddings.sqlite3")
+
+_whitespace = re.compile(r"\s+")
+
+
+# Normalize text so trivially different questions/chunks share one cache entry
+def normalize_text(text: str) -> str:
+    return _whitespace.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def cache_key(model: str, normalized_text: str) -> str:
+    digest = hashlib.sha256(normalized_text.encode("utf-8")).hexdigest()
+    return f"{model}:{digest}"
+
+
+class EmbeddingCache:
+    """Two-tier (in-memory LRU over SQLite) cache of embeddings keyed by (model, text hash).
+
+    Vectors are stored on disk as packed float32, and the disk tier is trimmed
+    by least-recently-used rows once it grows past ``max_disk_bytes``.
+    """
+
+    def __init__(self, path: Optional[str] = DEFAULT_DISK_PATH, memory_items: int = 4096,
+                 max_disk_bytes: int = 256 * 1024 * 1024):
+        self.memory_items = memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = 0
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "lookup_seconds": 0.0,
+            "embed_seconds": 0.0,
+        }
+        self._db = None
+        if path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("PRAGMA synchronous=NORMAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings ("
+                    "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+                )
+                self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+                self._disk_bytes = self._db.execute(
+                    "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+                ).fetchone()[0]
+            except sqlite3.Error as e:
+                print(f"Embedding cache disk tier disabled ({path}): {e}")
+                self._db = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            path=os.getenv("EMBEDDING_CACHE_PATH", DEFAULT_DISK_PATH) or None,
+            memory_items=int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "4096")),
+            max_disk_bytes=int(os.getenv("EMBEDDING_CACHE_MAX_DISK_MB", "256")) * 1024 * 1024,
+        )
+
+    # Memory tier
+
+    # Vectors are held as packed float32 arrays (~6 KB each) rather than lists of floats (~50 KB)
+    def _memory_get(self, key):
+        vector = self._memory.get(key)
+        if vector is None:
+            return None
+        self._memory.move_to_end(key)
+        return vector.tolist()
+
+    def _memory_put(self, key, vector):
+        self._memory[key] = vector if isinstance(vector, array) else array("f", vector)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    # Disk tier
+
+    def _disk_get(self, keys):
+        if self._db is None or not keys:
+            return {}
+        placeholders = ",".join("?" * len(keys))
+        rows = self._db.execute(
+            f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", keys
+        ).fetchall()
+        if rows:
+            self._db.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(time.time(), key) for key, _ in rows],
+            )
+            self._db.commit()
+        return {key: array("f", blob) for key, blob in rows}
+
+    def _disk_put(self, items):
+        if self._db is None or not items:
+            return
+        now = time.time()
+        rows = [(key, vector.tobytes(), now) for key, vector in items]
+        existing = self._db.execute(
+            f"SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings WHERE key IN ({','.join('?' * len(rows))})",
+            [row[0] for row in rows],
+        ).fetchone()[0]
+        self._db.executemany("INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows)
+        self._disk_bytes += sum(len(row[1]) for row in rows) - existing
+        if self._disk_bytes > self.max_disk_bytes:
+            self._evict_disk()
+        self._db.commit()
+
+    def _evict_disk(self):
+        # Trim to 90% of the budget so eviction doesn't run on every insert
+        target = int(self.max_disk_bytes * 0.9)
+        while self._disk_bytes > target:
+            rows = self._db.execute(
+                "SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used LIMIT 256"
+            ).fetchall()
+            if not rows:
+                self._disk_bytes = 0
+                break
+            victims = []
+            for key, size in rows:
+                victims.append((key,))
+                self._disk_bytes -= size
+                if self._disk_bytes <= target:
+                    break
+            self._db.executemany("DELETE FROM embeddings WHERE key = ?", victims)
+            self._counters["evictions"] += len(victims)
+
+    # Lookups
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        start = time.perf_counter()
+        keys = [cache_key(model, normalize_text(text)) for text in texts]
+        with self._lock:
+            results = [self._memory_get(key) for key in keys]
+            missing = [key for key, vector in zip(keys, results) if vector is None]
+            from_disk = self._disk_get(list(dict.fromkeys(missing)))
+            for i, key in enumerate(keys):
+                if results[i] is not None:
+                    self._counters["memory_hits"] += 1
+                elif key in from_disk:
+                    self._memory_put(key, from_disk[key])
+                    results[i] = from_disk[key].tolist()
+                    self._counters["disk_hits"] += 1
+                else:
+                    self._counters["misses"] += 1
+            self._counters["lookup_seconds"] += time.perf_counter() - start
+        return results
+
+    def put_many(self, model: str, texts: List[str], vectors: List[List[float]]):
+        items = [(cache_key(model, normalize_text(text)), array("f", vector)) for text, vector in zip(texts, vectors)]
+        with self._lock:
+            for key, vector in items:
+                self._memory_put(key, vector)
+            self._disk_put(items)
+
+    def get_or_embed_many(self, model: str, texts: List[str],
+                          embed_fn: Callable[[List[str]], List[List[float]]]) -> List[List[float]]:
+        results = self.get_many(model, texts)
+        # Only embed each distinct missing text once, in normalized form
+        missing = list(dict.fromkeys(normalize_text(t) for t, v in zip(texts, results) if v is None))
+        if missing:
+            start = time.perf_counter()
+            vectors = embed_fn(missing)
+            with self._lock:
+                self._counters["embed_seconds"] += time.perf_counter() - start
+            self.put_many(model, missing, vectors)
+            embedded = dict(zip(missing, vectors))
+            results = [v if v is not None else embedded[normalize_text(t)] for t, v in zip(texts, results)]
+        return results
+
+    def get_or_embed(self, model: str, text: str, embed_fn: Callable[[str], List[float]]) -> List[float]:
+        return self.get_or_embed_many(model, [text], lambda missing: [embed_fn(missing[0])])[0]
+
+    async def aget_or_embed_many(self, model: str, texts: List[str], aembed_fn) -> List[List[float]]:
+        # Memory hits are served inline; anything touching SQLite runs off the event loop
+        with self._lock:
+            keys = [cache_key(model, normalize_text(text)) for text in texts]
+            if all(key in self._memory for key in keys):
+                self._counters["memory_hits"] += len(keys)
+                return [self._memory_get(key) for key in keys]
+        results = await asyncio.to_thread(self.get_many, model, texts)
+        missing = list(dict.fromkeys(normalize_text(t) for t, v in zip(texts, results) if v is None))
+        if missing:
+            start = time.perf_counter()
+            vectors = await aembed_fn(missing)
+            with self._lock:
+                self._counters["embed_seconds"] += time.perf_counter() - start
+            await asyncio.to_thread(self.put_many, model, missing, vectors)
+            embedded = dict(zip(missing, vectors))
+            results = [v if v is not None else embedded[normalize_text(t)] for t, v in zip(texts, results)]
+        return results
+
+    async def aget_or_embed(self, model: str, text: str, aembed_fn) -> List[float]:
+        async def embed_one(missing):
+            return [await aembed_fn(missing[0])]
+        return (await self.aget_or_embed_many(model, [text], embed_one))[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            counters["memory_items"] = len(self._memory)
+            counters["disk_bytes"] = self._disk_bytes
+        hits = counters["memory_hits"] + counters["disk_hits"]
+        lookups = hits + counters["misses"]
+        counters["hit_rate"] = hits / lookups if lookups else 0.0
+        counters["embed_ms_per_miss"] = (
+            1000 * counters["embed_seconds"] / counters["misses"] if counters["misses"] else 0.0
+        )
+        return counters
+
+
+class CachedEmbeddings(Embeddings):
+    """LangChain ``Embeddings`` wrapper so vector-store ingestion shares the embedding cache."""
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, model: str):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.cache.get_or_embed_many(self.model, texts, self.embeddings.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.cache.get_or_embed(self.model, text, self.embeddings.embed_query)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.cache.aget_or_embed_many(self.model, texts, self.embeddings.aembed_documents)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.cache.aget_or_embed(self.model, text, self.embeddings.aembed_query)
@@ -0,0 +1,95 @@
+import os
+import uuid
+import asyncio
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()  # This will load the .env file and make the variables available to os.getenv
+
+IMAGE_REQUEST_HISTORY = int(os.getenv("IMAGE_REQUEST_HISTORY", "200"))
+
+# Partial-result fields filled in as each stage's event arrives
+RESULT_FIELDS = {
+    "on_image_text": "text",
+    "on_image_explanation": "explanation_text",
+    "on_image_audio": "mp3_url",
+    "on_image_url": "image_url",
+}
+
+
+class ImageRequest:
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.state = "running"
+        self.result = {}
+        self.events = []
+        self.subscribers = []
+        self.task = None
+
+    def to_dict(self):
+        return {"request_id": self.id, "state": self.state, "result": self.result}
+
+
+class ImageRequestHub:
+    """Tracks background image-processing requests and fans their events out to subscribers.
+
+    Events are buffered per request, so a subscriber that connects after the
+    request started still receives everything from the beginning.
+    """
+
+    def __init__(self, history: int = IMAGE_REQUEST_HISTORY):
+        self.history = history
+        self.requests = OrderedDict()
+
+    def start(self, run) -> ImageRequest:
+        """Run ``run(request)`` in the background and return the request right away."""
+        request = ImageRequest()
+        self.requests[request.id] = request
+        request.task = asyncio.create_task(self._run(request, run))
+        while len(self.requests) > self.history:
+            oldest = next(iter(self.requests.values()))
+            if oldest.state == "running":
+                break
+            self.requests.popitem(last=False)
+        return request
+
+    def get(self, request_id: str):
+        return self.requests.get(request_id)
+
+    def publish(self, request: ImageRequest, event: dict):
+        field = RESULT_FIELDS.get(event["event_type"])
+        if field:
+            request.result[field] = event["content"]
+        request.events.append(event)
+        for events in request.subscribers:
+            events.put_nowait(event)
+
+    async def subscribe(self, request_id: str):
+        """Yield every event of a request (buffered first, then live) until it finishes."""
+        request = self.requests.get(request_id)
+        if request is None:
+            return
+        events = asyncio.Queue()
+        for event in request.events:
+            events.put_nowait(event)
+        request.subscribers.append(events)
+        try:
+            while True:
+                event = await events.get()
+                yield event
+                if event["event_type"] in ("on_image_process", "error"):
+                    return
+        finally:
+            request.subscribers.remove(events)
+
+    async def _run(self, request: ImageRequest, run):
+        try:
+            await run(request)
+            request.state = "done"
+        except Exception as e:
+            print(f"Error processing image request {request.id}: {e}")
+            request.state = "failed"
+            self.publish(request, {"event_type": "error", "request_id": request.id, "content": str(e)})
+        finally:
+            request.task = None
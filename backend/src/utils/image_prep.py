@@ -0,0 +1,178 @@
+import os
+import time
+import base64
+import asyncio
+from io import BytesIO
+from dotenv import load_dotenv
+import numpy as np
+from PIL import Image, ImageChops, ImageFilter, ImageOps, UnidentifiedImageError
+from .metrics import metrics
+
+# Load environment variables from .env file
+load_dotenv()  # This will load the .env file and make the variables available to os.getenv
+
+IMAGE_NORMALIZE = os.getenv("IMAGE_NORMALIZE", "true").lower() not in ("0", "false", "no")
+# Longest edge sent to vision models; printed text stays legible well below the camera's UXGA
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "1280"))
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "jpeg").lower()  # jpeg | webp
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "80"))
+IMAGE_GRAYSCALE = os.getenv("IMAGE_GRAYSCALE", "false").lower() in ("1", "true", "yes")
+IMAGE_CROP_TEXT = os.getenv("IMAGE_CROP_TEXT", "false").lower() in ("1", "true", "yes")
+# Assumed bandwidth to the vision providers, only used to estimate the upload time saved
+IMAGE_UPLINK_MBPS = float(os.getenv("IMAGE_UPLINK_MBPS", "10"))
+
+# Text detection runs on a small copy; margin kept around the detected text, as a fraction of the image
+CROP_DETECT_EDGE = 256
+CROP_MARGIN = 0.03
+# A pixel this much darker than its surroundings is ink; a row or column needs this share of ink
+CROP_INK_CONTRAST = 40
+CROP_MIN_INK = 0.04
+
+IMAGE_BYTES = metrics.counter(
+    "readbuddy_image_bytes_total",
+    "Image bytes before and after normalization for vision calls.",
+    ("stage",),
+)
+
+
+class NormalizedImage:
+    """Image bytes ready for a vision call, with the real MIME type and what normalizing saved."""
+
+    def __init__(self, data: bytes, mime_type: str, size, bytes_in: int, source_format: str, seconds: float = 0.0):
+        self.data = data
+        self.mime_type = mime_type
+        self.size = size
+        self.bytes_in = bytes_in
+        self.source_format = source_format
+        self.seconds = seconds
+
+    @property
+    def bytes_out(self) -> int:
+        return len(self.data)
+
+    def to_base64(self) -> str:
+        return base64.b64encode(self.data).decode('utf-8')
+
+    def to_data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{self.to_base64()}"
+
+
+# Bounding box of the printed text, in the coordinates of ``image``, or None.
+# Ink is a pixel clearly darker than the brightest pixel around it, so a dark desk or
+# shadow around the page does not count; rows and columns need a minimum share of ink,
+# which drops noise and the thin band along the page edges.
+def _text_bbox(image):
+    small = image.convert("L")
+    small.thumbnail((CROP_DETECT_EDGE, CROP_DETECT_EDGE))
+    background = small.filter(ImageFilter.MaxFilter(5))
+    ink = np.asarray(ImageChops.subtract(background, small)) > CROP_INK_CONTRAST
+    rows = np.flatnonzero(ink.mean(axis=1) > CROP_MIN_INK)
+    columns = np.flatnonzero(ink.mean(axis=0) > CROP_MIN_INK)
+    if len(rows) == 0 or len(columns) == 0:
+        return None
+    scale_x, scale_y = image.width / small.width, image.height / small.height
+    margin_x, margin_y = image.width * CROP_MARGIN, image.height * CROP_MARGIN
+    left = max(0, int(columns[0] * scale_x - margin_x))
+    top = max(0, int(rows[0] * scale_y - margin_y))
+    right = min(image.width, int((columns[-1] + 1) * scale_x + margin_x))
+    bottom = min(image.height, int((rows[-1] + 1) * scale_y + margin_y))
+    # Not worth a crop (or a false detection) unless it removes a useful part of the frame
+    if (right - left) * (bottom - top) > 0.9 * image.width * image.height or right - left < 32 or bottom - top < 32:
+        return None
+    return left, top, right, bottom
+
+
+def normalize_image(data: bytes, max_edge: int = None, image_format: str = None, quality: int = None,
+                    grayscale: bool = None, crop_text: bool = None) -> NormalizedImage:
+    """Detect the real format, auto-orient, optionally grayscale and crop to the text, downscale
+    to ``max_edge`` and re-encode as JPEG or WebP. Settings default to the IMAGE_* variables.
+
+    The original bytes are kept when re-encoding would not make them smaller.
+    Raises ValueError for data Pillow cannot read.
+    """
+    max_edge = max_edge or IMAGE_MAX_EDGE
+    image_format = (image_format or IMAGE_FORMAT).lower()
+    quality = quality or IMAGE_QUALITY
+    grayscale = IMAGE_GRAYSCALE if grayscale is None else grayscale
+    crop_text = IMAGE_CROP_TEXT if crop_text is None else crop_text
+    started = time.perf_counter()
+
+    try:
+        image = Image.open(BytesIO(data))
+        source_format = image.format
+        source_mime = Image.MIME.get(source_format, "application/octet-stream")
+        original_size = image.size
+        rotated = image.getexif().get(0x0112, 1) != 1
+        # JPEG can decode straight at a lower scale (and luma only for grayscale), much cheaper
+        # than decoding the full frame and resizing it. A crop keeps full resolution to start from.
+        scale = 1.0 if crop_text else min(1.0, max_edge / max(image.size))
+        image.draft("L" if grayscale else "RGB", (int(image.width * scale), int(image.height * scale)))
+        image = ImageOps.exif_transpose(image)
+    except (UnidentifiedImageError, OSError) as e:
+        raise ValueError(f"Unsupported image data: {e}")
+
+    if grayscale:
+        image = image.convert("L")
+    elif image.mode != "RGB":
+        # Flatten transparency onto white, as the page would look printed
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        else:
+            image = image.convert("RGB")
+
+    if crop_text:
+        bbox = _text_bbox(image)
+        if bbox is not None:
+            image = image.crop(bbox)
+
+    resized = max(image.size) > max_edge
+    if resized:
+        # Bicubic keeps print sharp at about half the cost of Lanczos
+        image.thumbnail((max_edge, max_edge), Image.BICUBIC)
+
+    output = BytesIO()
+    if image_format == "webp":
+        image.save(output, format="WEBP", quality=quality, method=4)
+        mime_type = "image/webp"
+    else:
+        image.save(output, format="JPEG", quality=quality, optimize=True)
+        mime_type = "image/jpeg"
+    encoded = output.getvalue()
+
+    changed = resized or rotated or image.size != original_size or grayscale
+    if not changed and len(encoded) >= len(data) and source_mime in ("image/jpeg", "image/png", "image/webp"):
+        encoded, mime_type = data, source_mime
+
+    return NormalizedImage(encoded, mime_type, image.size, len(data), source_format, time.perf_counter() - started)
+
+
+# Normalize in a worker thread (decoding and resizing are CPU bound) and log what it saved.
+# With IMAGE_NORMALIZE off the bytes pass through, labelled with their real format.
+async def prepare_image(data: bytes, caller: str = "vision") -> NormalizedImage:
+    if not IMAGE_NORMALIZE:
+        return await asyncio.to_thread(_passthrough, data)
+    image = await asyncio.to_thread(normalize_image, data)
+    _log(image, caller)
+    return image
+
+
+def _passthrough(data: bytes) -> NormalizedImage:
+    try:
+        with Image.open(BytesIO(data)) as image:
+            return NormalizedImage(data, Image.MIME.get(image.format, "image/jpeg"), image.size, len(data), image.format)
+    except (UnidentifiedImageError, OSError) as e:
+        raise ValueError(f"Unsupported image data: {e}")
+
+
+def _log(image: NormalizedImage, caller: str):
+    IMAGE_BYTES.inc(image.bytes_in, stage="in")
+    IMAGE_BYTES.inc(image.bytes_out, stage="out")
+    upload_saved = (image.bytes_in - image.bytes_out) * 8 / (IMAGE_UPLINK_MBPS * 1e6)
+    print(
+        f"Image for {caller}: {image.source_format} {image.bytes_in} bytes -> {image.mime_type} "
+        f"{image.size[0]}x{image.size[1]} {image.bytes_out} bytes in {1000 * image.seconds:.0f}ms; "
+        f"~{1000 * (upload_saved - image.seconds):.0f}ms saved at {IMAGE_UPLINK_MBPS:g} Mbps"
+    )
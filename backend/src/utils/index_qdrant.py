@@ -1,57 +1,146 @@
 import os
+import shutil
+import asyncio
+import tempfile
+import chardet
+from pypdf import PdfReader, PageObject
+from pypdf.errors import PdfReadError
+from pypdf.generic import IndirectObject, NameObject
+from langchain_core.documents import Document
 from langchain_qdrant import QdrantVectorStore 
 from langchain_openai import OpenAIEmbeddings
-from langchain_community.document_loaders import WebBaseLoader, PyPDFLoader, TextLoader
-# import chardet --pip install needed for txt auto detect encoding
-# import pypdf  -- pip install needed for pdf parsing
+from langchain_community.document_loaders import WebBaseLoader
 # import python-multipart -- pip install needed for pdf parsing
 from langchain_text_splitters import RecursiveCharacterTextSplitter, CharacterTextSplitter
-from qdrant_client import QdrantClient, models
+from qdrant_client import QdrantClient, AsyncQdrantClient, models
 from fastapi import UploadFile
 from dotenv import load_dotenv
-from .openai_utils import get_embedding
+from .openai_utils import get_embedding, async_get_embedding, get_embedding_cache, EMBEDDING_MODEL
+from .embedding_cache import CachedEmbeddings
+from .clients import registry, http_client, async_http_client
+from .collection_profiles import collection_profile
+from .ingest_pipeline import ingest_documents, iterate_in_thread, existing_chunk_ids
+from .metrics import span
+from .local_index import LocalIndexClient, AsyncLocalIndexClient, LOCAL_INDEX_PATH, RETRIEVAL_BACKEND
 
 # Load environment variables from .env file
 load_dotenv()  # This will load the .env file and make the variables available to os.getenv
 
 qdrant_api_key = os.getenv("QDRANT_API_KEY")
 qdrant_url = os.getenv("QDRANT_URL")
+retrieval_backend = RETRIEVAL_BACKEND
 collection_name = "Websites"
 
-client = QdrantClient(
-    url=qdrant_url,
-    api_key=qdrant_api_key
-)
+
+# QDRANT_URL=":memory:" runs an embedded, in-process Qdrant (local development and benchmarks)
+def qdrant_client_kwargs():
+    if qdrant_url == ":memory:":
+        return {"location": ":memory:"}
+    return {"url": qdrant_url, "api_key": qdrant_api_key}
+
+
+# Clients come from the shared registry and the vector store is created on first use,
+# so importing this module makes no network calls; warmup() does the one-time collection check
+vector_store = None
+
+
+def uses_local_index():
+    if retrieval_backend not in ("qdrant", "numpy", "mmap"):
+        raise ValueError(f"Unknown RETRIEVAL_BACKEND {retrieval_backend!r}, expected qdrant, numpy or mmap")
+    return retrieval_backend != "qdrant"
+
+
+def get_local_index():
+    return registry.get(
+        "local_index", lambda: LocalIndexClient(LOCAL_INDEX_PATH, approximate=retrieval_backend == "mmap")
+    )
+
+
+def get_client():
+    if uses_local_index():
+        return get_local_index()
+    return registry.get("qdrant", lambda: QdrantClient(**qdrant_client_kwargs()))
+
+
+# Used by the websocket endpoints so searches never block the event loop
+def get_async_client():
+    if uses_local_index():
+        return registry.get("async_local_index", lambda: AsyncLocalIndexClient(get_local_index()))
+    return registry.get("async_qdrant", lambda: AsyncQdrantClient(**qdrant_client_kwargs()))
 
 
+# LangChain store used by the synchronous /chat chain; it probes the collection on construction
+def get_vector_store():
+    global vector_store
+    if vector_store is None:
+        ensure_collection_exists(collection_name)
+        vector_store = QdrantVectorStore(
+            client=get_client(),
+            collection_name=collection_name,
+            embedding=CachedEmbeddings(
+                OpenAIEmbeddings(
+                    model=EMBEDDING_MODEL,
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    http_client=http_client(),
+                    http_async_client=async_http_client(),
+                ),
+                cache=get_embedding_cache(),
+                model=EMBEDDING_MODEL,
+            )
+        )
+    return vector_store
+
+
+# One-time startup hook: open the clients and make sure the collection is ready
+async def warmup():
+    get_client()
+    get_async_client()
+    get_embedding_cache()
+    await async_ensure_collection_exists(collection_name)
+
+
+# New collections are created with the QDRANT_COLLECTION_PROFILE settings (see collection_profiles.py);
+# existing collections keep the configuration they were created with.
 def create_collection(collection_name):
+    client = get_client()
     client.create_collection(
         collection_name=collection_name,
-        vectors_config=models.VectorParams(size=1536, distance=models.Distance.COSINE)
+        **collection_profile().create_collection_kwargs()
     )
-    print(f"Collection {collection_name} created successfully")
+    print(f"Collection {collection_name} created successfully (profile {collection_profile().name})")
 
 
 def ensure_collection_exists(collection_name):
+    client = get_client()
     if not client.collection_exists(collection_name=collection_name):
         client.create_collection(
             collection_name=collection_name,
-            vectors_config=models.VectorParams(size=1536, distance=models.Distance.COSINE)
+            **collection_profile().create_collection_kwargs()
         )
-        print(f"Collection {collection_name} created successfully")
+        print(f"Collection {collection_name} created successfully (profile {collection_profile().name})")
     else:
         print(f"Collection {collection_name} already exists.")
 
 
-ensure_collection_exists(collection_name)
+async def async_ensure_collection_exists(collection_name):
+    async_client = get_async_client()
+    if not await async_client.collection_exists(collection_name=collection_name):
+        await async_client.create_collection(
+            collection_name=collection_name,
+            **collection_profile().create_collection_kwargs()
+        )
+        print(f"Collection {collection_name} created successfully (profile {collection_profile().name})")
+    if collection_name not in _source_indexed_collections:
+        # Re-indexing looks up a source's existing chunks by metadata.source
+        await async_client.create_payload_index(
+            collection_name=collection_name,
+            field_name="metadata.source",
+            field_schema=models.PayloadSchemaType.KEYWORD,
+        )
+        _source_indexed_collections.add(collection_name)
 
-vector_store = QdrantVectorStore(
-    client=client,
-    collection_name=collection_name,
-    embedding=OpenAIEmbeddings(
-        api_key=os.getenv("OPENAI_API_KEY")
-    )
-)
+
+_source_indexed_collections = set()
 
 text_splitter = RecursiveCharacterTextSplitter(
     chunk_size=1000, 
@@ -59,66 +148,190 @@ text_splitter = RecursiveCharacterTextSplitter(
     length_function=len
 )
 
+file_text_splitter = CharacterTextSplitter(chunk_size=200, chunk_overlap=20)
 
-def upload_webpage(url:str):
-    ensure_collection_exists(collection_name)
+SPOOL_CHUNK_SIZE = 1024 * 1024
+TEXT_BLOCK_SIZE = 64 * 1024
+# pypdf keeps every object it parses until the reader goes away; a fresh reader every
+# PDF_READER_PAGES pages keeps that cache, and ingestion memory, flat in the document size
+PDF_READER_PAGES = int(os.getenv("PDF_READER_PAGES", "64"))
+# Page attributes a page inherits from its ancestors in the page tree
+PDF_INHERITED_ATTRIBUTES = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+
+
+async def upload_webpage(url:str, on_progress=None):
+    await async_ensure_collection_exists(collection_name)
         
     loader = WebBaseLoader(url)
-    docs = loader.load_and_split(text_splitter)
+    docs = await asyncio.to_thread(loader.load_and_split, text_splitter)
 
     for doc in docs:
         doc.metadata = {"source": url}
-    
-    vector_store.add_documents(docs)
-    return f"Successfully uploaded {len(docs)} documents to collection {collection_name} from URL."
 
+    # Only new or changed chunks are embedded; chunks gone from the page are deleted
+    existing_ids = await existing_chunk_ids(get_async_client(), collection_name, url)
+    stats = await ingest_documents(get_async_client(), collection_name, docs, on_progress=on_progress,
+                                   existing_ids=existing_ids, delete_stale=True)
+    return (f"Successfully indexed {url} into collection {collection_name}: {stats['chunks']} added, "
+            f"{stats['kept']} kept, {stats['removed']} removed ({stats['chunks_per_second']:.1f} chunks/s).")
 
-def upload_file(file: UploadFile):
-    ensure_collection_exists(collection_name)
 
-    with open(file.filename, "wb") as f:
-        f.write(file.file.read())
+# Copy the upload to a uniquely named temp file in fixed-size chunks, so concurrent
+# uploads with the same name never collide and the file is never fully in memory
+def spool_upload(file: UploadFile):
+    suffix = os.path.splitext(file.filename)[1].lower()
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, prefix="readbuddy_") as tmp:
+        file.file.seek(0)
+        shutil.copyfileobj(file.file, tmp, SPOOL_CHUNK_SIZE)
+        return tmp.name
 
-    documents = []
 
-    # Check if the file is a text file
-    if file.filename.lower().endswith('.txt'):
-        try:
-            loader = TextLoader(file_path=file.filename, autodetect_encoding=True)  # Assuming TextLoader can take a file-like object
-            documents = loader.load()
-        except Exception as e:
-            print(f"Error loading text file: {e}")
-            return {"error": f"Failed to load text file: {e}"}
-    elif file.filename.lower().endswith('.pdf'):
-        loader = PyPDFLoader(file.filename)
-        documents = loader.load()
-
-    if not len(documents):
-        return f"Document is empty."
+def _detect_encoding(path):
+    with open(path, "rb") as f:
+        sample = f.read(TEXT_BLOCK_SIZE)
+    try:
+        sample.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError as e:
+        # The sample may end mid-character; only fall back if the error is earlier
+        if e.start >= len(sample) - 3:
+            return "utf-8"
+    return chardet.detect(sample)["encoding"] or "utf-8"
+
+
+# Yield the document one page (PDF) or one ~64 KB block of lines (TXT) at a time
+def _iter_pages(path, filename):
+    if filename.lower().endswith('.txt'):
+        encoding = _detect_encoding(path)
+        with open(path, encoding=encoding, errors="replace") as f:
+            block = []
+            size = 0
+            for line in f:
+                block.append(line)
+                size += len(line)
+                if size >= TEXT_BLOCK_SIZE:
+                    yield Document(page_content="".join(block), metadata={"source": filename})
+                    block = []
+                    size = 0
+            if block:
+                yield Document(page_content="".join(block), metadata={"source": filename})
+    elif filename.lower().endswith('.pdf'):
+        with open(path, "rb") as f:
+            tree_path, page_number, done = [], 0, False
+            while not done:
+                # close() clears everything the reader parsed, without waiting for the garbage collector
+                with PdfReader(f) as reader:
+                    for _ in range(PDF_READER_PAGES):
+                        page = _pdf_page_at(reader, tree_path)
+                        if page is None:
+                            done = True
+                            break
+                        text = page.extract_text()
+                        page = None
+                        yield Document(page_content=text, metadata={"source": filename, "page": page_number})
+                        tree_path[-1] += 1
+                        page_number += 1
 
-    text_splitter = CharacterTextSplitter(chunk_size=200, chunk_overlap=20)
-    docs = text_splitter.split_documents(documents)
-    # print("docs: %s" % docs)
 
-    vector_store.add_documents(docs)
+# The page at ``tree_path`` (kid indices from the root of the page tree), or None past the last page.
+# reader.pages would parse every page of the document up front, so the tree is walked one page at a
+# time; ``tree_path`` is moved into the next subtree when this one has no more pages, and stays valid
+# in a fresh reader of the same file
+def _pdf_page_at(reader: PdfReader, tree_path: list):
+    while True:
+        node, inherited, depth = reader.trailer["/Root"]["/Pages"], {}, 0
+        while True:
+            inherited.update((attr, node[attr]) for attr in PDF_INHERITED_ATTRIBUTES if attr in node)
+            if depth == len(tree_path):
+                tree_path.append(0)
+            kids = node.get("/Kids", [])
+            if tree_path[depth] >= len(kids):
+                # This subtree is done: continue with the parent's next kid
+                del tree_path[depth:]
+                if not tree_path:
+                    return None
+                tree_path[-1] += 1
+                break
+            kid = kids[tree_path[depth]]
+            obj = kid.get_object()
+            if obj is None:
+                # Dangling reference in a damaged file: skip it
+                del tree_path[depth + 1:]
+                tree_path[depth] += 1
+                continue
+            if obj.get("/Type") == "/Pages" or "/Kids" in obj:
+                node, depth = obj, depth + 1
+                continue
+            del tree_path[depth + 1:]
+            if isinstance(kid, IndirectObject):
+                page = PageObject(reader, kid)
+            else:
+                page = PageObject(reader)
+                page.update(obj)
+            for attr, value in inherited.items():
+                if attr not in page:
+                    page[NameObject(attr)] = value
+            return page
 
-    # After adding the documents, delete the file
+
+async def _iter_chunks(path, filename):
+    async for page in iterate_in_thread(_iter_pages(path, filename)):
+        for chunk in file_text_splitter.split_documents([page]):
+            yield chunk
+
+
+async def upload_file(file: UploadFile, on_progress=None):
+    path = await asyncio.to_thread(spool_upload, file)
+    return await upload_spooled_file(path, file.filename, on_progress)
+
+
+# Index a file already spooled by spool_upload(); the temp file is always removed
+async def upload_spooled_file(path: str, filename: str, on_progress=None):
     try:
-        os.remove(file.filename)
-        print(f"Temporary file {file.filename} deleted successfully.")
-    except OSError as e:
-        print(f"Error: {file.filename} : {e.strerror}")
+        await async_ensure_collection_exists(collection_name)
+        stats = await ingest_documents(get_async_client(), collection_name, _iter_chunks(path, filename),
+                                       on_progress=on_progress)
+    except (UnicodeError, LookupError) as e:
+        print(f"Error loading text file: {e}")
+        return {"error": f"Failed to load text file: {e}"}
+    except PdfReadError as e:
+        print(f"Error loading PDF file: {e}")
+        return {"error": f"Failed to load PDF file: {e}"}
+    finally:
+        # After adding the documents, delete the temp file
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"Error: {path} : {e.strerror}")
+
+    if not stats["chunks"]:
+        return f"Document is empty."
+
+    return (f"Successfully uploaded {stats['chunks']} documents from {filename} "
+            f"({stats['chunks_per_second']:.1f} chunks/s).")
 
-    return f"Successfully uploaded {len(docs)} documents from {file.filename}."        
-    
 
-def qdrant_search(query: str):
+def qdrant_search(query: str, limit: int = 4):
     vector_search = get_embedding(query)
-    docs = client.search(
-        collection_name=collection_name,
-        query_vector=vector_search,
-        limit=4
-    )
+    with span(retrieval_backend, "search"):
+        docs = get_client().search(
+            collection_name=collection_name,
+            query_vector=vector_search,
+            limit=limit,
+            search_params=collection_profile().search_params(),
+        )
+    return docs
+
+
+async def async_qdrant_search(query: str, query_vector=None, limit: int = 4):
+    vector_search = query_vector or await async_get_embedding(query)
+    with span(retrieval_backend, "search"):
+        docs = await get_async_client().search(
+            collection_name=collection_name,
+            query_vector=vector_search,
+            limit=limit,
+            search_params=collection_profile().search_params(),
+        )
     return docs
 
 
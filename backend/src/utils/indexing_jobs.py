@@ -0,0 +1,161 @@
+import os
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()  # This will load the .env file and make the variables available to os.getenv
+
+INDEXING_WORKERS = int(os.getenv("INDEXING_WORKERS", "2"))
+INDEXING_QUEUE_SIZE = int(os.getenv("INDEXING_QUEUE_SIZE", "100"))
+INDEXING_JOB_HISTORY = int(os.getenv("INDEXING_JOB_HISTORY", "500"))
+
+TERMINAL_STATES = ("succeeded", "failed")
+
+
+class IndexingJob:
+    def __init__(self, kind: str, source: str, run):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.source = source
+        self.run = run
+        self.state = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.chunks = 0
+        self.batches = 0
+        self.chunks_per_second = 0.0
+        self.result = None
+        self.error = None
+        self.subscribers = []
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "source": self.source,
+            "state": self.state,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "chunks": self.chunks,
+            "batches": self.batches,
+            "chunks_per_second": self.chunks_per_second,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class IndexingJobManager:
+    """Queue of indexing jobs drained by a fixed pool of worker tasks.
+
+    Workers are started on the first submit (they need the running event loop).
+    Finished jobs are kept for status lookups, oldest evicted first.
+    """
+
+    def __init__(self, workers: int = INDEXING_WORKERS, queue_size: int = INDEXING_QUEUE_SIZE,
+                 history: int = INDEXING_JOB_HISTORY):
+        self.workers = workers
+        self.history = history
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.jobs = OrderedDict()
+        self._worker_tasks = []
+
+    def submit(self, kind: str, source: str, run) -> IndexingJob:
+        """Queue ``run(on_progress)`` (a coroutine function); raises asyncio.QueueFull when saturated."""
+        self._ensure_workers()
+        job = IndexingJob(kind, source, run)
+        self.queue.put_nowait(job)
+        self.jobs[job.id] = job
+        self._trim_history()
+        return job
+
+    def get(self, job_id: str):
+        return self.jobs.get(job_id)
+
+    async def subscribe(self, job_id: str):
+        """Yield progress events for a job until it reaches a terminal state."""
+        job = self.jobs.get(job_id)
+        if job is None:
+            return
+        events = asyncio.Queue()
+        job.subscribers.append(events)
+        try:
+            event = self._event(job)
+            # Stop on the state carried by the event, not the job's live state: the job may
+            # finish while the consumer handles an earlier event, and its final event must still go out
+            while True:
+                yield event
+                if event["content"]["state"] in TERMINAL_STATES:
+                    break
+                event = await events.get()
+        finally:
+            job.subscribers.remove(events)
+
+    def _ensure_workers(self):
+        self._worker_tasks = [task for task in self._worker_tasks if not task.done()]
+        while len(self._worker_tasks) < self.workers:
+            self._worker_tasks.append(asyncio.create_task(self._worker()))
+
+    def _trim_history(self):
+        if len(self.jobs) <= self.history:
+            return
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.state in TERMINAL_STATES]:
+            del self.jobs[job_id]
+            if len(self.jobs) <= self.history:
+                break
+
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, job: IndexingJob):
+        job.state = "running"
+        job.started_at = time.time()
+        self._publish(job)
+
+        def on_progress(stats):
+            job.chunks = stats["chunks"]
+            job.batches = stats["batches"]
+            job.chunks_per_second = stats["chunks_per_second"]
+            self._publish(job)
+
+        try:
+            result = await job.run(on_progress)
+            if isinstance(result, dict) and "error" in result:
+                job.state = "failed"
+                job.error = result["error"]
+            else:
+                job.state = "succeeded"
+                job.result = result
+        except Exception as e:
+            print(f"Indexing job {job.id} failed: {e}")
+            job.state = "failed"
+            job.error = str(e)
+        finally:
+            job.run = None
+            job.finished_at = time.time()
+            self._publish(job)
+
+    @staticmethod
+    def _event(job: IndexingJob):
+        return {"event_type": "on_indexing_progress", "content": job.to_dict()}
+
+    def _publish(self, job: IndexingJob):
+        event = self._event(job)
+        for events in job.subscribers:
+            events.put_nowait(event)
+
+    def stats(self):
+        return {
+            "queued": self.queue.qsize(),
+            "running": sum(1 for job in self.jobs.values() if job.state == "running"),
+            "workers": self.workers,
+        }
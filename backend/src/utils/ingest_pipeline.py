@@ -0,0 +1,185 @@
+import os
+import time
+import uuid
+import asyncio
+import hashlib
+from qdrant_client import AsyncQdrantClient, models
+from dotenv import load_dotenv
+from .openai_utils import async_embed_documents
+from .answer_cache import answer_cache
+from .local_index import RETRIEVAL_BACKEND
+from .metrics import span
+
+# Load environment variables from .env file
+load_dotenv()  # This will load the .env file and make the variables available to os.getenv
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "4"))
+
+
+# Drive a blocking iterator (e.g. a page parser) from a worker thread, one item at a time
+async def iterate_in_thread(iterable):
+    iterator = iter(iterable)
+    done = object()
+    while (item := await asyncio.to_thread(next, iterator, done)) is not done:
+        yield item
+
+
+# Deterministic point id: the same chunk of the same source (and page) always maps to the same id
+def chunk_id(doc) -> str:
+    digest = hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()
+    key = f"{doc.metadata.get('source', '')}\x00{doc.metadata.get('page', '')}\x00{digest}"
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, key))
+
+
+# Ids of every point currently stored for a source (metadata.source)
+async def existing_chunk_ids(client: AsyncQdrantClient, collection_name: str, source: str) -> set:
+    ids = set()
+    offset = None
+    source_filter = models.Filter(
+        must=[models.FieldCondition(key="metadata.source", match=models.MatchValue(value=source))]
+    )
+    while True:
+        points, offset = await client.scroll(
+            collection_name=collection_name,
+            scroll_filter=source_filter,
+            limit=1000,
+            offset=offset,
+            with_payload=False,
+            with_vectors=False,
+        )
+        ids.update(str(point.id) for point in points)
+        if offset is None:
+            return ids
+
+
+# Pair chunks with their ids, dropping repeats and (counted as kept) already-stored chunks
+async def _new_chunks(docs, existing_ids, seen_ids, stats):
+    if not hasattr(docs, "__aiter__"):
+        docs = _aiter(docs)
+    async for doc in docs:
+        point_id = chunk_id(doc)
+        if point_id in seen_ids:
+            continue
+        seen_ids.add(point_id)
+        if point_id in existing_ids:
+            stats["kept"] += 1
+            continue
+        yield point_id, doc
+
+
+async def _batched(items, batch_size):
+    batch = []
+    async for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def _aiter(iterable):
+    for item in iterable:
+        yield item
+
+
+# Same payload layout as langchain_qdrant.QdrantVectorStore, so retrievers keep working
+def _to_points(batch, vectors):
+    return [
+        models.PointStruct(
+            id=point_id,
+            vector=vector,
+            payload={"page_content": doc.page_content, "metadata": doc.metadata},
+        )
+        for (point_id, doc), vector in zip(batch, vectors)
+    ]
+
+
+async def ingest_documents(client: AsyncQdrantClient, collection_name: str, docs,
+                           batch_size: int = None, concurrency: int = None, on_progress=None,
+                           existing_ids: set = None, delete_stale: bool = False):
+    """Embed ``docs`` in batches with bounded parallelism and upsert them batch by batch.
+
+    ``docs`` may be a list, a generator or an async generator; it is consumed
+    lazily, so streaming sources are never fully materialized.
+
+    Up to ``concurrency`` embedding requests run ahead of the writer, so the upsert
+    of batch N overlaps with embedding batches N+1.. and memory stays bounded.
+    Returns throughput stats for tuning INGEST_BATCH_SIZE / INGEST_CONCURRENCY;
+    ``on_progress(stats)`` is called after every upserted batch.
+
+    Points get deterministic ids (see chunk_id), so re-ingesting is idempotent.
+    Chunks whose id is in ``existing_ids`` are not re-embedded; with
+    ``delete_stale`` the existing ids that no longer occur in ``docs`` are deleted.
+    """
+    batch_size = batch_size or INGEST_BATCH_SIZE
+    concurrency = concurrency or INGEST_CONCURRENCY
+    start = time.perf_counter()
+    semaphore = asyncio.Semaphore(concurrency)
+    pending = asyncio.Queue(maxsize=concurrency)
+    existing_ids = existing_ids or set()
+    seen_ids = set()
+    stats = {"chunks": 0, "batches": 0, "kept": 0, "removed": 0, "embed_seconds": 0.0, "upsert_seconds": 0.0}
+
+    async def embed(batch):
+        async with semaphore:
+            embed_start = time.perf_counter()
+            vectors = await async_embed_documents([doc.page_content for _, doc in batch])
+            stats["embed_seconds"] += time.perf_counter() - embed_start
+            return vectors
+
+    async def produce():
+        try:
+            async for batch in _batched(_new_chunks(docs, existing_ids, seen_ids, stats), batch_size):
+                await pending.put((batch, asyncio.create_task(embed(batch))))
+        except Exception as e:
+            # Hand source errors (e.g. a corrupt page) to the writer loop below
+            await pending.put(e)
+            return
+        await pending.put(None)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while (item := await pending.get()) is not None:
+            if isinstance(item, Exception):
+                raise item
+            batch, embedding = item
+            points = _to_points(batch, await embedding)
+            upsert_start = time.perf_counter()
+            with span(RETRIEVAL_BACKEND, "upsert"):
+                await client.upsert(collection_name=collection_name, points=points, wait=False)
+            answer_cache.invalidate_documents(point.id for point in points)
+            stats["upsert_seconds"] += time.perf_counter() - upsert_start
+            stats["chunks"] += len(points)
+            stats["batches"] += 1
+            if on_progress:
+                elapsed = time.perf_counter() - start
+                on_progress({**stats, "seconds": elapsed, "chunks_per_second": stats["chunks"] / elapsed})
+        await producer
+    finally:
+        producer.cancel()
+        while not pending.empty():
+            item = pending.get_nowait()
+            if isinstance(item, tuple):
+                item[1].cancel()
+
+    stale_ids = existing_ids - seen_ids
+    if delete_stale and stale_ids:
+        with span(RETRIEVAL_BACKEND, "delete"):
+            await client.delete(
+                collection_name=collection_name,
+                points_selector=models.PointIdsList(points=list(stale_ids)),
+                wait=False,
+            )
+        answer_cache.invalidate_documents(stale_ids)
+        stats["removed"] = len(stale_ids)
+
+    stats["seconds"] = time.perf_counter() - start
+    stats["chunks_per_second"] = stats["chunks"] / stats["seconds"] if stats["seconds"] else 0.0
+    print(
+        f"Ingested {stats['chunks']} chunks into {collection_name} in {stats['batches']} batches "
+        f"(kept {stats['kept']}, removed {stats['removed']}) "
+        f"({stats['chunks_per_second']:.1f} chunks/s, batch_size={batch_size}, concurrency={concurrency})"
+    )
+    return stats
@@ -0,0 +1,397 @@
+import os
+import json
+import sqlite3
+import asyncio
+import threading
+import numpy as np
+from qdrant_client import models
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()  # This will load the .env file and make the variables available to os.getenv
+
+# "qdrant", or an embedded index under LOCAL_INDEX_PATH: "numpy" (exact) or "mmap" (approximate, IVF)
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "qdrant")
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", "/tmp/readbuddy_index")
+LOCAL_INDEX_NPROBE = int(os.getenv("LOCAL_INDEX_NPROBE", "8"))
+# Below this many vectors the approximate index just scans everything
+LOCAL_INDEX_MIN_TRAIN = int(os.getenv("LOCAL_INDEX_MIN_TRAIN", "1024"))
+
+INITIAL_CAPACITY = 1024
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE = 20000
+
+
+def _unit_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+class LocalCollection:
+    """One collection on local disk: a memory-mapped float32 matrix plus a SQLite payload store.
+
+    Vectors are normalized on insert, so cosine similarity is a dot product.
+    Deleted rows are tombstoned and skipped. With ``approximate`` the rows are
+    bucketed by k-means centroids (an IVF index) once there are enough of
+    them, and a search scans only the ``nprobe`` closest buckets.
+    """
+
+    def __init__(self, path: str, dim: int = None, approximate: bool = False, nprobe: int = LOCAL_INDEX_NPROBE):
+        self.path = path
+        self.approximate = approximate
+        self.nprobe = nprobe
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+        else:
+            meta = {"dim": dim, "capacity": INITIAL_CAPACITY, "count": 0, "trained_at": 0}
+        self.meta = meta
+        self.dim = meta["dim"]
+
+        self._db = sqlite3.connect(os.path.join(path, "payloads.db"), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS points ("
+            "id TEXT PRIMARY KEY, row INTEGER NOT NULL, source TEXT, list INTEGER, payload TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS points_source ON points(source)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS points_row ON points(row)")
+
+        self._vectors = self._open_vectors(meta["capacity"])
+        self._ids = {}
+        self._row_ids = {}
+        self._live = np.zeros(meta["capacity"], dtype=bool)
+        self._lists = {}
+        # IVF list of every row, -1 when it has none (not trained yet, or deleted)
+        self._row_lists = np.full(meta["capacity"], -1, dtype=np.int64)
+        for point_id, row in self._db.execute("SELECT id, row FROM points"):
+            self._ids[point_id] = row
+            self._row_ids[row] = point_id
+            self._live[row] = True
+        centroids_path = os.path.join(path, "centroids.npy")
+        self._centroids = np.load(centroids_path) if os.path.exists(centroids_path) else None
+        if self._centroids is not None:
+            self._rebuild_lists()
+        self._save_meta()
+
+    def _open_vectors(self, capacity):
+        file_path = os.path.join(self.path, "vectors.f32")
+        size = capacity * self.dim * 4
+        with open(file_path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        return np.memmap(file_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+    def _save_meta(self):
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump(self.meta, f)
+
+    def _grow(self, needed):
+        capacity = self.meta["capacity"]
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        self._vectors.flush()
+        self._vectors = self._open_vectors(capacity)
+        self._live = np.concatenate([self._live, np.zeros(capacity - len(self._live), dtype=bool)])
+        self._row_lists = np.concatenate([self._row_lists, np.full(capacity - len(self._row_lists), -1, dtype=np.int64)])
+        self.meta["capacity"] = capacity
+
+    def __len__(self):
+        return len(self._ids)
+
+    def upsert(self, ids, vectors, payloads):
+        vectors = _unit_rows(vectors)
+        with self._lock:
+            new = [point_id for point_id in ids if point_id not in self._ids]
+            self._grow(self.meta["count"] + len(new))
+            rows = []
+            for point_id in ids:
+                row = self._ids.get(point_id)
+                if row is None:
+                    row = self.meta["count"]
+                    self.meta["count"] += 1
+                    self._ids[point_id] = row
+                    self._row_ids[row] = point_id
+                rows.append(row)
+            rows = np.array(rows)
+            self._vectors[rows] = vectors
+            self._live[rows] = True
+            self._vectors.flush()
+
+            list_ids = self._assign(vectors) if self._centroids is not None else [None] * len(rows)
+            self._db.executemany(
+                "INSERT OR REPLACE INTO points (id, row, source, list, payload) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (point_id, int(row), ((payload or {}).get("metadata") or {}).get("source"),
+                     None if list_id is None else int(list_id), json.dumps(payload or {}))
+                    for point_id, row, list_id, payload in zip(ids, rows, list_ids, payloads)
+                ],
+            )
+            self._db.commit()
+            if self._centroids is not None:
+                self._update_lists(rows, list_ids)
+            if self.approximate and len(self) >= max(LOCAL_INDEX_MIN_TRAIN, 2 * self.meta["trained_at"]):
+                self._train()
+            self._save_meta()
+
+    def delete(self, ids):
+        with self._lock:
+            rows = [self._ids.pop(point_id) for point_id in ids if point_id in self._ids]
+            for row in rows:
+                self._row_ids.pop(row, None)
+            self._live[rows] = False
+            self._db.executemany("DELETE FROM points WHERE id = ?", [(point_id,) for point_id in ids])
+            self._db.commit()
+            if self._centroids is not None:
+                self._update_lists(rows, None)
+
+    def search(self, query_vector, limit: int):
+        query = _unit_rows(query_vector)[0]
+        with self._lock:
+            if self._centroids is not None and self.approximate:
+                probes = np.argsort(-(self._centroids @ query))[:self.nprobe]
+                rows = np.concatenate([self._lists.get(int(p), np.empty(0, dtype=np.int64)) for p in probes])
+                scores = self._vectors[rows] @ query
+            else:
+                # Exact: one matrix-vector product over every row, deleted rows masked out
+                count = self.meta["count"]
+                rows = np.flatnonzero(self._live[:count])
+                scores = (self._vectors[:count] @ query)[rows]
+            if not len(rows):
+                return []
+            top = np.argsort(-scores, kind="stable")[:limit]
+            hits = [(self._row_ids[int(rows[i])], float(scores[i])) for i in top]
+            payloads = self._payloads([point_id for point_id, _ in hits])
+        return [
+            models.ScoredPoint(id=point_id, version=0, score=score, payload=payloads.get(point_id))
+            for point_id, score in hits
+        ]
+
+    def scroll(self, source: str = None, limit: int = 100, offset: int = None, with_payload: bool = True,
+               predicate=None):
+        """Page through points in row order, optionally only those of one metadata.source.
+
+        ``predicate(payload)`` filters on anything else, by scanning the payloads.
+        """
+        offset = offset or 0
+        query = "SELECT id, row, payload FROM points WHERE row >= ?"
+        params = [offset]
+        if source is not None:
+            query += " AND source = ?"
+            params.append(source)
+        query += " ORDER BY row"
+        with self._lock:
+            if predicate is None:
+                found = self._db.execute(query + " LIMIT ?", params + [limit + 1]).fetchall()
+            else:
+                found = []
+                for point in self._db.execute(query, params):
+                    if predicate(json.loads(point[2])):
+                        found.append(point)
+                        if len(found) > limit:
+                            break
+        records = [
+            models.Record(id=point_id, payload=json.loads(payload) if with_payload else None)
+            for point_id, _, payload in found[:limit]
+        ]
+        next_offset = found[limit][1] if len(found) > limit else None
+        return records, next_offset
+
+    def _payloads(self, ids):
+        if not ids:
+            return {}
+        placeholders = ",".join("?" * len(ids))
+        rows = self._db.execute(f"SELECT id, payload FROM points WHERE id IN ({placeholders})", ids)
+        return {point_id: json.loads(payload) for point_id, payload in rows}
+
+    def _assign(self, vectors):
+        return np.argmax(vectors @ self._centroids.T, axis=1)
+
+    # k-means (spherical) over a sample of the live vectors; every row is then re-bucketed
+    def _train(self):
+        live = np.flatnonzero(self._live[:self.meta["count"]])
+        rng = np.random.default_rng(0)
+        sample = self._vectors[np.sort(rng.choice(live, min(len(live), KMEANS_SAMPLE), replace=False))]
+        nlist = max(1, int(np.sqrt(len(live))))
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(KMEANS_ITERATIONS):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[assignment == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = _unit_rows(centroids)
+        self._centroids = centroids
+        np.save(os.path.join(self.path, "centroids.npy"), centroids)
+
+        assignment = np.empty(len(live), dtype=np.int64)
+        for start in range(0, len(live), 8192):
+            assignment[start:start + 8192] = self._assign(self._vectors[live[start:start + 8192]])
+        self._db.executemany("UPDATE points SET list = ? WHERE row = ?",
+                             [(int(c), int(row)) for c, row in zip(assignment, live)])
+        self._db.commit()
+        self.meta["trained_at"] = len(live)
+        self._rebuild_lists()
+
+    # Every list from SQLite: on open and after training
+    def _rebuild_lists(self):
+        lists = {}
+        self._row_lists[:] = -1
+        for row, list_id in self._db.execute("SELECT row, list FROM points WHERE list IS NOT NULL"):
+            lists.setdefault(list_id, []).append(row)
+            self._row_lists[row] = list_id
+        self._lists = {list_id: np.array(rows, dtype=np.int64) for list_id, rows in lists.items()}
+
+    # Move ``rows`` to ``list_ids`` (None: out of every list), touching only the lists involved
+    def _update_lists(self, rows, list_ids):
+        rows = np.asarray(rows, dtype=np.int64)
+        new = np.full(len(rows), -1, dtype=np.int64) if list_ids is None else np.asarray(list_ids, dtype=np.int64)
+        # A point written twice in one batch ends up where its last write put it
+        rows, last = np.unique(rows[::-1], return_index=True)
+        new = new[::-1][last]
+        old = self._row_lists[rows]
+        moved = old != new
+        for list_id in np.unique(old[moved & (old >= 0)]):
+            members = self._lists[int(list_id)]
+            self._lists[int(list_id)] = members[~np.isin(members, rows[moved])]
+        for list_id in np.unique(new[moved & (new >= 0)]):
+            members = self._lists.get(int(list_id), np.empty(0, dtype=np.int64))
+            self._lists[int(list_id)] = np.concatenate([members, rows[moved & (new == list_id)]])
+        self._row_lists[rows] = new
+
+
+class LocalIndexClient:
+    """Embedded stand-in for the parts of ``QdrantClient`` the app uses.
+
+    Collections live under ``path``; ``approximate`` selects the IVF index over
+    the memory-mapped vectors instead of an exact NumPy scan.
+    """
+
+    def __init__(self, path: str = LOCAL_INDEX_PATH, approximate: bool = False):
+        self.path = path
+        self.approximate = approximate
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def _collection_path(self, collection_name):
+        return os.path.join(self.path, collection_name)
+
+    def _collection(self, collection_name, dim=None) -> LocalCollection:
+        with self._lock:
+            collection = self._collections.get(collection_name)
+            if collection is None:
+                if dim is None and not self.collection_exists(collection_name):
+                    raise ValueError(f"Collection {collection_name} not found")
+                collection = LocalCollection(self._collection_path(collection_name), dim, self.approximate)
+                self._collections[collection_name] = collection
+            return collection
+
+    def collection_exists(self, collection_name: str) -> bool:
+        return os.path.exists(os.path.join(self._collection_path(collection_name), "meta.json"))
+
+    def create_collection(self, collection_name: str, vectors_config: models.VectorParams, **kwargs):
+        self._collection(collection_name, dim=vectors_config.size)
+        return True
+
+    # metadata.source is always indexed (SQLite column); filters on other fields scan the payloads
+    def create_payload_index(self, collection_name: str, field_name: str, **kwargs):
+        if field_name != "metadata.source":
+            print(f"Local index has no payload index for {field_name}; filters on it scan every point")
+        return None
+
+    def upsert(self, collection_name: str, points, wait: bool = True, **kwargs):
+        points = list(points)
+        self._collection(collection_name).upsert(
+            [str(point.id) for point in points],
+            [point.vector for point in points],
+            [point.payload for point in points],
+        )
+
+    def search(self, collection_name: str, query_vector, limit: int = 10, **kwargs):
+        return self._collection(collection_name).search(query_vector, limit)
+
+    def scroll(self, collection_name: str, scroll_filter: models.Filter = None, limit: int = 10,
+               offset=None, with_payload: bool = True, with_vectors: bool = False, **kwargs):
+        source, predicate = _plan_filter(scroll_filter)
+        return self._collection(collection_name).scroll(source, limit, offset, with_payload, predicate)
+
+    def delete(self, collection_name: str, points_selector: models.PointIdsList, wait: bool = True, **kwargs):
+        self._collection(collection_name).delete([str(point_id) for point_id in points_selector.points])
+
+    def delete_collection(self, collection_name: str):
+        import shutil
+        with self._lock:
+            self._collections.pop(collection_name, None)
+        shutil.rmtree(self._collection_path(collection_name), ignore_errors=True)
+        return True
+
+
+class AsyncLocalIndexClient:
+    """``AsyncQdrantClient``-shaped wrapper running LocalIndexClient calls in worker threads."""
+
+    def __init__(self, client: LocalIndexClient):
+        self.client = client
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+
+        async def call(*args, **kwargs):
+            return await asyncio.to_thread(method, *args, **kwargs)
+
+        return call
+
+
+# (source, predicate) for a scroll filter: an exact metadata.source match uses the SQLite
+# column; other match conditions become a predicate over the payload
+def _plan_filter(scroll_filter):
+    if scroll_filter is None:
+        return None, None
+    conditions = _as_list(scroll_filter.must)
+    if (len(conditions) == 1 and not scroll_filter.should and not scroll_filter.must_not
+            and isinstance(conditions[0], models.FieldCondition) and conditions[0].key == "metadata.source"
+            and isinstance(conditions[0].match, models.MatchValue)):
+        return conditions[0].match.value, None
+    return None, _filter_predicate(scroll_filter)
+
+
+def _as_list(conditions):
+    if conditions is None:
+        return []
+    return conditions if isinstance(conditions, list) else [conditions]
+
+
+def _filter_predicate(scroll_filter: models.Filter):
+    must = [_condition_predicate(c) for c in _as_list(scroll_filter.must)]
+    should = [_condition_predicate(c) for c in _as_list(scroll_filter.should)]
+    must_not = [_condition_predicate(c) for c in _as_list(scroll_filter.must_not)]
+    return lambda payload: (all(p(payload) for p in must) and (not should or any(p(payload) for p in should))
+                            and not any(p(payload) for p in must_not))
+
+
+def _condition_predicate(condition):
+    if isinstance(condition, models.Filter):
+        return _filter_predicate(condition)
+    if not isinstance(condition, models.FieldCondition) or not isinstance(condition.match, (models.MatchValue,
+                                                                                             models.MatchAny)):
+        raise ValueError(f"Local index filters support match conditions (MatchValue, MatchAny) only, "
+                         f"not {condition!r}")
+    path = condition.key.split(".")
+    wanted = [condition.match.value] if isinstance(condition.match, models.MatchValue) else condition.match.any
+
+    def matches(payload):
+        value = payload
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        # As in Qdrant, a list field matches when any of its values does
+        values = value if isinstance(value, list) else [value]
+        return any(v in wanted for v in values if v is not None)
+
+    return matches
@@ -0,0 +1,244 @@
+import os
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()  # This will load the .env file and make the variables available to os.getenv
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() not in ("0", "false", "no")
+# Spans slower than this are also printed, so one slow upstream shows up in the logs
+METRICS_SLOW_SPAN_SECONDS = float(os.getenv("METRICS_SLOW_SPAN_SECONDS", "10"))
+
+# Seconds; upstream calls range from a few ms (Qdrant) to tens of seconds (DALL-E)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _sorted(samples: dict):
+    return sorted(samples.items(), key=lambda item: tuple(str(value) for value in item[0]))
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        try:
+            if len(labels) == len(self.labelnames):
+                return tuple([labels[name] for name in self.labelnames])
+        except KeyError:
+            pass
+        raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in _sorted(self.samples()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+    def samples(self):
+        with self._lock:
+            return dict(self._values)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """A value that goes up and down, set directly or read from ``function`` at scrape time.
+
+    ``function`` returns a number, or (for labelled gauges) a dict mapping
+    label-value tuples to numbers. Reading state only when scraped keeps the
+    hot path free of bookkeeping.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames=(), function=None):
+        super().__init__(name, help, labelnames)
+        self.function = function
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function):
+        self.function = function
+
+    def samples(self):
+        if self.function is None:
+            return super().samples()
+        try:
+            value = self.function()
+        except Exception as e:
+            print(f"Error reading gauge {self.name}: {e}")
+            return {}
+        return value if isinstance(value, dict) else {(): value}
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            entries = {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+        for key, (counts, total, count) in _sorted(entries):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Process-wide set of metrics, rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, help, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered with a different type or labels")
+            return metric
+
+    def counter(self, name: str, help: str, labelnames=()) -> Counter:
+        return self._register(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames=(), function=None) -> Gauge:
+        gauge = self._register(Gauge, name, help, labelnames)
+        if function is not None:
+            gauge.set_function(function)
+        return gauge
+
+    def histogram(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, help, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+UPSTREAM_SECONDS = metrics.histogram(
+    "readbuddy_upstream_request_seconds",
+    "Duration of calls to upstream services (OpenAI, Gemini, Qdrant, Polly, S3, downloads).",
+    ("upstream", "operation", "outcome"),
+)
+FIRST_TOKEN_SECONDS = metrics.histogram(
+    "readbuddy_stream_first_token_seconds",
+    "Time from a question arriving to its first answer token, per WebSocket endpoint.",
+    ("endpoint",),
+)
+STREAM_SECONDS = metrics.histogram(
+    "readbuddy_stream_duration_seconds",
+    "Time from a question arriving to the end of its streamed answer, per WebSocket endpoint.",
+    ("endpoint",),
+)
+
+
+# Time one upstream call; an exception is recorded with outcome="error" and re-raised
+@contextmanager
+def span(upstream: str, operation: str):
+    if not METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        elapsed = time.perf_counter() - started
+        UPSTREAM_SECONDS.observe(elapsed, upstream=upstream, operation=operation, outcome=outcome)
+        if elapsed >= METRICS_SLOW_SPAN_SECONDS:
+            print(f"Slow upstream call: {upstream}.{operation} took {elapsed:.1f}s ({outcome})")
+
+
+async def timed_stream(endpoint: str, events):
+    """Pass answer events through, recording time to the first token and to "done"."""
+    started = time.perf_counter()
+    first_token = finished = False
+    try:
+        async for event in events:
+            if METRICS_ENABLED:
+                if not first_token and event.get("event_type") == "on_chat_model_stream":
+                    first_token = True
+                    FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+                elif event.get("event_type") == "done":
+                    finished = True
+                    STREAM_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+            yield event
+    finally:
+        # A stream cut short (disconnect or error) still counts towards the duration
+        if METRICS_ENABLED and not finished:
+            STREAM_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
@@ -0,0 +1,139 @@
+import os
+import re
+import base64
+import asyncio
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()  # This will load the .env file and make the variables available to os.getenv
+
+# "streaming": narrate each sentence as the explanation streams in; "full": one Polly call at the end
+NARRATION_MODE = os.getenv("NARRATION_MODE", "streaming").lower()
+# Sentences synthesized at once; segments are still sent in order
+NARRATION_CONCURRENCY = int(os.getenv("NARRATION_CONCURRENCY", "3"))
+# Sentences shorter than this are joined with the next, so "Wow!" is not a Polly call of its own
+NARRATION_MIN_CHARS = int(os.getenv("NARRATION_MIN_CHARS", "20"))
+
+# End of a sentence: terminal punctuation, optional closing quotes or brackets, then whitespace
+_sentence_end = re.compile(r"[.!?]+[\"')\]]*\s+")
+# Words ending in a period that do not end a sentence
+ABBREVIATIONS = {"mr.", "mrs.", "ms.", "dr.", "st.", "vs.", "etc.", "e.g.", "i.e.", "no."}
+
+
+class SentenceSegmenter:
+    """Splits text arriving token by token into sentences as soon as each one is complete."""
+
+    def __init__(self, min_chars: int = NARRATION_MIN_CHARS):
+        self.min_chars = min_chars
+        self._buffer = ""
+        self._start = 0
+
+    def feed(self, text: str):
+        """Add streamed text; returns the sentences it completed."""
+        self._buffer += text
+        sentences = []
+        for match in _sentence_end.finditer(self._buffer, self._start):
+            candidate = self._buffer[self._start:match.end()].strip()
+            if len(candidate) < self.min_chars or self._ends_with_abbreviation(candidate):
+                continue
+            sentences.append(candidate)
+            self._start = match.end()
+        # Drop what has been handed out, so the buffer only holds the sentence in progress
+        self._buffer, self._start = self._buffer[self._start:], 0
+        return sentences
+
+    def flush(self):
+        """The text after the last complete sentence, if any."""
+        rest, self._buffer, self._start = self._buffer.strip(), "", 0
+        return rest or None
+
+    @staticmethod
+    def _ends_with_abbreviation(sentence: str) -> bool:
+        words = sentence.rstrip("\"')]").split()
+        return bool(words) and words[-1].lower() in ABBREVIATIONS
+
+
+class Narrator:
+    """Narrates an explanation sentence by sentence while it is still being generated.
+
+    ``feed()`` takes explanation tokens and ``close()`` marks the end. ``run()``
+    synthesizes each sentence as soon as it is complete, with up to
+    ``concurrency`` ``synthesize(text) -> bytes`` calls at once (a coroutine
+    function, or a blocking one run in a worker thread), and emits them in order as ``on_image_audio_chunk`` events
+    ``{"index", "text", "audio"}``, the audio being base64 MP3. A sentence that
+    could not be synthesized is reported in its place as an
+    ``on_image_audio_skipped`` event ``{"index", "text", "error"}``, ``index``
+    being that of the next chunk. It returns the concatenated MP3 (MP3 frames
+    concatenate cleanly), or None if nothing was narrated.
+    """
+
+    def __init__(self, synthesize, emit, concurrency: int = NARRATION_CONCURRENCY,
+                 min_chars: int = NARRATION_MIN_CHARS):
+        self.synthesize = synthesize
+        self.emit = emit
+        self.segmenter = SentenceSegmenter(min_chars)
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._sentences = asyncio.Queue()
+        self._closed = False
+
+    def feed(self, text: str):
+        for sentence in self.segmenter.feed(text):
+            self._sentences.put_nowait(sentence)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        rest = self.segmenter.flush()
+        if rest:
+            self._sentences.put_nowait(rest)
+        self._sentences.put_nowait(None)
+
+    # Returns ``(audio, error)``; a failure only costs this sentence, not the narration
+    async def _synthesize(self, sentence: str):
+        async with self._semaphore:
+            try:
+                if asyncio.iscoroutinefunction(self.synthesize):
+                    audio = await self.synthesize(sentence)
+                else:
+                    audio = await asyncio.to_thread(self.synthesize, sentence)
+                return (audio, None) if audio else (None, "no audio returned")
+            except Exception as e:
+                print(f"Error narrating sentence {sentence[:40]!r}: {e}")
+                return None, str(e) or type(e).__name__
+
+    async def run(self):
+        ordered = asyncio.Queue()
+
+        # Start synthesis as each sentence arrives; the loop below waits for them in order
+        async def schedule():
+            while (sentence := await self._sentences.get()) is not None:
+                ordered.put_nowait((sentence, asyncio.create_task(self._synthesize(sentence))))
+            ordered.put_nowait(None)
+
+        scheduler = asyncio.create_task(schedule())
+        segments = []
+        try:
+            while (item := await ordered.get()) is not None:
+                sentence, task = item
+                audio, error = await task
+                if audio is None:
+                    await self.emit("on_image_audio_skipped", {
+                        "index": len(segments),
+                        "text": sentence,
+                        "error": error,
+                    })
+                    continue
+                await self.emit("on_image_audio_chunk", {
+                    "index": len(segments),
+                    "text": sentence,
+                    "audio": base64.b64encode(audio).decode("utf-8"),
+                })
+                segments.append(audio)
+        finally:
+            scheduler.cancel()
+            while not ordered.empty():
+                item = ordered.get_nowait()
+                if item is not None:
+                    item[1].cancel()
+        return b"".join(segments) or None
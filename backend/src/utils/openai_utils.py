@@ -1,17 +1,31 @@
 import os
-from openai import OpenAI, AsyncOpenAI
 from string import Template
 from dotenv import load_dotenv
+from .embedding_cache import EmbeddingCache
+from .clients import openai_client, async_openai_client
+from .context_packer import pack_context
+from .metrics import span
 
 # Load environment variables from .env file
 load_dotenv()  # This will load the .env file and make the variables available to os.getenv
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
+# Created on first use so importing this module stays cheap.
+# Shared by the query path (get_embedding) and the ingestion path (index_qdrant.vector_store)
+embedding_cache = None
+
+
+def get_embedding_cache():
+    global embedding_cache
+    if embedding_cache is None:
+        embedding_cache = EmbeddingCache.from_env()
+    return embedding_cache
+
 
 prompt_template = Template("""
 Answer the question based on the context, in a concise manner, in markdown and using bullet points where applicable.
-
+$history
 Context: $context
 Question: $question
 Answer:
@@ -19,23 +33,109 @@ Answer:
 
 
 def get_embedding(text: str):
-    return client.embeddings.create(
-        model="text-embedding-ada-002",
-        input=text,
-    ).data[0].embedding
-
-
-async def stream_completion(question: str, docs: dict):
-    context = "\n".join([doc.get("page_content") for doc in docs])
-    prompt = prompt_template.substitute(context=context, question=question)
-    response = await async_client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": prompt},
-        ],
-        stream=True
+    return get_embedding_cache().get_or_embed(EMBEDDING_MODEL, text, _create_embedding)
+
+
+def _create_embedding(text: str):
+    with span("openai", "embeddings"):
+        return openai_client().embeddings.create(
+            model=EMBEDDING_MODEL,
+            input=text,
+        ).data[0].embedding
+
+
+# Non-blocking variant for the websocket endpoints, served from the async OpenAI client
+async def async_get_embedding(text: str):
+    return await get_embedding_cache().aget_or_embed(EMBEDDING_MODEL, text, _async_create_embedding)
+
+
+async def _async_create_embedding(text: str):
+    with span("openai", "embeddings"):
+        response = await async_openai_client().embeddings.create(
+            model=EMBEDDING_MODEL,
+            input=text,
+        )
+    return response.data[0].embedding
+
+
+# Embed a batch of texts in a single request (cached texts are skipped)
+async def async_embed_documents(texts: list):
+    return await get_embedding_cache().aget_or_embed_many(EMBEDDING_MODEL, texts, _async_create_embeddings)
+
+
+async def _async_create_embeddings(texts: list):
+    with span("openai", "embeddings_batch"):
+        response = await async_openai_client().embeddings.create(
+            model=EMBEDDING_MODEL,
+            input=texts,
+        )
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+summary_prompt_template = Template("""
+Update the running summary of a reading session between a student and a tutor.
+Keep what was read, what the student asked and what they found difficult; drop small talk.
+Reply with the new summary only, at most $words words.
+
+Current summary: $summary
+
+New messages:
+$messages
+""")
+
+SUMMARY_MAX_TOKENS = 300
+
+
+def format_history(summary: str, messages) -> str:
+    if not summary and not messages:
+        return ""
+    lines = ["", "Conversation so far:"]
+    if summary:
+        lines.append(f"Summary of earlier conversation: {summary}")
+    for message in messages:
+        speaker = "Student" if message["role"] == "user" else "Assistant"
+        lines.append(f"{speaker}: {message['content']}")
+    return "\n".join(lines) + "\n"
+
+
+# Fold older session messages into the running summary (see session_store.SessionStore.compact)
+async def summarize_history(summary: str, messages) -> str:
+    prompt = summary_prompt_template.substitute(
+        words=SUMMARY_MAX_TOKENS * 2 // 3,
+        summary=summary or "(none)",
+        messages=format_history("", messages).strip(),
     )
-    async for chunk in response:
-        content = chunk.choices[0].delta.content
-        if content:
-            yield content
+    with span("openai", "summarize_history"):
+        response = await async_openai_client().chat.completions.create(
+            model="gpt-4o",
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0,
+            max_tokens=SUMMARY_MAX_TOKENS,
+        )
+    return response.choices[0].message.content.strip()
+
+
+# ``scores`` are the retrieval scores of ``docs``; the best chunks are packed first.
+# ``history`` is an optional (summary, messages) pair from the session store.
+async def stream_completion(question: str, docs: dict, scores=None, history=None):
+    # Packing stats are recorded as metrics by pack_context
+    context, _ = pack_context(docs, scores)
+    history_text = format_history(*history) if history else ""
+    prompt = prompt_template.substitute(history=history_text, context=context, question=question)
+    # Covers the request until the stream opens; time to first token is recorded per endpoint
+    with span("openai", "chat_completion"):
+        response = await async_openai_client().chat.completions.create(
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": prompt},
+            ],
+            stream=True
+        )
+    try:
+        async for chunk in response:
+            content = chunk.choices[0].delta.content
+            if content:
+                yield content
+    finally:
+        # Closing the stream drops the connection, so a cancelled or abandoned answer stops generating
+        await response.close()
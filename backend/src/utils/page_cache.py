@@ -0,0 +1,154 @@
+import os
+import re
+import time
+import hashlib
+import statistics
+from io import BytesIO
+from collections import OrderedDict
+from dotenv import load_dotenv
+from PIL import Image, ImageOps
+from .metrics import metrics
+
+# Load environment variables from .env file
+load_dotenv()  # This will load the .env file and make the variables available to os.getenv
+
+# Side of the average-hash grid. Pages of one book share a layout, so a coarse hash (8x8, 16x16)
+# cannot tell them apart; at 64x64 the individual lines and words show
+HASH_SIZE = 64
+# Frames kept per page; the camera drifts a little between captures
+FRAMES_PER_PAGE = 8
+
+PAGE_CACHE_LOOKUPS = metrics.counter(
+    "readbuddy_page_cache_lookups_total",
+    "Page cache lookups for scanned pages, by key (frame hash or OCR text) and result.",
+    ("key", "result"),
+)
+
+_non_word = re.compile(r"\W+")
+
+
+# Average hash of a frame: a HASH_SIZE x HASH_SIZE thumbnail, one bit per cell darker than the median.
+# The frame is oriented, made grayscale and contrast-stretched first; JPEGs decode at 1/8 scale
+def perceptual_hash(data: bytes) -> int:
+    image = Image.open(BytesIO(data))
+    image.draft("L", (2 * HASH_SIZE, 2 * HASH_SIZE))
+    image = ImageOps.exif_transpose(image).convert("L").resize((HASH_SIZE, HASH_SIZE), Image.BOX)
+    pixels = list(ImageOps.autocontrast(image, cutoff=1).getdata())
+    median = statistics.median(pixels)
+    return int("".join("1" if pixel < median else "0" for pixel in pixels), 2)
+
+
+# OCR of the same page varies in spacing, case and punctuation between captures
+def text_key(text: str) -> str:
+    words = _non_word.sub(" ", text.lower()).split()
+    return hashlib.sha256(" ".join(words).encode("utf-8")).hexdigest()
+
+
+class PageCache:
+    """Results of processed pages (text, explanation, image and audio URLs) for re-scans.
+
+    A frame first looks for a page whose stored frames are within
+    ``max_distance`` bits of its perceptual hash, which answers a re-capture
+    of an unchanged page without any upstream call. Otherwise the OCR text is
+    looked up by its normalized hash, which still skips the explanation,
+    illustration and narration; the new frame is then remembered for that page.
+    """
+
+    def __init__(self, max_entries: int = 500, ttl_seconds: float = 86400, max_distance: int = 32):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        self._entries = OrderedDict()
+        self._counters = {"frame_hits": 0, "text_hits": 0, "misses": 0, "stores": 0, "expired": 0, "evicted": 0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_entries=int(os.getenv("PAGE_CACHE_SIZE", "500")),
+            ttl_seconds=float(os.getenv("PAGE_CACHE_TTL_SECONDS", "86400")),
+            max_distance=int(os.getenv("PAGE_CACHE_MAX_DISTANCE", "32")),
+        )
+
+    def lookup_frame(self, frame_hash: int):
+        """Return the stored result for a near-identical frame, or None."""
+        if self.max_entries <= 0:
+            return None
+        now = time.time()
+        best, best_distance, expired = None, self.max_distance + 1, []
+        for key, entry in self._entries.items():
+            if now - entry["created_at"] > self.ttl_seconds:
+                expired.append(key)
+                continue
+            for stored in entry["frames"]:
+                distance = (frame_hash ^ stored).bit_count()
+                if distance < best_distance:
+                    best, best_distance = key, distance
+        for key in expired:
+            self._remove(key, expired=True)
+        if best is None:
+            PAGE_CACHE_LOOKUPS.inc(key="frame", result="miss")
+            return None
+        PAGE_CACHE_LOOKUPS.inc(key="frame", result="hit")
+        self._counters["frame_hits"] += 1
+        self._entries.move_to_end(best)
+        return self._entries[best]["result"]
+
+    def lookup_text(self, text: str, frame_hash: int = None):
+        """Return the stored result for the same OCR text, remembering ``frame_hash`` for the page."""
+        if self.max_entries <= 0:
+            return None
+        key = text_key(text)
+        entry = self._entries.get(key)
+        if entry is not None and time.time() - entry["created_at"] > self.ttl_seconds:
+            self._remove(key, expired=True)
+            entry = None
+        if entry is None:
+            PAGE_CACHE_LOOKUPS.inc(key="text", result="miss")
+            self._counters["misses"] += 1
+            return None
+        PAGE_CACHE_LOOKUPS.inc(key="text", result="hit")
+        self._counters["text_hits"] += 1
+        if frame_hash is not None:
+            self._add_frame(entry, frame_hash)
+        self._entries.move_to_end(key)
+        return entry["result"]
+
+    def store(self, text: str, result: dict, frame_hash: int = None):
+        """Remember a fully processed page under its OCR text (and frame)."""
+        if self.max_entries <= 0:
+            return
+        key = text_key(text)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = {"frames": [], "created_at": time.time()}
+        entry["result"] = dict(result)
+        if frame_hash is not None:
+            self._add_frame(entry, frame_hash)
+        self._entries.move_to_end(key)
+        self._counters["stores"] += 1
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self._counters["evicted"] += 1
+
+    @staticmethod
+    def _add_frame(entry, frame_hash: int):
+        if frame_hash in entry["frames"]:
+            return
+        entry["frames"].append(frame_hash)
+        del entry["frames"][:-FRAMES_PER_PAGE]
+
+    def _remove(self, key: str, expired: bool = False):
+        if self._entries.pop(key, None) is not None and expired:
+            self._counters["expired"] += 1
+
+    def stats(self):
+        hits = self._counters["frame_hits"] + self._counters["text_hits"]
+        lookups = hits + self._counters["misses"]
+        return {
+            **self._counters,
+            "entries": len(self._entries),
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+
+page_cache = PageCache.from_env()
@@ -0,0 +1,297 @@
+import os
+import time
+import asyncio
+from collections import deque
+from dotenv import load_dotenv
+from .metrics import metrics
+
+# Load environment variables from .env file
+load_dotenv()  # This will load the .env file and make the variables available to os.getenv
+
+# Start the next provider alongside one that is slower than its usual p95
+ROUTER_HEDGING = os.getenv("ROUTER_HEDGING", "true").lower() not in ("0", "false", "no")
+# Consecutive failures that open a provider's circuit, and how long it stays open before a trial call
+ROUTER_FAILURE_THRESHOLD = int(os.getenv("ROUTER_FAILURE_THRESHOLD", "5"))
+ROUTER_RESET_SECONDS = float(os.getenv("ROUTER_RESET_SECONDS", "30"))
+# Latencies kept per provider for its p95, and how many it takes before the p95 is used
+ROUTER_LATENCY_WINDOW = int(os.getenv("ROUTER_LATENCY_WINDOW", "200"))
+ROUTER_MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", "20"))
+
+HEDGE_PERCENTILE = 0.95
+
+PROVIDER_SECONDS = metrics.histogram(
+    "readbuddy_provider_seconds",
+    "Duration of routed provider calls by operation, provider and outcome "
+    "(ok, error, timeout, deadline, or cancelled when another provider answered first).",
+    ("operation", "provider", "outcome"),
+)
+PROVIDER_HEDGES = metrics.counter(
+    "readbuddy_provider_hedges_total",
+    "Hedged calls: a second provider started because the first was slower than its p95.",
+    ("operation", "provider"),
+)
+PROVIDER_REJECTED = metrics.counter(
+    "readbuddy_provider_rejected_total",
+    "Provider calls skipped because the provider's circuit was open.",
+    ("operation", "provider"),
+)
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """The request's deadline passed before any provider answered."""
+
+
+class ProviderUnavailable(Exception):
+    """Every provider for an operation failed or has its circuit open."""
+
+
+class Deadline:
+    """Point in time by which a request must be answered, shared by all of its upstream calls."""
+
+    def __init__(self, seconds: float = None):
+        self.expires_at = time.monotonic() + seconds if seconds else None
+
+    def remaining(self):
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+
+class CircuitBreaker:
+    """Stops calling a provider that keeps failing.
+
+    Closed: calls go through. After ``failure_threshold`` consecutive failures
+    the circuit opens and calls are refused. After ``reset_seconds`` one trial
+    call is let through (half-open): its success closes the circuit, its
+    failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = ROUTER_FAILURE_THRESHOLD, reset_seconds: float = ROUTER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    def allow(self) -> bool:
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+            self.state = "half_open"
+            self._trial = False
+        if self.state == "half_open" and not self._trial:
+            self._trial = True
+            return True
+        return self.state == "closed"
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._trial = False
+
+    def record_failure(self) -> bool:
+        """Count a failure; True when it opened the circuit."""
+        self.failures += 1
+        if self.state != "half_open" and self.failures < self.failure_threshold:
+            return False
+        opened = self.state != "open"
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self._trial = False
+        return opened
+
+    def release(self):
+        """An allowed call ended without a verdict (cancelled, or cut short by the deadline)."""
+        self._trial = False
+
+
+class Provider:
+    """One way to perform an operation: ``call(*args)`` is a coroutine function.
+
+    Each provider has its own circuit breaker and a window of recent
+    successful latencies, whose p95 decides when a call to it gets hedged.
+    """
+
+    def __init__(self, name: str, call, attempt_timeout: float = None):
+        self.name = name
+        self.call = call
+        self.attempt_timeout = attempt_timeout
+        self.breaker = CircuitBreaker()
+        self.latencies = deque(maxlen=ROUTER_LATENCY_WINDOW)
+
+    def p95(self):
+        if len(self.latencies) < ROUTER_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(HEDGE_PERCENTILE * len(ordered)))]
+
+    def stats(self):
+        return {"state": self.breaker.state, "failures": self.breaker.failures,
+                "samples": len(self.latencies), "p95": self.p95()}
+
+
+class ProviderRouter:
+    """Calls the providers of one operation in order, hedging slow calls and failing over on errors.
+
+    Providers whose circuit is open are skipped. When an attempt runs longer
+    than its provider's p95 (``hedge_after`` seconds until enough calls have
+    been seen), the next provider is started alongside it and the first to
+    succeed wins; the other attempt is cancelled. A failed attempt starts the
+    next provider at once. Attempts never outlive the request's ``Deadline``
+    or the provider's ``attempt_timeout``. A result that loses the race but
+    was already produced is passed to ``on_discard`` (to close a stream).
+    """
+
+    def __init__(self, operation: str, providers, hedge: bool = ROUTER_HEDGING, hedge_after: float = 2.0,
+                 on_discard=None):
+        self.operation = operation
+        self.providers = list(providers)
+        self.hedge = hedge
+        self.hedge_after = hedge_after
+        self.on_discard = on_discard
+        # Closing discarded results runs in the background; keep the tasks referenced until done
+        self._discarding = set()
+        self._counters = {"calls": 0, "hedges": 0, "failovers": 0, "rejected": 0, "deadline_exceeded": 0}
+
+    async def call(self, *args, deadline: Deadline = None, provider: str = None):
+        """Returns ``(result, provider_name)``; raises DeadlineExceeded or ProviderUnavailable.
+
+        With ``provider`` only that provider is called: no hedging, no failover.
+        """
+        deadline = deadline or Deadline()
+        self._counters["calls"] += 1
+        queue = [p for p in self.providers if provider is None or p.name == provider]
+        attempts = {}
+        last_error = None
+        hedged = False
+
+        def start_next():
+            while queue:
+                provider = queue.pop(0)
+                if provider.breaker.allow():
+                    task = asyncio.ensure_future(self._attempt(provider, args, deadline))
+                    attempts[task] = (provider, time.monotonic())
+                    return provider
+                PROVIDER_REJECTED.inc(operation=self.operation, provider=provider.name)
+                self._counters["rejected"] += 1
+            return None
+
+        if start_next() is None:
+            raise ProviderUnavailable(f"{self.operation}: every provider's circuit is open")
+        try:
+            while attempts:
+                timeout = deadline.remaining()
+                hedge_in = None
+                if self.hedge and not hedged and queue and len(attempts) == 1:
+                    provider, started = next(iter(attempts.values()))
+                    delay = provider.p95()
+                    hedge_in = max(0.0, (self.hedge_after if delay is None else delay) - (time.monotonic() - started))
+                    timeout = hedge_in if timeout is None else min(timeout, hedge_in)
+                done, _ = await asyncio.wait(attempts, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                succeeded = [task for task in done if not task.cancelled() and task.exception() is None]
+                if succeeded:
+                    provider, _ = attempts.pop(succeeded[0])
+                    for task in succeeded[1:]:
+                        attempts.pop(task)
+                        self._discard(task)
+                    return succeeded[0].result(), provider.name
+                for task in done:
+                    attempts.pop(task)
+                    last_error = None if task.cancelled() else task.exception()
+
+                # Also when an attempt's own time limit was the deadline: failing over has no time left
+                if deadline.expired:
+                    self._counters["deadline_exceeded"] += 1
+                    raise DeadlineExceeded(f"{self.operation}: no answer before the deadline") from last_error
+                if done:
+                    # The running attempts failed: move on to the next provider
+                    if not attempts:
+                        if start_next() is None:
+                            break
+                        self._counters["failovers"] += 1
+                elif hedge_in is not None:
+                    hedged = True
+                    provider = start_next()
+                    if provider is not None:
+                        PROVIDER_HEDGES.inc(operation=self.operation, provider=provider.name)
+                        self._counters["hedges"] += 1
+        finally:
+            # The losing attempt may still produce a result before the cancellation lands
+            for task in attempts:
+                task.cancel()
+                task.add_done_callback(self._discard)
+        raise ProviderUnavailable(f"{self.operation}: every provider failed ({last_error})") from last_error
+
+    async def _attempt(self, provider: Provider, args, deadline: Deadline):
+        remaining = deadline.remaining()
+        limits = [limit for limit in (remaining, provider.attempt_timeout) if limit is not None]
+        timeout = min(limits) if limits else None
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await asyncio.wait_for(provider.call(*args), timeout)
+            outcome = "ok"
+            provider.breaker.record_success()
+            provider.latencies.append(time.perf_counter() - started)
+            return result
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            provider.breaker.release()
+            raise
+        except asyncio.TimeoutError:
+            # Only a provider that used up its own time limit is at fault, not one the deadline cut short
+            if provider.attempt_timeout is not None and timeout == provider.attempt_timeout:
+                outcome = "timeout"
+                provider.breaker.record_failure()
+            else:
+                outcome = "deadline"
+                provider.breaker.release()
+            raise
+        except Exception as e:
+            print(f"{self.operation}: {provider.name} failed: {e}")
+            if provider.breaker.record_failure():
+                print(f"{self.operation}: circuit opened for {provider.name} after "
+                      f"{provider.breaker.failures} consecutive failures")
+            raise
+        finally:
+            PROVIDER_SECONDS.observe(time.perf_counter() - started, operation=self.operation,
+                                     provider=provider.name, outcome=outcome)
+
+    # A result produced by an attempt that lost the race (or finished just as it was cancelled)
+    def _discard(self, task):
+        if task.cancelled() or task.exception() is not None:
+            return
+        if self.on_discard is not None:
+            discarded = self.on_discard(task.result())
+            if asyncio.iscoroutine(discarded):
+                task = asyncio.ensure_future(discarded)
+                self._discarding.add(task)
+                task.add_done_callback(self._discarding.discard)
+
+    def stats(self):
+        return {**self._counters, "providers": {provider.name: provider.stats() for provider in self.providers}}
+
+
+class PinnedRouter:
+    """Sends every call to the provider that answered the first one, e.g. to keep one voice.
+
+    The first call goes through ``router`` as usual; calls made meanwhile wait
+    for it. If it fails, the next call is routed normally and pins instead.
+    """
+
+    def __init__(self, router: ProviderRouter):
+        self.router = router
+        self.provider = None
+        self._first = asyncio.Lock()
+
+    async def call(self, *args, deadline: Deadline = None):
+        if self.provider is None:
+            async with self._first:
+                if self.provider is None:
+                    result, self.provider = await self.router.call(*args, deadline=deadline)
+                    return result, self.provider
+        return await self.router.call(*args, deadline=deadline, provider=self.provider)
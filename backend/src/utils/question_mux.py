@@ -0,0 +1,163 @@
+import os
+import json
+import uuid
+import asyncio
+from dotenv import load_dotenv
+from fastapi import WebSocket
+from starlette.websockets import WebSocketDisconnect
+from .metrics import metrics
+
+# Load environment variables from .env file
+load_dotenv()  # This will load the .env file and make the variables available to os.getenv
+
+ASYNC_READ_MAX_IN_FLIGHT = int(os.getenv("ASYNC_READ_MAX_IN_FLIGHT", "4"))
+
+QUESTIONS_CANCELLED = metrics.counter(
+    "readbuddy_questions_cancelled_total",
+    "Questions aborted before their answer finished streaming.",
+    ("reason",),
+)
+
+
+class QuestionMultiplexer:
+    """Questions in flight on one WebSocket, each answered by its own task.
+
+    A plain-text message is a question in the original protocol: questions
+    are answered one at a time in the order they arrive, and their events go
+    out as before, without a request id or a "done" event. Clients opt in to
+    multiplexing by sending JSON instead:
+
+        {"type": "question", "question": "...", "request_id": "q1", "supersede": false}
+        {"type": "cancel", "request_id": "q1"}    (no request_id cancels every JSON question)
+
+    Every event sent back for a JSON question carries its ``request_id``; an
+    answer ends with a "done" event, or "cancelled" if it was aborted, and a
+    question with "supersede" cancels the JSON questions still in flight.
+    Cancelling a question cancels its task, which aborts the embedding,
+    search or completion stream it is waiting on.
+    """
+
+    def __init__(self, answer, send, max_in_flight: int = ASYNC_READ_MAX_IN_FLIGHT):
+        # answer(question) -> async iterator of events; send(event) is awaited for each one
+        self.answer = answer
+        self.send = send
+        self.max_in_flight = max_in_flight
+        self.tasks = {}
+        # Plain-text questions, answered in order by one task
+        self.queued = asyncio.Queue()
+        self._sequential_task = None
+
+    async def handle(self, message: str):
+        """Dispatch one message received from the client."""
+        try:
+            request = json.loads(message)
+        except ValueError:
+            request = None
+        if not isinstance(request, dict):
+            self.enqueue(message)
+            return
+        if request.get("type") == "cancel":
+            await self.cancel(request.get("request_id"))
+        elif request.get("type", "question") == "question" and request.get("question"):
+            await self.ask(request["question"], request.get("request_id"), bool(request.get("supersede", False)))
+        else:
+            await self.send({"event_type": "error", "request_id": request.get("request_id"),
+                             "content": "Expected a question or a cancel message"})
+
+    def enqueue(self, question: str):
+        """Queue a plain-text question behind the ones before it (original protocol)."""
+        self.queued.put_nowait(question)
+        if self._sequential_task is None:
+            self._sequential_task = asyncio.create_task(self._run_sequential())
+
+    async def ask(self, question: str, request_id: str = None, supersede: bool = False):
+        request_id = str(request_id or uuid.uuid4().hex)
+        if supersede:
+            await self.cancel(reason="superseded")
+        elif request_id in self.tasks:
+            await self.send({"event_type": "error", "request_id": request_id,
+                             "content": f"Request {request_id} is already in flight"})
+            return
+        elif len(self.tasks) >= self.max_in_flight:
+            await self.send({"event_type": "error", "request_id": request_id,
+                             "content": f"Too many questions in flight (max {self.max_in_flight})"})
+            return
+        self.tasks[request_id] = asyncio.create_task(self._run(request_id, question))
+
+    async def cancel(self, request_id: str = None, reason: str = "cancelled"):
+        """Abort one question (or all of them) and tell the client which ones were dropped."""
+        ids = [request_id] if request_id is not None else list(self.tasks)
+        for cancelled_id in ids:
+            task = self.tasks.pop(cancelled_id, None)
+            if task is None:
+                continue
+            await self._stop(task, reason)
+            await self.send({"event_type": "cancelled", "request_id": cancelled_id, "content": reason})
+
+    async def close(self):
+        """Abort everything still in flight; used when the WebSocket goes away."""
+        tasks, self.tasks = list(self.tasks.values()), {}
+        if self._sequential_task is not None:
+            tasks.append(self._sequential_task)
+            self._sequential_task = None
+        for task in tasks:
+            await self._stop(task, "disconnected")
+
+    @staticmethod
+    async def _stop(task, reason):
+        if task.done():
+            return
+        task.cancel()
+        QUESTIONS_CANCELLED.inc(reason=reason)
+        try:
+            await task
+        except (asyncio.CancelledError, Exception):
+            pass
+
+    async def _run(self, request_id: str, question: str):
+        try:
+            async for event in self.answer(question):
+                await self.send({**event, "request_id": request_id})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error answering question {request_id}: {e}")
+            await self.send({"event_type": "error", "request_id": request_id, "content": str(e)})
+        finally:
+            if self.tasks.get(request_id) is asyncio.current_task():
+                del self.tasks[request_id]
+
+
+    async def _run_sequential(self):
+        while True:
+            question = await self.queued.get()
+            try:
+                async for event in self.answer(question):
+                    if event["event_type"] != "done":
+                        await self.send(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error answering question: {e}")
+                await self.send({"event_type": "error", "content": str(e)})
+
+
+async def _wait_for_disconnect(websocket: WebSocket):
+    while (await websocket.receive())["type"] != "websocket.disconnect":
+        pass
+
+
+# Await ``coro`` while watching the WebSocket; if the client goes away first, cancel it and
+# raise WebSocketDisconnect. Other messages from the client are ignored meanwhile.
+async def cancel_on_disconnect(websocket: WebSocket, coro):
+    task = asyncio.ensure_future(coro)
+    watcher = asyncio.create_task(_wait_for_disconnect(websocket))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        if not task.done():
+            await QuestionMultiplexer._stop(task, "disconnected")
+            raise WebSocketDisconnect()
+        return task.result()
+    finally:
+        task.cancel()
+        watcher.cancel()
@@ -0,0 +1,299 @@
+import os
+import re
+import hashlib
+import asyncio
+from io import BytesIO
+from collections import OrderedDict
+from dotenv import load_dotenv
+import numpy as np
+from PIL import Image
+from starlette.responses import Response
+from .metrics import metrics
+
+# Load environment variables from .env file
+load_dotenv()  # This will load the .env file and make the variables available to os.getenv
+
+# Size of the reader's display; every rendition is fitted to it
+RENDITION_SIZE = (240, 240)
+RENDITION_JPEG_QUALITY = int(os.getenv("RENDITION_JPEG_QUALITY", "85"))
+RENDITION_WEBP_QUALITY = int(os.getenv("RENDITION_WEBP_QUALITY", "80"))
+# "big": high byte first, the order SPI panels (ST7789, ILI9341) read; "little" for a framebuffer in memory
+RENDITION_RGB565_BYTE_ORDER = os.getenv("RENDITION_RGB565_BYTE_ORDER", "big").lower()
+# Rendered bytes kept in memory, across all formats
+RENDITION_CACHE_MB = int(os.getenv("RENDITION_CACHE_MB", "64"))
+# Format for a client that names none (and accepts anything)
+RENDITION_DEFAULT_FORMAT = os.getenv("RENDITION_DEFAULT_FORMAT", "jpeg").lower()
+
+# Format name -> media type. rgb565 is the raw framebuffer: width * height pixels, two bytes each, row by row
+FORMATS = {
+    "rgb565": "image/x-rgb565",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+    "bmp": "image/bmp",
+}
+_format_aliases = {"jpg": "jpeg", "raw": "rgb565", "application/octet-stream": "rgb565"}
+_media_types = {media_type: name for name, media_type in FORMATS.items()}
+
+# Everything that changes the rendered bytes; part of the ETag, so a config change is a new entity
+_settings = hashlib.sha256(repr((RENDITION_SIZE, RENDITION_JPEG_QUALITY, RENDITION_WEBP_QUALITY,
+                                 RENDITION_RGB565_BYTE_ORDER)).encode()).hexdigest()[:8]
+_digest_pattern = re.compile(r"[0-9a-f]{64}")
+_range_pattern = re.compile(r"bytes=(\d*)-(\d*)")
+
+RENDITION_REQUESTS = metrics.counter(
+    "readbuddy_rendition_requests_total",
+    "Image rendition requests by format and how they were answered.",
+    ("format", "result"),
+)
+RENDITION_BYTES = metrics.counter(
+    "readbuddy_rendition_bytes_total",
+    "Image rendition bytes sent, by format.",
+    ("format",),
+)
+
+
+class Rendition:
+    """One output format of an illustration, rendered once and served from memory."""
+
+    def __init__(self, data: bytes, image_format: str, etag: str, size):
+        self.data = data
+        self.format = image_format
+        self.media_type = FORMATS[image_format]
+        self.etag = etag
+        self.size = size
+
+
+def valid_image_id(image_id: str) -> bool:
+    return bool(_digest_pattern.fullmatch(image_id or ""))
+
+
+def rendition_etag(image_id: str, image_format: str) -> str:
+    # The source is content-addressed, so the ETag is known before anything is fetched or rendered
+    return f'"{image_id[:32]}-{image_format}-{_settings}"'
+
+
+# Format for a request: the ``format`` query parameter, else the Accept header by preference,
+# else RENDITION_DEFAULT_FORMAT. None when the client accepts none of the formats
+def choose_format(requested: str = None, accept: str = None):
+    if requested:
+        name = _format_aliases.get(requested.lower(), requested.lower())
+        return name if name in FORMATS else None
+    if not accept:
+        return RENDITION_DEFAULT_FORMAT
+    candidates = []
+    for position, part in enumerate(accept.split(",")):
+        media_type, *params = [item.strip() for item in part.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if quality <= 0:
+            continue
+        media_type = media_type.lower()
+        if media_type in _media_types or media_type in _format_aliases:
+            name = _media_types.get(media_type) or _format_aliases[media_type]
+        elif media_type in ("*/*", "image/*"):
+            name = RENDITION_DEFAULT_FORMAT
+        else:
+            continue
+        # Highest q first; among equals, specific types before wildcards, then header order
+        candidates.append((-quality, "*" in media_type, position, name))
+    return min(candidates)[3] if candidates else None
+
+
+# True when an If-None-Match header matches ``etag`` (weak comparison, as RFC 9110 asks for)
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+# (start, end) inclusive for a single "bytes=" range, None to send the whole body (no range,
+# several ranges or another unit). Raises ValueError when the range cannot be satisfied
+def parse_range(range_header: str, length: int):
+    if not range_header or "," in range_header:
+        return None
+    match = _range_pattern.fullmatch(range_header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":
+        # Suffix range: the last N bytes
+        suffix = int(last)
+        if suffix == 0 or length == 0:
+            raise ValueError("empty suffix range")
+        return max(0, length - suffix), length - 1
+    start = int(first)
+    end = min(int(last), length - 1) if last else length - 1
+    if start >= length or (last and int(last) < start):
+        raise ValueError("range starts past the end")
+    return start, end
+
+
+def _fit(image):
+    image = image.convert("RGB")
+    if image.size != RENDITION_SIZE:
+        image = image.resize(RENDITION_SIZE, Image.BICUBIC)
+    return image
+
+
+def _to_rgb565(image) -> bytes:
+    pixels = np.asarray(image, dtype=np.uint16)
+    red, green, blue = pixels[..., 0], pixels[..., 1], pixels[..., 2]
+    packed = ((red & 0xF8) << 8) | ((green & 0xFC) << 3) | (blue >> 3)
+    return packed.astype(">u2" if RENDITION_RGB565_BYTE_ORDER == "big" else "<u2").tobytes()
+
+
+# Render ``source`` (any image Pillow reads) as ``image_format``, at the display size
+def render(source: bytes, image_format: str) -> bytes:
+    image = _fit(Image.open(BytesIO(source)))
+    if image_format == "rgb565":
+        return _to_rgb565(image)
+    output = BytesIO()
+    if image_format == "jpeg":
+        image.save(output, format="JPEG", quality=RENDITION_JPEG_QUALITY, optimize=True)
+    elif image_format == "webp":
+        image.save(output, format="WEBP", quality=RENDITION_WEBP_QUALITY, method=4)
+    elif image_format == "bmp":
+        image.save(output, format="BMP")
+    else:
+        raise ValueError(f"Unknown rendition format: {image_format}")
+    return output.getvalue()
+
+
+class RenditionStore:
+    """Renditions of generated illustrations, keyed by the illustration's content hash.
+
+    Each (image, format) pair is rendered once, in a worker thread, and kept
+    in a byte-bounded LRU; concurrent requests for the same pair share one
+    render. Sources registered with ``add_source()`` (the illustration
+    process_image just made) are rendered without going back to S3; any
+    other source comes from the ``load()`` callable passed to ``get()``.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._renditions = OrderedDict()
+        self._sources = OrderedDict()
+        self._bytes = 0
+        self._pending = {}
+        self._counters = {"hits": 0, "renders": 0, "source_loads": 0, "evicted": 0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(max_bytes=RENDITION_CACHE_MB * 1024 * 1024)
+
+    def add_source(self, image_id: str, data: bytes):
+        """Keep the source of a new illustration, so its first renditions need no download."""
+        self._put(self._sources, image_id, data)
+
+    async def get(self, image_id: str, image_format: str, load):
+        """The rendition of ``image_id`` as ``image_format``, or None if there is no such image.
+
+        ``load()`` is a blocking callable returning the source bytes (or None);
+        it only runs when neither the rendition nor its source is in memory.
+        """
+        key = (image_id, image_format)
+        rendition = self._renditions.get(key)
+        if rendition is not None:
+            self._renditions.move_to_end(key)
+            self._counters["hits"] += 1
+            return rendition
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = asyncio.ensure_future(self._render(image_id, image_format, load))
+            pending.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(pending)
+
+    async def _render(self, image_id: str, image_format: str, load):
+        source = self._sources.get(image_id)
+        if source is None:
+            source = await asyncio.to_thread(load)
+            if source is None:
+                return None
+            self._counters["source_loads"] += 1
+            self.add_source(image_id, source)
+        data = await asyncio.to_thread(render, source, image_format)
+        rendition = Rendition(data, image_format, rendition_etag(image_id, image_format), RENDITION_SIZE)
+        self._counters["renders"] += 1
+        self._put(self._renditions, (image_id, image_format), rendition)
+        return rendition
+
+    def _put(self, entries, key, value):
+        size = self._size(value)
+        if size > self.max_bytes:
+            return
+        if key in entries:
+            self._bytes -= self._size(entries.pop(key))
+        entries[key] = value
+        self._bytes += size
+        # Sources go first, least recently used first: once an image has been rendered,
+        # its source is only needed for a format nobody has asked for yet
+        while self._bytes > self.max_bytes:
+            oldest = self._sources if self._sources else self._renditions
+            self._bytes -= self._size(oldest.popitem(last=False)[1])
+            self._counters["evicted"] += 1
+
+    @staticmethod
+    def _size(value) -> int:
+        return len(value) if isinstance(value, bytes) else len(value.data)
+
+    def stats(self):
+        return {
+            **self._counters,
+            "renditions": len(self._renditions),
+            "sources": len(self._sources),
+            "bytes": self._bytes,
+        }
+
+
+def _response_headers(etag: str) -> dict:
+    return {
+        "ETag": etag,
+        # Content-addressed: the bytes behind this URL and format never change
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Vary": "Accept",
+        "Accept-Ranges": "bytes",
+        "X-Image-Width": str(RENDITION_SIZE[0]),
+        "X-Image-Height": str(RENDITION_SIZE[1]),
+    }
+
+
+# 304 response when the client already has this rendition, else None. The ETag is derived
+# from the id, so this needs neither the source nor a render
+def not_modified_response(image_id: str, image_format: str, headers):
+    etag = rendition_etag(image_id, image_format)
+    if not etag_matches(headers.get("if-none-match"), etag):
+        return None
+    RENDITION_REQUESTS.inc(format=image_format, result="not_modified")
+    return Response(status_code=304, headers=_response_headers(etag))
+
+
+# HTTP response for a rendition: 206 for a single byte range (unless If-Range names another
+# entity), 416 for a range past the end, else 200
+def rendition_response(rendition: Rendition, headers) -> Response:
+    response_headers = _response_headers(rendition.etag)
+    data = rendition.data
+    if_range = headers.get("if-range")
+    try:
+        byte_range = parse_range(headers.get("range"), len(data)) if not if_range or if_range == rendition.etag else None
+    except ValueError:
+        RENDITION_REQUESTS.inc(format=rendition.format, result="range_not_satisfiable")
+        return Response(status_code=416, headers={**response_headers, "Content-Range": f"bytes */{len(data)}"})
+    if byte_range is None:
+        RENDITION_REQUESTS.inc(format=rendition.format, result="full")
+        RENDITION_BYTES.inc(len(data), format=rendition.format)
+        return Response(content=data, media_type=rendition.media_type, headers=response_headers)
+    start, end = byte_range
+    RENDITION_REQUESTS.inc(format=rendition.format, result="partial")
+    RENDITION_BYTES.inc(end - start + 1, format=rendition.format)
+    return Response(content=data[start:end + 1], status_code=206, media_type=rendition.media_type,
+                    headers={**response_headers, "Content-Range": f"bytes {start}-{end}/{len(data)}"})
+
+
+rendition_store = RenditionStore.from_env()
@@ -0,0 +1,258 @@
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from .context_packer import count_tokens
+
+# Load environment variables from .env file
+load_dotenv()  # This will load the .env file and make the variables available to os.getenv
+
+# Messages (questions and answers) kept verbatim after a compaction. Compaction starts once a
+# session holds twice as many, so the summarizer runs every few questions rather than on each one
+SESSION_RECENT_MESSAGES = int(os.getenv("SESSION_RECENT_MESSAGES", "6"))
+# Upper bound on the history put in a prompt (summary plus recent messages)
+SESSION_HISTORY_TOKENS = int(os.getenv("SESSION_HISTORY_TOKENS", "1000"))
+
+# Rough per-message bookkeeping on top of the text itself, for the memory cap
+MESSAGE_OVERHEAD_BYTES = 64
+
+
+class Session:
+    def __init__(self, session_id: str, summary: str = "", messages=None, updated_at: float = None):
+        self.id = session_id
+        self.summary = summary
+        self.messages = list(messages or [])
+        self.updated_at = updated_at or time.time()
+        self.compacting = False
+
+    def size_bytes(self) -> int:
+        return len(self.summary) + sum(len(m["content"]) + MESSAGE_OVERHEAD_BYTES for m in self.messages)
+
+    def to_dict(self):
+        return {"session_id": self.id, "summary": self.summary, "messages": self.messages,
+                "updated_at": self.updated_at}
+
+
+class SessionStore:
+    """Conversation history per session id, bounded by count, age and memory.
+
+    Sessions are kept in LRU order; a session idle for longer than
+    ``ttl_seconds`` expires, and the least recently used sessions are evicted
+    once there are more than ``max_sessions`` or they hold more than
+    ``max_bytes`` of text. With ``path`` every change is also written to
+    SQLite, so sessions evicted from memory (or lost to a restart) are loaded
+    back on their next question until they expire. The async_* methods run
+    the SQLite work in a worker thread, so the event loop never waits on disk.
+    """
+
+    def __init__(self, max_sessions: int = 1000, ttl_seconds: float = 4 * 3600,
+                 max_bytes: int = 64 * 1024 * 1024, path: str = None):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.path = path
+        self._sessions = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._db = None
+        self._tasks = set()
+        self._counters = {"created": 0, "loaded": 0, "expired": 0, "evicted": 0, "compactions": 0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_sessions=int(os.getenv("SESSION_MAX_SESSIONS", "1000")),
+            ttl_seconds=float(os.getenv("SESSION_TTL_SECONDS", str(4 * 3600))),
+            max_bytes=int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024))),
+            path=os.getenv("SESSION_STORE_PATH") or None,
+        )
+
+    # SQLite is opened on first use so importing this module stays cheap
+    def _get_db(self):
+        if self._db is None and self.path:
+            try:
+                self._db = sqlite3.connect(self.path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("PRAGMA synchronous=NORMAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS sessions ("
+                    "id TEXT PRIMARY KEY, summary TEXT NOT NULL, messages TEXT NOT NULL, updated_at REAL NOT NULL)"
+                )
+                self._db.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions(updated_at)")
+                self._db.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.ttl_seconds,))
+                self._db.commit()
+            except sqlite3.Error as e:
+                # Persistence is optional; keep serving from memory
+                print(f"Session store disabled on-disk persistence ({self.path}): {e}")
+                self.path = None
+                self._db = None
+        return self._db
+
+    def get(self, session_id: str) -> Session:
+        """Return the session, loading it from disk or creating it if needed."""
+        with self._lock:
+            now = time.time()
+            session = self._sessions.get(session_id)
+            if session is not None and now - session.updated_at > self.ttl_seconds:
+                self._remove(session_id, expired=True)
+                session = None
+            if session is None:
+                session = self._load(session_id, now)
+                if session is None:
+                    session = Session(session_id)
+                    self._counters["created"] += 1
+                self._sessions[session_id] = session
+                self._bytes += session.size_bytes()
+                self._evict(keep=session_id)
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def append(self, session_id: str, question: str, answer: str):
+        """Record one question/answer exchange."""
+        with self._lock:
+            session = self.get(session_id)
+            before = session.size_bytes()
+            session.messages.append({"role": "user", "content": question})
+            session.messages.append({"role": "assistant", "content": answer})
+            session.updated_at = time.time()
+            self._bytes += session.size_bytes() - before
+            self._save(session)
+            self._evict(keep=session_id)
+
+    def history(self, session_id: str, max_tokens: int = SESSION_HISTORY_TOKENS):
+        """``(summary, messages)`` for a prompt: the newest messages that fit ``max_tokens`` with the summary."""
+        with self._lock:
+            session = self.get(session_id)
+            summary, messages = session.summary, list(session.messages)
+        budget = max_tokens - count_tokens(summary)
+        recent = []
+        for message in reversed(messages):
+            budget -= count_tokens(message["content"])
+            if budget < 0:
+                break
+            recent.append(message)
+        return summary, recent[::-1]
+
+    async def async_history(self, session_id: str, max_tokens: int = SESSION_HISTORY_TOKENS):
+        return await self._offload(self.history, session_id, max_tokens)
+
+    async def async_append(self, session_id: str, question: str, answer: str):
+        await self._offload(self.append, session_id, question, answer)
+
+    # With persistence the call may load, save or delete rows, so it runs in a worker thread
+    async def _offload(self, function, *args):
+        if self.path is None:
+            return function(*args)
+        return await asyncio.to_thread(function, *args)
+
+    def needs_compaction(self, session_id: str) -> bool:
+        session = self._sessions.get(session_id)
+        if session is None or session.compacting:
+            return False
+        return len(session.messages) >= 2 * SESSION_RECENT_MESSAGES
+
+    async def compact(self, session_id: str, summarize):
+        """Fold all but the newest SESSION_RECENT_MESSAGES messages into the running summary.
+
+        ``summarize(summary, messages)`` is awaited outside the lock; messages
+        appended meanwhile are kept, since only the folded ones are removed.
+        """
+        started = await self._offload(self._start_compaction, session_id)
+        if started is None:
+            return
+        session, folded, summary = started
+        try:
+            new_summary = await summarize(summary, folded)
+            await self._offload(self._finish_compaction, session, folded, new_summary)
+        except Exception as e:
+            print(f"Error summarizing session {session_id}: {e}")
+        finally:
+            session.compacting = False
+
+    def _start_compaction(self, session_id: str):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session.compacting or len(session.messages) <= SESSION_RECENT_MESSAGES:
+                return None
+            session.compacting = True
+            return session, session.messages[:len(session.messages) - SESSION_RECENT_MESSAGES], session.summary
+
+    def _finish_compaction(self, session: Session, folded, new_summary: str):
+        with self._lock:
+            if self._sessions.get(session.id) is not session:
+                return
+            before = session.size_bytes()
+            session.summary = new_summary
+            del session.messages[:len(folded)]
+            self._bytes += session.size_bytes() - before
+            self._counters["compactions"] += 1
+            self._save(session)
+
+    # Run compact() in the background so the answer stream never waits for the summary
+    def schedule_compaction(self, session_id: str, summarize):
+        if not self.needs_compaction(session_id):
+            return None
+        task = asyncio.create_task(self.compact(session_id, summarize))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _evict(self, keep: str = None):
+        now = time.time()
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session_id == keep or now - session.updated_at <= self.ttl_seconds:
+                break
+            self._remove(session_id, expired=True)
+        while len(self._sessions) > 1 and (len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes):
+            session_id = next(iter(self._sessions))
+            if session_id == keep:
+                self._sessions.move_to_end(session_id)
+                session_id = next(iter(self._sessions))
+            self._remove(session_id)
+            self._counters["evicted"] += 1
+
+    def _remove(self, session_id: str, expired: bool = False):
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            return
+        self._bytes -= session.size_bytes()
+        if expired:
+            self._counters["expired"] += 1
+            db = self._get_db()
+            if db is not None:
+                db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+                db.commit()
+
+    def _load(self, session_id: str, now: float):
+        db = self._get_db()
+        if db is None:
+            return None
+        row = db.execute("SELECT summary, messages, updated_at FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None or now - row[2] > self.ttl_seconds:
+            return None
+        self._counters["loaded"] += 1
+        return Session(session_id, row[0], json.loads(row[1]), row[2])
+
+    def _save(self, session: Session):
+        db = self._get_db()
+        if db is None:
+            return
+        try:
+            db.execute(
+                "INSERT OR REPLACE INTO sessions (id, summary, messages, updated_at) VALUES (?, ?, ?, ?)",
+                (session.id, session.summary, json.dumps(session.messages), session.updated_at),
+            )
+            db.commit()
+        except sqlite3.Error as e:
+            print(f"Error saving session {session.id}: {e}")
+
+    def stats(self):
+        return {**self._counters, "sessions": len(self._sessions), "bytes": self._bytes}
+
+
+session_store = SessionStore.from_env()
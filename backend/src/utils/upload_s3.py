@@ -1,14 +1,25 @@
 from fastapi import FastAPI, UploadFile
-import boto3
-from botocore.exceptions import NoCredentialsError
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError, NoCredentialsError
 import os
-import base64
+import time
+import hashlib
+import asyncio
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 from dotenv import load_dotenv
-from openai import OpenAI
-import requests
 from PIL import Image
 from io import BytesIO
-import google.generativeai as genai
+from .clients import async_openai_client, async_http_client, boto3_client, gemini_model
+from .stage_graph import Stage, run_stage_graph, timed_stage
+from .metrics import span
+from .image_prep import IMAGE_NORMALIZE, prepare_image
+from .page_cache import page_cache, perceptual_hash
+from .narration import NARRATION_MODE, Narrator
+from .renditions import rendition_store
+from .provider_router import Deadline, PinnedRouter, Provider, ProviderRouter
 # import pytesseract
 # import matplotlib.pyplot as plt
 
@@ -21,14 +32,36 @@ AWS_SECRET_KEY = os.getenv("AWS_SECRET_KEY")
 S3_BUCKET = 'scanimage'
 S3_REGION = 'us-east-2'  # Example region
 
-# Initialize the S3 client
-s3 = boto3.client(
-    's3',
-    aws_access_key_id=AWS_ACCESS_KEY,
-    aws_secret_access_key=AWS_SECRET_KEY,
-    region_name=S3_REGION
+# The S3 and Polly clients come from the shared registry (created on first use, then reused)
+
+# Time a scanned page has to be answered in; every routed upstream call stops at it
+PROCESS_IMAGE_DEADLINE_SECONDS = float(os.getenv("PROCESS_IMAGE_DEADLINE_SECONDS", "60"))
+
+# Assets are stored under the SHA-256 of their content, so a key never changes meaning:
+# concurrent requests cannot overwrite each other and caches may keep objects forever
+S3_ASSET_PREFIX = os.getenv("S3_ASSET_PREFIX", "assets/")
+S3_CACHE_CONTROL = os.getenv("S3_CACHE_CONTROL", "public, max-age=31536000, immutable")
+# Hand out presigned GET URLs instead of plain object URLs (for a private bucket)
+S3_PRESIGN_URLS = os.getenv("S3_PRESIGN_URLS", "false").lower() in ("1", "true", "yes")
+S3_PRESIGN_EXPIRES_SECONDS = int(os.getenv("S3_PRESIGN_EXPIRES_SECONDS", str(7 * 24 * 3600)))
+# Multipart uploads: parts of S3_MULTIPART_CHUNK_MB, up to S3_MAX_CONCURRENCY at once
+transfer_config = TransferConfig(
+    multipart_threshold=int(os.getenv("S3_MULTIPART_THRESHOLD_MB", "8")) * 1024 * 1024,
+    multipart_chunksize=int(os.getenv("S3_MULTIPART_CHUNK_MB", "8")) * 1024 * 1024,
+    max_concurrency=int(os.getenv("S3_MAX_CONCURRENCY", "10")),
+    use_threads=True,
 )
 
+# Illustrations are stored as the 240x240 BMP the reader displays; only the extension ends up in the key
+ILLUSTRATION_FILE_NAME = "resized_image_240x240.bmp"
+
+# Keys known to exist, so a repeated asset skips even the HEAD request
+KNOWN_KEYS_MAX = 10000
+_known_keys = OrderedDict()
+# One lock per key being uploaded, so concurrent uploads of the same asset upload it once
+_key_locks = {}
+_keys_guard = threading.Lock()
+
 # Function to download and perform OCR on an image
 # def extract_text_from_image_url(image_url):
 #     response = requests.get(image_url)
@@ -42,19 +75,120 @@ s3 = boto3.client(
 #     return text.strip()
 
 
-# Upload image to S3 bucket
+# SHA-256 of a file object, leaving it readable from the start. A stream that cannot seek
+# back is copied into a spooled temporary file while it is hashed
+def _hash_file(file_obj):
+    digest = hashlib.sha256()
+    if file_obj.seekable():
+        start = file_obj.tell()
+        for chunk in iter(lambda: file_obj.read(1024 * 1024), b""):
+            digest.update(chunk)
+        file_obj.seek(start)
+        return digest.hexdigest(), file_obj
+    copy = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    for chunk in iter(lambda: file_obj.read(1024 * 1024), b""):
+        digest.update(chunk)
+        copy.write(chunk)
+    copy.seek(0)
+    return digest.hexdigest(), copy
+
+
+def asset_key(digest: str, file_name: str) -> str:
+    extension = os.path.splitext(file_name)[1].lower()
+    return f"{S3_ASSET_PREFIX}{digest}{extension}"
+
+
+# URL a client can fetch the object from: presigned with S3_PRESIGN_URLS, else the public URL
+def asset_url(key: str) -> str:
+    if S3_PRESIGN_URLS:
+        return boto3_client('s3', S3_REGION).generate_presigned_url(
+            "get_object", Params={"Bucket": S3_BUCKET, "Key": key}, ExpiresIn=S3_PRESIGN_EXPIRES_SECONDS,
+        )
+    return f"https://{S3_BUCKET}.s3.{S3_REGION}.amazonaws.com/{key}"
+
+
+@contextmanager
+def _key_lock(key: str):
+    with _keys_guard:
+        entry = _key_locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _keys_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _key_locks[key]
+
+
+def _object_exists(client, key: str) -> bool:
+    with _keys_guard:
+        if key in _known_keys:
+            _known_keys.move_to_end(key)
+            return True
+    try:
+        with span("s3", "head"):
+            client.head_object(Bucket=S3_BUCKET, Key=key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+    _remember_key(key)
+    return True
+
+
+def _remember_key(key: str):
+    with _keys_guard:
+        _known_keys[key] = True
+        _known_keys.move_to_end(key)
+        while len(_known_keys) > KNOWN_KEYS_MAX:
+            _known_keys.popitem(last=False)
+
+
+# Bytes of an asset, or None if there is no such object
+def download_asset(key: str):
+    try:
+        with span("s3", "download"):
+            return boto3_client('s3', S3_REGION).get_object(Bucket=S3_BUCKET, Key=key)["Body"].read()
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+
+
+# Id of an illustration (the content hash in its key), used by the rendition endpoint
+def image_id_from_key(key: str) -> str:
+    return os.path.splitext(os.path.basename(key))[0]
+
+
+def illustration_key(image_id: str) -> str:
+    return asset_key(image_id, ILLUSTRATION_FILE_NAME)
+
+
+# Upload a file to S3 under the hash of its content; ``file_name`` only contributes the extension.
+# An object that is already there is not uploaded again. Returns the file URL and key, and
+# whether this call uploaded it
 def upload_to_s3(file_obj, file_name, content_type="application/octet-stream"):
     bucket_name = S3_BUCKET
     try:
-        s3.upload_fileobj(
-            file_obj, 
-            bucket_name, 
-            file_name,
-            ExtraArgs={'ContentType': content_type}
-        )
-        file_url = f"https://{bucket_name}.s3.{S3_REGION}.amazonaws.com/{file_name}"
-        # print("DBUG: ", extract_text_from_image_url(file_url))
-        return {"file_url": file_url}
+        digest, file_obj = _hash_file(file_obj)
+        key = asset_key(digest, file_name)
+        client = boto3_client('s3', S3_REGION)
+        uploaded = False
+        with _key_lock(key):
+            if not _object_exists(client, key):
+                with span("s3", "upload"):
+                    client.upload_fileobj(
+                        file_obj,
+                        bucket_name,
+                        key,
+                        ExtraArgs={'ContentType': content_type, 'CacheControl': S3_CACHE_CONTROL},
+                        Config=transfer_config,
+                    )
+                _remember_key(key)
+                uploaded = True
+        return {"file_url": asset_url(key), "key": key, "uploaded": uploaded}
     except NoCredentialsError:
         return {"error": "AWS credentials not available"}
     
@@ -64,265 +198,530 @@ async def encode_image_to_base64(file: UploadFile):
     # Read the file content asynchronously
     file_content = await file.read()
 
-    # Encode the image in base64
-    base64_image = base64.b64encode(file_content).decode('utf-8')
+    # Downscale and re-encode, then convert to a data URL labelled with the real format
+    image = await prepare_image(file_content, "upload")
+    return image.to_data_url()
 
-    # Convert to a data URL format (assuming PNG, modify if other formats are possible)
-    base64_img_str = f"data:image/png;base64,{base64_image}"
+# Function to extract text from an image using Google Gemini 1.5 Pro
+async def _gemini_ocr(image):
+    # Gemini 1.5 Pro model, configured once from GOOGLE_GEMINI_API_KEY
+    model = gemini_model("gemini-1.5-pro")
 
-    return base64_img_str
+    # Prepare the prompt
+    prompt = "Extract the text from this image with high accuracy."
 
-# Function to extract text from an image using Google Gemini 1.5 Pro
-async def extract_text_with_gemini(file: UploadFile):
+    # Send the image and prompt to the Gemini model
+    with span("gemini", "ocr"):
+        response = await model.generate_content_async(
+            [{'mime_type': image.mime_type, 'data': image.to_base64()}, prompt]
+        )
+    return response.text
+
+
+# Function to extract text from an image (URL or data URL) using GPT-4o vision
+async def _openai_vision_ocr(image_url: str):
+    with span("openai", "vision_ocr"):
+        response = await async_openai_client().chat.completions.create(
+            model='gpt-4o',
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": vision_ocr_prompt,
+                        },
+                        {
+                            "type": "image_url",
+                            "image_url": {"url": image_url}
+                        }
+                    ],
+                }
+            ],
+            temperature=0,
+            max_tokens=500,
+        )
+    return response.choices[0].message.content if response and response.choices else None
+
+
+# Extract the text of a camera frame: Gemini 1.5 Pro, hedged with and failing over to GPT-4o vision.
+# Returns the text and the provider that read it
+async def extract_text(file_content: bytes, deadline: Deadline = None):
+    # Downscale and re-encode the camera frame once, for whichever provider answers
+    image = await prepare_image(file_content, "ocr")
+    extracted_text, provider = await ocr_router.call(image, deadline=deadline)
+    if not extracted_text or not extracted_text.strip():
+        raise ValueError("No text extracted from the image.")
+    return extracted_text.strip(), provider
+
+vision_ocr_prompt = (
+    # "Can you please explain the text contained in the attached picture?"
+    "Please extract the text from the attached screenshot with high accuracy, ensuring "
+    "that all punctuation, capitalization, and formatting are preserved as closely as possible. "
+    "The goal is to capture the full text exactly as it appears in the image, without any "
+    "additional characters or missing content. Pay attention to any special characters, italics, "
+    "or unusual spacing to ensure the extracted text matches the original formatting."
+)
+
+explanation_prompt = (
+    "You are an experienced tutor who teaches middle school kids."
+    "The following text is from a book. Explain it in a simple, engaging, and supportive way."
+    "Make the explanation suitable for neurodivergent students. Use short, clear sentences."
+    "Keep the response under 80 words. Here is the text: "
+)
+
+illustration_prompt = (
+    "Create a detailed and expressive image based on the following text: \n"
+    "$explanation"
+    "\nThe scene should feel grounded in reality, with soft lighting and a tranquil, serene atmosphere. "
+    "Use subtle, muted colors to convey calmness but include some visual contrast to highlight the emotions. "
+)
+
+
+def _resize_to_bmp(image_bytes):
+    image = Image.open(BytesIO(image_bytes))
+
+    # Resize the image to 240x240
+    resized_image = image.resize((240, 240))
+
+    resized_image_io = BytesIO()
+    resized_image.save(resized_image_io, format="bmp")
+    resized_image_io.seek(0)
+    return resized_image_io
+
+
+async def _no_emit(event_type, content):
+    pass
+
+
+# Open a chat completion stream and wait for its first token, so that providers race on the
+# time to first token. Returns the first token and an async generator of the rest
+async def _open_openai_stream(model, prompt):
+    with span("openai", "explanation"):
+        response = await async_openai_client().chat.completions.create(
+            model=model,
+            messages=[
+                {
+                    "role": "user",
+                    "content": [{"type": "text", "text": prompt}],
+                }
+            ],
+            temperature=0.7,
+            max_tokens=500,
+            stream=True,
+        )
+
+    async def tokens():
+        try:
+            async for chunk in response:
+                content = chunk.choices[0].delta.content if chunk.choices else None
+                if content:
+                    yield content
+        finally:
+            await response.close()
+
+    return await _first_token(tokens())
+
+
+async def _open_gemini_stream(model_name, prompt):
+    with span("gemini", "explanation"):
+        response = await gemini_model(model_name).generate_content_async(prompt, stream=True)
+
+    async def tokens():
+        async for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+    return await _first_token(tokens())
+
+
+async def _first_token(tokens):
     try:
-        # Load the API key from environment variables
-        api_key = os.getenv("GOOGLE_GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("Google Gemini API key is missing. Please set it in the .env file.")
+        return await anext(tokens, ""), tokens
+    except BaseException:
+        await tokens.aclose()
+        raise
 
-        # Configure the Gemini API with the provided API key
-        genai.configure(api_key=api_key)
 
-        # Read the uploaded image file content
-        file_content = await file.read()
+# A stream that lost the race to another provider
+def _close_stream(opened):
+    return opened[1].aclose()
 
-        # Encode the image as base64
-        base64_image = base64.b64encode(file_content).decode('utf-8')
 
-        # Initialize the Gemini 1.5 Pro model
-        model = genai.GenerativeModel(model_name="gemini-1.5-pro")
+# Stream an explanation through ``router``, emitting each token; returns the full text and the provider.
+# Providers race on the first token, and the rest of the stream also has to arrive before the deadline
+async def _stream_chat_text(router, prompt, emit, deadline: Deadline = None):
+    (first, tokens), provider = await router.call(prompt, deadline=deadline)
+    parts = []
+    try:
+        async with asyncio.timeout(deadline.remaining() if deadline else None):
+            if first:
+                parts.append(first)
+                await emit("on_image_explanation_stream", first)
+            async for content in tokens:
+                parts.append(content)
+                await emit("on_image_explanation_stream", content)
+    finally:
+        await tokens.aclose()
+    return "".join(parts), provider
+
+
+# Function to generate an illustration with DALL-E
+async def _generate_illustration(model, prompt):
+    with span("openai", "image_generation"):
+        response = await async_openai_client().images.generate(
+            model=model,
+            prompt=prompt,
+            **ILLUSTRATION_OPTIONS[model],
+        )
+    return response.data[0].url if response and response.data else None
+
 
-        # Prepare the prompt
-        prompt = "Extract the text from this image with high accuracy."
+# The illustration is shown at 240x240, so the DALL-E 2 fallback asks for a smaller, faster image
+ILLUSTRATION_OPTIONS = {
+    "dall-e-3": {"size": "1024x1024", "style": "vivid"},
+    "dall-e-2": {"size": "512x512"},
+}
 
-        # Send the image and prompt to the Gemini model
-        response = model.generate_content(
-            [{'mime_type': 'image/jpeg', 'data': base64_image}, prompt]
+
+def _synthesize_speech(text):
+    polly_client = boto3_client("polly", S3_REGION)
+    with span("polly", "synthesize_speech"):
+        polly_response = polly_client.synthesize_speech(
+            Text=text,
+            OutputFormat="mp3",
+            VoiceId="Joanna",
         )
+        # Save the MP3 to a BytesIO object
+        return BytesIO(polly_response["AudioStream"].read())
 
-        # Parse the response to get the extracted text
-        extracted_text = response.text
-        if not extracted_text:
-            raise ValueError("No text extracted from the image.")
 
-        return extracted_text.strip()
+def _synthesize_speech_bytes(text):
+    return _synthesize_speech(text).getvalue()
+
+
+async def _polly_speech(text):
+    return await asyncio.to_thread(_synthesize_speech_bytes, text)
+
+
+# Function to generate MP3 using OpenAI text to speech
+async def _openai_speech(text):
+    with span("openai", "speech"):
+        response = await async_openai_client().audio.speech.create(
+            model="tts-1",
+            voice="nova",
+            input=text,
+            response_format="mp3",
+        )
+    return response.content
+
+
+# Upstream providers of each step, in order of preference. A call slower than its provider's p95
+# is hedged with the next one; a failing provider's circuit opens and it is skipped for a while
+ocr_router = ProviderRouter("ocr", [
+    Provider("gemini:gemini-1.5-pro", _gemini_ocr),
+    Provider("openai:gpt-4o", lambda image: _openai_vision_ocr(image.to_data_url())),
+], hedge_after=4.0)
+vision_ocr_router = ProviderRouter("vision_ocr", [
+    Provider("openai:gpt-4o", _openai_vision_ocr),
+])
+explanation_router = ProviderRouter("explanation", [
+    Provider("openai:gpt-4o", lambda prompt: _open_openai_stream("gpt-4o", prompt)),
+    Provider("gemini:gemini-1.5-flash", lambda prompt: _open_gemini_stream("gemini-1.5-flash", prompt)),
+], hedge_after=2.0, on_discard=_close_stream)
+url_explanation_router = ProviderRouter("url_explanation", [
+    Provider("openai:gpt-4", lambda prompt: _open_openai_stream("gpt-4", prompt)),
+    Provider("gemini:gemini-1.5-flash", lambda prompt: _open_gemini_stream("gemini-1.5-flash", prompt)),
+], hedge_after=2.0, on_discard=_close_stream)
+# A hedged image is paid for in full, so DALL-E only fails over (after attempt_timeout at the latest)
+illustration_router = ProviderRouter("illustration", [
+    Provider("openai:dall-e-3", lambda prompt: _generate_illustration("dall-e-3", prompt), attempt_timeout=40.0),
+    Provider("openai:dall-e-2", lambda prompt: _generate_illustration("dall-e-2", prompt)),
+], hedge=False)
+speech_router = ProviderRouter("speech", [
+    Provider("polly", _polly_speech),
+    Provider("openai:tts-1", _openai_speech),
+], hedge_after=3.0)
+routers = (ocr_router, vision_ocr_router, explanation_router, url_explanation_router, illustration_router, speech_router)
 
-    except Exception as e:
-        raise ValueError(f"Error with Gemini 1.5 Pro: {e}")
 
 # Function to process image and call OpenAI API
-async def process_image(file: UploadFile):
-    response_data = {}
-    try:
-        # Step 1: Extract text using Google Gemini 1.5 Pro
+#
+# Stages run as an async graph: page lookup -> OCR -> explanation, then the illustration branch
+# (DALL-E, download, resize, S3) and the narration branch (Polly, S3) run concurrently.
+# Blocking SDK calls run in worker threads so the event loop stays free.
+# ``emit(event_type, content)`` is awaited as each result becomes available:
+# on_image_text, on_image_explanation_stream tokens, on_image_explanation,
+# then on_image_audio / on_image_url in whichever order they finish.
+# With NARRATION_MODE=streaming each sentence of the explanation is narrated as soon as it
+# is complete and sent as an on_image_audio_chunk event, in order, while the explanation is
+# still streaming; the chunks joined together are uploaded for on_image_audio. A sentence
+# that could not be narrated is reported as on_image_audio_skipped instead of its chunk.
+# A page seen before (same frame, or same OCR text) is answered from the page cache:
+# the stored results are emitted in the same order and the remaining stages are skipped.
+# Upstream calls go through the provider routers; they, the illustration download and the S3
+# uploads stop at ``deadline`` (PROCESS_IMAGE_DEADLINE_SECONDS from now by default); "providers" says who answered each step.
+async def process_image(image_bytes: bytes, emit=_no_emit, deadline: Deadline = None):
+    deadline = deadline or Deadline(PROCESS_IMAGE_DEADLINE_SECONDS)
+    response_data = {"text": None, "page_cache": None, "providers": {}}
+    page = {"frame_hash": None, "cached": None, "keys": {}}
+
+    # Every narrated sentence uses the voice that spoke the first one
+    narration_voice = PinnedRouter(speech_router)
+
+    async def synthesize(text):
+        audio, response_data["providers"]["speech"] = await narration_voice.call(text, deadline=deadline)
+        return audio
+
+    narrator = Narrator(synthesize, emit) if NARRATION_MODE == "streaming" else None
+
+    # Step 0: Look the frame up by its perceptual hash (a few ms, before any normalizing)
+    async def page_lookup():
+        try:
+            page["frame_hash"] = await asyncio.to_thread(perceptual_hash, image_bytes)
+        except Exception as e:
+            print(f"Error hashing image: {e}")
+            return None
+        page["cached"] = page_cache.lookup_frame(page["frame_hash"])
+        if page["cached"] is not None:
+            response_data["page_cache"] = "frame"
+        return page["frame_hash"]
+
+    # Step 1: Extract text using Google Gemini 1.5 Pro (or GPT-4o vision), then look the page up by its text
+    async def ocr(frame_hash):
         try:
-            extracted_text = await extract_text_with_gemini(file)
-            print(f"Extracted Text:\n{extracted_text}")
+            if page["cached"] is not None:
+                extracted_text = page["cached"]["text"]
+            else:
+                extracted_text, response_data["providers"]["ocr"] = await extract_text(image_bytes, deadline)
+                print(f"Extracted Text:\n{extracted_text}")
+                page["cached"] = page_cache.lookup_text(extracted_text, frame_hash)
+                if page["cached"] is not None:
+                    response_data["page_cache"] = "text"
             response_data["text"] = extracted_text
+            await emit("on_image_text", extracted_text)
+            return extracted_text
         except Exception as e:
-            print(f"Error extracting text with Gemini: {e}")
-            response_data["text"] = None
-
-        # Step 2: Generate explanation using OpenAI GPT
-        explanation_text = None
-        if response_data.get("text"):
-            try:
-                client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-                response2 = client.chat.completions.create(
-                    model='gpt-4o',
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": [
-                                {
-                                    "type": "text",
-                                    "text": (
-                                        "You are an experienced tutor who teaches middle school kids."
-                                        "The following text is from a book. Explain it in a simple, engaging, and supportive way."
-                                        "Make the explanation suitable for neurodivergent students. Use short, clear sentences."
-                                        "Keep the response under 80 words. Here is the text: " + extracted_text
-                                    ),
-                                },
-                            ],
-                        }
-                    ],
-                    temperature=0.7,
-                    max_tokens=500,
-                )
-                explanation_text = response2.choices[0].message.content if response2 and response2.choices else None
-                if explanation_text:
-                    response_data["explanation_text"] = explanation_text
-                else:
-                    raise ValueError("Failed to generate explanation text.")
-            except Exception as e:
-                print(f"Error generating explanation with GPT: {e}")
-                response_data["explanation_text"] = None
-
-        # Step 3: Generate image using DALL-E
-        resized_image_url = None
-        if explanation_text:
-            try:
-                response3 = client.images.generate(
-                    model="dall-e-3",
-                    prompt=(
-                        "Create a detailed and expressive image based on the following text: \n"
-                        + explanation_text +
-                        "\nThe scene should feel grounded in reality, with soft lighting and a tranquil, serene atmosphere. "
-                        "Use subtle, muted colors to convey calmness but include some visual contrast to highlight the emotions. "
-                    ),
-                    size="1024x1024",
-                    style="vivid"
-                )
-
-                # Download and resize the generated image
-                image_url = response3.data[0].url
-                response = requests.get(image_url)
-                image = Image.open(BytesIO(response.content))
-
-                # Resize the image to 256x256
-                resized_image = image.resize((240, 240))
-
-                # Save resized image to S3
-                resized_image_io = BytesIO()
-                resized_image.save(resized_image_io, format="bmp")
-                resized_image_io.seek(0)
-
-                # Upload to S3
-                s3_file_name = "resized_image_240x240.bmp"
-                s3_response = upload_to_s3(resized_image_io, s3_file_name, content_type="image/bmp")
-                resized_image_url = s3_response.get("file_url", None)
-                response_data["image_url"] = resized_image_url
-            except Exception as e:
-                print(f"Error generating or resizing image with DALL-E: {e}")
-                response_data["image_url"] = None
-
-        # Step 4: Generate MP3 using Amazon Polly
-        mp3_url = None
-        if explanation_text:
-            try:
-                polly_client = boto3.client(
-                    "polly",
-                    aws_access_key_id=AWS_ACCESS_KEY,
-                    aws_secret_access_key=AWS_SECRET_KEY,
-                    region_name=S3_REGION,
-                )
-                polly_response = polly_client.synthesize_speech(
-                    Text=explanation_text,
-                    OutputFormat="mp3",
-                    VoiceId="Joanna",
-                )
-
-                # Save the MP3 to a BytesIO object
-                mp3_io = BytesIO(polly_response["AudioStream"].read())
-
-                # Upload to S3
-                mp3_filename = "explanation_audio.mp3"
-                s3_audio_response = upload_to_s3(mp3_io, mp3_filename, content_type="audio/mpeg")
-                mp3_url = s3_audio_response.get("file_url", None)
-                response_data["mp3_url"] = mp3_url
-            except Exception as e:
-                print(f"Error generating MP3 with Amazon Polly: {e}")
-                response_data["mp3_url"] = None
+            print(f"Error extracting text: {e}")
+            return None
+
+    # Explanation tokens also go to the narrator, which picks out the finished sentences
+    async def explanation_emit(event_type, content):
+        if narrator is not None:
+            narrator.feed(content)
+        await emit(event_type, content)
+
+    # Step 2: Generate explanation using OpenAI GPT
+    async def explanation(extracted_text):
+        response_data["explanation_text"] = None
+        try:
+            if page["cached"] is not None:
+                # Known page: replay the stored results; returning None skips the stages below
+                for event_type, field, key in (("on_image_explanation", "explanation_text", None),
+                                               ("on_image_url", "image_url", "image_key"),
+                                               ("on_image_audio", "mp3_url", "mp3_key")):
+                    value = page["cached"][field]
+                    if S3_PRESIGN_URLS and page["cached"].get(key):
+                        # A stored presigned URL may have expired; sign the object again
+                        value = asset_url(page["cached"][key])
+                    response_data[field] = value
+                    await emit(event_type, value)
+                if page["cached"].get("image_key"):
+                    response_data["image_id"] = image_id_from_key(page["cached"]["image_key"])
+                return None
+            explanation_text, response_data["providers"]["explanation"] = await _stream_chat_text(
+                explanation_router, explanation_prompt + extracted_text, explanation_emit, deadline)
+            if not explanation_text:
+                raise ValueError("Failed to generate explanation text.")
+            response_data["explanation_text"] = explanation_text
+            await emit("on_image_explanation", explanation_text)
+            return explanation_text
+        except Exception as e:
+            print(f"Error generating explanation with GPT: {e}")
+            return None
+        finally:
+            if narrator is not None:
+                narrator.close()
+
+    # Step 3: Generate image using DALL-E, then download, resize and upload it
+    async def illustration(explanation_text):
+        response_data["image_url"] = None
+        try:
+            image_url, response_data["providers"]["illustration"] = await illustration_router.call(
+                illustration_prompt.replace("$explanation", explanation_text), deadline=deadline)
+            return image_url
+        except Exception as e:
+            print(f"Error generating image with DALL-E: {e}")
+            return None
+
+    async def image_download(image_url):
+        try:
+            with span("http", "image_download"):
+                async with asyncio.timeout(deadline.remaining()):
+                    response = await async_http_client().get(image_url)
+                response.raise_for_status()
+            return response.content
+        except Exception as e:
+            print(f"Error downloading DALL-E image: {e}")
+            return None
+
+    async def image_resize(image_bytes):
+        try:
+            return await asyncio.to_thread(_resize_to_bmp, image_bytes)
+        except Exception as e:
+            print(f"Error resizing image: {e}")
+            return None
+
+    async def image_upload(resized_image_io):
+        try:
+            # Read before uploading: boto3 closes the file object once it is sent
+            resized_image = resized_image_io.getvalue()
+            async with asyncio.timeout(deadline.remaining()):
+                s3_response = await asyncio.to_thread(upload_to_s3, resized_image_io, ILLUSTRATION_FILE_NAME, "image/bmp")
+            response_data["image_url"] = s3_response.get("file_url", None)
+            page["keys"]["image_key"] = s3_response.get("key")
+            if s3_response.get("key"):
+                # Renditions for the device and the PWA are made from this copy, without a download
+                response_data["image_id"] = image_id_from_key(s3_response["key"])
+                rendition_store.add_source(response_data["image_id"], resized_image)
+            await emit("on_image_url", response_data["image_url"])
+            return response_data["image_url"]
+        except Exception as e:
+            print(f"Error uploading image to S3: {e}")
+            return None
+
+    # Step 4: Generate MP3 using Amazon Polly, then upload it
+    async def speech(explanation_text):
+        response_data["mp3_url"] = None
+        try:
+            return BytesIO(await synthesize(explanation_text))
+        except Exception as e:
+            print(f"Error generating MP3: {e}")
+            return None
 
+    # Step 4 (streaming): narrate sentence by sentence while the explanation is generated
+    async def narration(extracted_text):
+        try:
+            audio = await narrator.run()
+            return BytesIO(audio) if audio else None
+        except Exception as e:
+            print(f"Error narrating explanation: {e}")
+            return None
+
+    async def audio_upload(mp3_io):
+        try:
+            mp3_filename = "explanation_audio.mp3"
+            async with asyncio.timeout(deadline.remaining()):
+                s3_audio_response = await asyncio.to_thread(upload_to_s3, mp3_io, mp3_filename, "audio/mpeg")
+            response_data["mp3_url"] = s3_audio_response.get("file_url", None)
+            page["keys"]["mp3_key"] = s3_audio_response.get("key")
+            await emit("on_image_audio", response_data["mp3_url"])
+            return response_data["mp3_url"]
+        except Exception as e:
+            print(f"Error uploading MP3 to S3: {e}")
+            return None
+
+    try:
+        _, timings = await run_stage_graph([
+            Stage("page_lookup", page_lookup),
+            Stage("ocr", ocr, deps=["page_lookup"]),
+            Stage("explanation", explanation, deps=["ocr"]),
+            Stage("illustration", illustration, deps=["explanation"]),
+            Stage("image_download", image_download, deps=["illustration"]),
+            Stage("image_resize", image_resize, deps=["image_download"]),
+            Stage("image_upload", image_upload, deps=["image_resize"]),
+            # Streaming narration starts with the explanation rather than after it
+            Stage("speech", narration, deps=["ocr"]) if narrator is not None
+            else Stage("speech", speech, deps=["explanation"]),
+            Stage("audio_upload", audio_upload, deps=["speech"]),
+        ])
+        response_data["timings"] = timings
+        print(f"process_image timings: {timings}")
+        # Only a complete result is worth replaying for the next scan of this page
+        fields = ("text", "explanation_text", "image_url", "mp3_url")
+        if response_data["page_cache"] is None and all(response_data.get(field) for field in fields):
+            page_cache.store(response_data["text"], {**{field: response_data[field] for field in fields}, **page["keys"]},
+                             page["frame_hash"])
         return response_data
 
     except Exception as e:
         print(f"Unexpected error: {e}")
         raise e
 
+# Fetch and normalize the image so the vision model gets a small data URL; if it cannot be
+# fetched or read here, pass the URL through and let OpenAI download it as before
+async def _vision_image_url(image_url: str):
+    if not IMAGE_NORMALIZE:
+        return image_url
+    try:
+        with span("http", "image_download"):
+            response = await async_http_client().get(image_url)
+            response.raise_for_status()
+        image = await prepare_image(response.content, "openai_vision_ocr")
+        return image.to_data_url()
+    except Exception as e:
+        print(f"Error normalizing image {image_url}, sending the URL instead: {e}")
+        return image_url
+
+
 # Function to process image from URL
-async def process_image_from_url(image_url: str):
+async def process_image_from_url(image_url: str, emit=_no_emit, deadline: Deadline = None):
+    deadline = deadline or Deadline(PROCESS_IMAGE_DEADLINE_SECONDS)
     try:
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        timings = {}
+        started = time.perf_counter()
 
-        response1 = client.chat.completions.create(
-            model='gpt-4o',
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text", 
-                            "text": (
-                                # "Can you please explain the text contained in the attached picture?"
-                                "Please extract the text from the attached screenshot with high accuracy, ensuring "
-                                "that all punctuation, capitalization, and formatting are preserved as closely as possible. "
-                                "The goal is to capture the full text exactly as it appears in the image, without any "
-                                "additional characters or missing content. Pay attention to any special characters, italics, "
-                                "or unusual spacing to ensure the extracted text matches the original formatting."
-                            ),
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": image_url}  # Pass the image URL directly to OpenAI API
-                        }
-                    ],
-                }
-            ],
-            temperature=0,
-            max_tokens=500,
-        )
+        with timed_stage(timings, "image_prep", started):
+            vision_image = await _vision_image_url(image_url)
+
+        with timed_stage(timings, "ocr", started):
+            extracted_text, _ = await vision_ocr_router.call(vision_image, deadline=deadline)
 
         # Extracted text cleanup: Remove line return characters (\n)
-        extracted_text = response1.choices[0].message.content.replace("\n", "") if response1 and response1.choices else None
+        extracted_text = extracted_text.replace("\n", "") if extracted_text else None
         if not extracted_text:
             raise ValueError("Failed to extract text from the image")
         print("Extracted text:\n" + extracted_text)
+        await emit("on_image_text", extracted_text)
 
-        response2 = client.chat.completions.create(
-            model='gpt-4',
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": (
-                                "You are an experienced tutor who teaches middle school kids."
-                                "The following text is from a book. Explain it in a simple, engaging, and supportive way."
-                                "Make the explanation suitable for neurodivergent students. Use short, clear sentences."
-                                "Keep the response under 80 words. Here is the text: " + extracted_text
-                            ),
-                        },
-                    ],
-                }
-            ],
-            temperature=0.7,
-            max_tokens=500,
-        )
+        with timed_stage(timings, "explanation", started):
+            explanation_text, _ = await _stream_chat_text(url_explanation_router, explanation_prompt + extracted_text,
+                                                          emit, deadline)
 
-        # Ensure that response2 is valid and contains choices
-        explanation_text = response2.choices[0].message.content if response2 and response2.choices else None
         if not explanation_text:
             explanation_text = "Please keep the camera at least 6 inches above the text."
             raise ValueError("Failed to generate an explanation")
         print("\nExplanation text:\n" + explanation_text)
-        
-        response3 = client.images.generate(
-            model="dall-e-3",
-            prompt=(
-                "Create a detailed and expressive image based on the following excerpt from a book: \n"
-                + explanation_text +
-                "\nDepict the main character's emotions of confusion and deep thought, capturing their internal struggle. "
-                "The scene should feel grounded in reality, with soft lighting and a tranquil, serene atmosphere. "
-                "Use subtle, muted colors to convey calmness but include some visual contrast to highlight the character's feelings. "
-                "The background can be a peaceful setting, such as a quiet room with natural light filtering through a window or an open landscape. "
-                "Pay attention to the character's facial expressions, body language, and surrounding elements to emphasize their thoughtful state."
-            ),
-            size="1024x1024",
-            style="vivid"
-        )
-
-        # Ensure that response3 contains image data
-        image_url = response3.data[0].url if response3 and response3.data else None
+        await emit("on_image_explanation", explanation_text)
+
+        with timed_stage(timings, "illustration", started):
+            image_url, _ = await illustration_router.call(
+                (
+                    "Create a detailed and expressive image based on the following excerpt from a book: \n"
+                    + explanation_text +
+                    "\nDepict the main character's emotions of confusion and deep thought, capturing their internal struggle. "
+                    "The scene should feel grounded in reality, with soft lighting and a tranquil, serene atmosphere. "
+                    "Use subtle, muted colors to convey calmness but include some visual contrast to highlight the character's feelings. "
+                    "The background can be a peaceful setting, such as a quiet room with natural light filtering through a window or an open landscape. "
+                    "Pay attention to the character's facial expressions, body language, and surrounding elements to emphasize their thoughtful state."
+                ),
+                deadline=deadline,
+            )
+
+        # Ensure that DALL-E returned an image
         if not image_url:
             image_url = "/no_image.jpg"
             raise ValueError("Failed to generate the illustrative image")
+        await emit("on_image_url", image_url)
+
+        timings["total_ms"] = round(1000 * (time.perf_counter() - started), 1)
+        print(f"process_image_from_url timings: {timings}")
 
         # Return the response from OpenAI
         return {
             "text": explanation_text,
-            "image_url": image_url
+            "image_url": image_url,
+            "timings": timings
         }
 
     except Exception as e:
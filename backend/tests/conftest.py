@@ -0,0 +1,16 @@
+import pytest
+from src.utils import clients
+from tests.fakes import install_fake_environment
+
+
+@pytest.fixture(autouse=True)
+def fake_environment(monkeypatch):
+    """No real API keys, an in-memory Qdrant and no on-disk embedding cache, undone after each test."""
+    install_fake_environment(monkeypatch)
+
+
+@pytest.fixture(autouse=True)
+def fresh_clients():
+    """Fakes installed with clients.registry.set() do not leak into the next test."""
+    yield clients.registry
+    clients.registry.clear()
@@ -0,0 +1,395 @@
+"""Stand-ins for the upstream clients, shared by the tests and the benchmarks.
+
+Importing this module has no side effects: install a fake with
+``clients.registry.set()`` (the ``fresh_clients`` fixture clears them after
+each test), and the fake environment with ``install_fake_environment()``.
+"""
+import io
+import time
+import asyncio
+import hashlib
+import random
+from types import SimpleNamespace
+from PIL import Image, ImageDraw
+from botocore.exceptions import ClientError
+
+EMBEDDING_DIM = 1536
+
+
+# Deterministic pseudo-embedding: the same text always maps to the same unit vector
+def fake_vector(text: str, dim: int = EMBEDDING_DIM):
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    values = [rng.random() - 0.5 for _ in range(dim)]
+    norm = sum(v * v for v in values) ** 0.5
+    return [v / norm for v in values]
+
+
+# Through ``monkeypatch``, so it is undone when the test (or fixture) ends. QdrantVectorStore embeds
+# a probe text at construction time and ingestion can go through the LangChain embedder,
+# so both return the deterministic vectors
+def install_fake_environment(monkeypatch):
+    from langchain_openai import OpenAIEmbeddings
+    from src.utils import chat_rag, index_qdrant, openai_utils
+
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setenv("EMBEDDING_CACHE_PATH", "")
+    monkeypatch.setattr(chat_rag, "openai_api_key", "sk-test")
+    monkeypatch.setattr(index_qdrant, "qdrant_url", ":memory:")
+    monkeypatch.setattr(openai_utils, "embedding_cache", None)
+    monkeypatch.setattr(OpenAIEmbeddings, "embed_documents", lambda self, texts: [fake_vector(t) for t in texts])
+    monkeypatch.setattr(OpenAIEmbeddings, "embed_query", lambda self, text: fake_vector(text))
+
+
+def _embedding_response(texts):
+    if isinstance(texts, str):
+        texts = [texts]
+    return SimpleNamespace(data=[SimpleNamespace(index=i, embedding=fake_vector(t)) for i, t in enumerate(texts)])
+
+
+class FakeProviderError(Exception):
+    """Failure injected into a fake client."""
+
+
+class Faults:
+    """Misbehaviour injected into a fake client, drawn from a seeded RNG.
+
+    Each call fails with probability ``failure_rate`` (after ``failure_latency``),
+    or else takes ``tail_latency`` extra seconds with probability ``tail_rate``.
+    ``down`` fails every call. ``models`` limits the faults to those models.
+    """
+
+    def __init__(self, tail_rate=0.0, tail_latency=0.0, failure_rate=0.0, failure_latency=0.0, down=False,
+                 models=None, seed=0):
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.failure_rate = failure_rate
+        self.failure_latency = failure_latency
+        self.down = down
+        self.models = models
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self.failures = 0
+        self.tails = 0
+
+    def _draw(self, model):
+        if self.models is not None and model not in self.models:
+            return 0.0, False
+        self.calls += 1
+        draw = self.rng.random()
+        if self.down or draw < self.failure_rate:
+            self.failures += 1
+            return self.failure_latency, True
+        if draw < self.failure_rate + self.tail_rate:
+            self.tails += 1
+            return self.tail_latency, False
+        return 0.0, False
+
+    async def apply(self, model=None):
+        delay, fail = self._draw(model)
+        if delay:
+            await asyncio.sleep(delay)
+        if fail:
+            raise FakeProviderError(f"injected failure ({model or 'call'})")
+
+    def apply_sync(self, model=None):
+        delay, fail = self._draw(model)
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise FakeProviderError(f"injected failure ({model or 'call'})")
+
+
+class FakeProvider:
+    """Async provider call for a ProviderRouter: returns ``result`` after ``latency`` seconds, then ``faults``.
+
+    ``latency`` may be a function of the call number, to script a slow call.
+    """
+
+    def __init__(self, result, latency=0.1, faults=None):
+        self.result = result
+        self.latency = latency
+        self.faults = faults or Faults()
+        self.calls = 0
+        self.completed = 0
+        self.cancelled = 0
+
+    async def __call__(self, *args):
+        self.calls += 1
+        latency = self.latency(self.calls) if callable(self.latency) else self.latency
+        try:
+            await self.faults.apply()
+            await asyncio.sleep(latency)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        self.completed += 1
+        return self.result
+
+
+class FakeOpenAI:
+    """Blocking stand-in for ``openai.OpenAI`` with a fixed embedding latency."""
+
+    def __init__(self, embed_latency=0.15):
+        self.embed_latency = embed_latency
+        self.embeddings = SimpleNamespace(create=self._create_embedding)
+
+    def _create_embedding(self, model, input):
+        time.sleep(self.embed_latency)
+        return _embedding_response(input)
+
+
+class FakeAsyncOpenAI:
+    """Async stand-in for ``openai.AsyncOpenAI``: embeddings, chat completions, images and speech."""
+
+    def __init__(self, embed_latency=0.15, first_token_latency=0.3, token_latency=0.01, tokens=20, image_latency=0.0,
+                 text=None, speech_latency=0.3, faults=None):
+        self.embed_latency = embed_latency
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.tokens = tokens
+        self.image_latency = image_latency
+        # Streamed completions are the words of ``text`` when set, else ``tokens`` filler tokens
+        self.text = text
+        self.embeddings = SimpleNamespace(create=self._create_embedding)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_completion))
+        self.images = SimpleNamespace(generate=self._generate_image)
+        self.audio = SimpleNamespace(speech=SimpleNamespace(create=self._create_speech))
+        self.speech_latency = speech_latency
+        # Applied before the response (or the first token of a stream)
+        self.faults = faults or Faults()
+        self.tokens_streamed = 0
+        self.streams_abandoned = 0
+        self.images_generated = 0
+
+    async def _create_embedding(self, model, input):
+        await asyncio.sleep(self.embed_latency)
+        return _embedding_response(input)
+
+    async def _create_completion(self, model, messages, stream=False, **kwargs):
+        await self.faults.apply(model)
+        if stream:
+            return _FakeStream(self, self._stream())
+        await asyncio.sleep(self.first_token_latency + self.token_latency * self.tokens)
+        content = " ".join(f"token{i}" for i in range(self.tokens))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    async def _generate_image(self, model, prompt, **kwargs):
+        await self.faults.apply(model)
+        await asyncio.sleep(self.image_latency)
+        self.images_generated += 1
+        return SimpleNamespace(data=[SimpleNamespace(url=f"https://images.example/{self.images_generated}.png")])
+
+    async def _create_speech(self, model, voice, input, response_format="mp3", **kwargs):
+        await self.faults.apply(model)
+        await asyncio.sleep(self.speech_latency)
+        return SimpleNamespace(content=b"ID3" + input.encode("utf-8"))
+
+    async def _stream(self):
+        completed = False
+        try:
+            await asyncio.sleep(self.first_token_latency)
+            words = self.text.split() if self.text else [f"token{i}" for i in range(self.tokens)]
+            for i, word in enumerate(words):
+                if i:
+                    await asyncio.sleep(self.token_latency)
+                self.tokens_streamed += 1
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=f"{word} "))])
+            completed = True
+        finally:
+            # Closed (or cancelled) before the last token
+            if not completed:
+                self.streams_abandoned += 1
+
+
+class _FakeStream:
+    """Async iterator of chunks with the ``close()`` of openai's ``AsyncStream``."""
+
+    def __init__(self, client, chunks):
+        self.client = client
+        self.chunks = chunks
+
+    def __aiter__(self):
+        return self.chunks
+
+    async def close(self):
+        await self.chunks.aclose()
+
+
+def _points(limit):
+    return [
+        SimpleNamespace(id=i, score=1.0 - i / 10, payload={"page_content": f"chunk {i}", "metadata": {"source": "fake"}})
+        for i in range(limit)
+    ]
+
+
+class FakeQdrant:
+    """Blocking stand-in for ``QdrantClient.search``."""
+
+    def __init__(self, search_latency=0.05):
+        self.search_latency = search_latency
+
+    def search(self, collection_name, query_vector, limit=10, **kwargs):
+        time.sleep(self.search_latency)
+        return _points(limit)
+
+
+class FakeAsyncQdrant:
+    """Async stand-in for ``AsyncQdrantClient``; upserted points are counted and discarded."""
+
+    def __init__(self, search_latency=0.05, upsert_latency=0.0):
+        self.search_latency = search_latency
+        self.upsert_latency = upsert_latency
+        self.upserted = 0
+
+    async def search(self, collection_name, query_vector, limit=10, **kwargs):
+        await asyncio.sleep(self.search_latency)
+        return _points(limit)
+
+    async def upsert(self, collection_name, points, **kwargs):
+        await asyncio.sleep(self.upsert_latency)
+        self.upserted += len(points)
+
+    async def collection_exists(self, collection_name):
+        return True
+
+    async def create_payload_index(self, collection_name, field_name, field_schema=None, **kwargs):
+        return None
+
+
+class FakeGemini:
+    """Stand-in for a ``genai.GenerativeModel``: returns ``text``, or ``text(parts)`` if callable.
+
+    With ``stream=True`` the words of the text arrive one by one, the first after ``latency``.
+    """
+
+    def __init__(self, latency=1.0, text="The quick brown fox jumps over the lazy dog.", token_latency=0.0,
+                 faults=None):
+        self.latency = latency
+        self.text = text
+        self.token_latency = token_latency
+        self.faults = faults or Faults()
+        self.calls = 0
+
+    async def generate_content_async(self, parts, stream=False, **kwargs):
+        await self.faults.apply()
+        await asyncio.sleep(self.latency)
+        self.calls += 1
+        text = self.text(parts) if callable(self.text) else self.text
+        if stream:
+            return self._stream(text)
+        return SimpleNamespace(text=text)
+
+    async def _stream(self, text):
+        for i, word in enumerate(text.split()):
+            if i:
+                await asyncio.sleep(self.token_latency)
+            yield SimpleNamespace(text=f"{word} ")
+
+
+class FakeAsyncHttp:
+    """Stand-in for ``httpx.AsyncClient.get``; returns ``content``, or ``content(url)`` if callable."""
+
+    def __init__(self, content=b"", latency=0.05):
+        self.content = content
+        self.latency = latency
+
+    async def get(self, url, **kwargs):
+        await asyncio.sleep(self.latency)
+        content = self.content(url) if callable(self.content) else self.content
+        return SimpleNamespace(content=content, status_code=200, raise_for_status=lambda: None)
+
+
+class FakeS3:
+    """Blocking stand-in for the boto3 S3 client; uploads are kept in ``objects``."""
+
+    def __init__(self, latency=0.05):
+        self.latency = latency
+        self.objects = {}
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, "HeadObject")
+        return {"ContentLength": len(self.objects[Key])}
+
+    def get_object(self, Bucket, Key):
+        time.sleep(self.latency)
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey", "Message": "Not Found"}}, "GetObject")
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+    def upload_fileobj(self, file_obj, bucket, key, ExtraArgs=None, Config=None):
+        time.sleep(self.latency)
+        self.objects[key] = file_obj.read()
+
+    def generate_presigned_url(self, ClientMethod, Params=None, ExpiresIn=3600):
+        return f"https://{Params['Bucket']}.s3.amazonaws.com/{Params['Key']}?X-Amz-Expires={ExpiresIn}"
+
+
+class FakePolly:
+    """Blocking stand-in for the boto3 Polly client; latency grows with the text length."""
+
+    def __init__(self, latency=0.3, latency_per_char=0.0, faults=None):
+        self.latency = latency
+        self.latency_per_char = latency_per_char
+        self.faults = faults or Faults()
+        self.calls = 0
+
+    def synthesize_speech(self, Text, OutputFormat="mp3", VoiceId=None, **kwargs):
+        self.faults.apply_sync()
+        time.sleep(self.latency + self.latency_per_char * len(Text))
+        self.calls += 1
+        return {"AudioStream": io.BytesIO(b"ID3" + Text.encode("utf-8"))}
+
+
+PDF_LINE = "The quick brown fox jumps over the lazy dog while the reader turns the page"
+
+
+# Minimal uncompressed PDF writer: one Helvetica text page per page_count
+def write_pdf(path, page_count, lines_per_page=40):
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page in range(page_count):
+        text = "".join(f"({PDF_LINE} {page}.{line}) Tj T* " for line in range(lines_per_page))
+        stream = f"BT /F1 10 Tf 12 TL 40 800 Td {text}ET".encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        " ".join(f"{k} 0 R" for k in kids).encode(), page_count)
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        f.writelines(b"%010d 00000 n \n" % offset for offset in offsets)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+
+WORDS = "the quick brown fox jumps over a lazy dog while reading its favourite book quietly".split()
+
+
+# A JPEG book page on a darker desk, with camera noise and an EXIF orientation
+def camera_frame(width=1600, height=1200, quality=90, seed=0, orientation=6):
+    rng = random.Random(seed)
+    image = Image.new("RGB", (width, height), (90, 80, 70))
+    draw = ImageDraw.Draw(image)
+    page = (int(width * 0.18), int(height * 0.08), int(width * 0.82), int(height * 0.92))
+    draw.rectangle(page, fill=(235, 232, 222))
+    y = page[1] + 30
+    while y < page[3] - 30:
+        line = " ".join(rng.choice(WORDS) for _ in range(12))
+        draw.text((page[0] + 30, y), line, fill=(25, 25, 25))
+        y += 18
+    # Camera noise, so the JPEG is about as large as a real frame
+    noise = Image.effect_noise((width, height), 24).convert("RGB")
+    image = Image.blend(image, noise, 0.12)
+    exif = Image.Exif()
+    exif[0x0112] = orientation  # 6: rotate 90 degrees clockwise to display
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=quality, exif=exif)
+    return output.getvalue()
@@ -0,0 +1,91 @@
+import asyncio
+from langchain_core.documents import Document
+from qdrant_client import AsyncQdrantClient, models
+from src.utils import clients, ingest_pipeline
+from src.utils.answer_cache import AnswerCache
+from src.utils.ingest_pipeline import chunk_id, existing_chunk_ids, ingest_documents
+from tests.fakes import EMBEDDING_DIM, FakeAsyncOpenAI
+
+QUESTION = [1.0, 0.0, 0.0]
+
+
+def test_similar_question_over_the_same_docs_hits():
+    cache = AnswerCache(threshold=0.95)
+    cache.store(QUESTION, ["doc-1", "doc-2"], {"answer": "A map."}, ["chunk"])
+    # cos = 0.96 and 0.92
+    assert cache.lookup([0.96, 0.28, 0.0], ["doc-2", "doc-1"])["content"] == {"answer": "A map."}
+    assert cache.lookup([0.92, 0.39, 0.0], ["doc-1", "doc-2"]) is None
+    assert cache.lookup(QUESTION, ["doc-1"]) is None
+    assert cache.stats() == {"hits": 1, "misses": 2, "invalidations": 0, "entries": 1, "hit_rate": 1 / 3}
+
+
+def test_closest_question_wins():
+    cache = AnswerCache(threshold=0.9)
+    cache.store([0.95, 0.31, 0.0], ["doc-1"], "further", [])
+    cache.store([0.99, 0.14, 0.0], ["doc-1"], "closer", [])
+    assert cache.lookup(QUESTION, ["doc-1"])["content"] == "closer"
+
+
+def test_scope_separates_follow_ups():
+    cache = AnswerCache()
+    cache.store(QUESTION, ["doc-1"], "about the attic", [], scope="What is in the attic?")
+    assert cache.lookup(QUESTION, ["doc-1"], scope="Who wrote the letter?") is None
+    assert cache.lookup(QUESTION, ["doc-1"]) is None
+    assert cache.lookup(QUESTION, ["doc-1"], scope="What is in the attic?")["content"] == "about the attic"
+
+
+def test_invalidating_a_document_drops_every_answer_built_on_it():
+    cache = AnswerCache()
+    cache.store(QUESTION, ["doc-1", "doc-2"], "both", [])
+    cache.store(QUESTION, ["doc-2"], "second only", [])
+    cache.store(QUESTION, ["doc-3"], "third", [])
+    cache.invalidate_documents(["doc-2"])
+    assert cache.lookup(QUESTION, ["doc-1", "doc-2"]) is None
+    assert cache.lookup(QUESTION, ["doc-2"]) is None
+    assert cache.lookup(QUESTION, ["doc-3"])["content"] == "third"
+    assert cache.stats()["invalidations"] == 2
+
+
+def test_expired_and_overflowing_entries_are_dropped(monkeypatch):
+    cache = AnswerCache(max_entries=2, ttl_seconds=60)
+    now = [1000.0]
+    monkeypatch.setattr("src.utils.answer_cache.time.time", lambda: now[0])
+    for doc_id in ("doc-1", "doc-2", "doc-3"):
+        cache.store(QUESTION, [doc_id], doc_id, [])
+    assert cache.stats()["entries"] == 2
+    assert cache.lookup(QUESTION, ["doc-1"]) is None
+    now[0] += 61
+    assert cache.lookup(QUESTION, ["doc-3"]) is None
+    assert cache.stats()["entries"] == 1
+
+
+def test_reindexing_a_changed_document_invalidates_its_answers(monkeypatch):
+    cache = AnswerCache()
+    monkeypatch.setattr(ingest_pipeline, "answer_cache", cache)
+    clients.registry.set("async_openai", FakeAsyncOpenAI(embed_latency=0.0))
+    pages = [Document(page_content=f"Page {i} of the story.", metadata={"source": "book.pdf", "page": i})
+             for i in range(3)]
+    edited = [pages[0], Document(page_content="Page 1, rewritten.", metadata={"source": "book.pdf", "page": 1}),
+              pages[2]]
+
+    async def run():
+        client = AsyncQdrantClient(":memory:")
+        await client.create_collection(
+            "books", vectors_config=models.VectorParams(size=EMBEDDING_DIM, distance=models.Distance.COSINE))
+        await ingest_documents(client, "books", pages)
+        cache.store(QUESTION, [chunk_id(pages[0])], "from page 0", [])
+        cache.store(QUESTION, [chunk_id(pages[1])], "from page 1", [])
+        existing = await existing_chunk_ids(client, "books", "book.pdf")
+        return await ingest_documents(client, "books", edited, existing_ids=existing, delete_stale=True)
+
+    stats = asyncio.run(run())
+    assert stats["removed"] == 1 and stats["kept"] == 2
+    assert cache.lookup(QUESTION, [chunk_id(pages[1])]) is None
+    assert cache.lookup(QUESTION, [chunk_id(pages[0])])["content"] == "from page 0"
+
+
+def test_disabled_cache_stores_nothing():
+    cache = AnswerCache(max_entries=0)
+    cache.store(QUESTION, ["doc-1"], "answer", [])
+    assert cache.lookup(QUESTION, ["doc-1"]) is None
+    assert cache.stats()["entries"] == 0
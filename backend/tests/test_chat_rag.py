@@ -0,0 +1,111 @@
+import time
+import asyncio
+import hashlib
+from types import SimpleNamespace
+import pytest
+from src.utils import chat_rag, clients
+from src.utils.answer_cache import AnswerCache
+from src.utils.session_store import SessionStore
+from tests.fakes import FakeAsyncHttp, FakeAsyncOpenAI, camera_frame
+
+
+def embedding(text):
+    # Distinct texts get (nearly) orthogonal vectors; the same text always gets the same one
+    digest = hashlib.sha256(text.encode()).digest()
+    return [byte - 127.5 for byte in digest]
+
+
+@pytest.fixture
+def rag(monkeypatch):
+    calls = {"completions": 0, "searches": [], "score": 0.9}
+
+    async def async_get_embedding(text):
+        return embedding(text)
+
+    async def async_qdrant_search(query, query_vector):
+        calls["searches"].append(query)
+        return [SimpleNamespace(id="doc-1", payload={"page_content": "A map.", "metadata": {}}, score=calls["score"])]
+
+    async def stream_completion(question, docs, scores, history):
+        calls["completions"] += 1
+        for token in ("Answer ", "to ", question):
+            yield token
+
+    async def summarize_history(summary, messages):
+        return summary
+
+    monkeypatch.setattr(chat_rag, "async_get_embedding", async_get_embedding)
+    monkeypatch.setattr(chat_rag, "async_qdrant_search", async_qdrant_search)
+    monkeypatch.setattr(chat_rag, "stream_completion", stream_completion)
+    monkeypatch.setattr(chat_rag, "summarize_history", summarize_history)
+    monkeypatch.setattr(chat_rag, "answer_cache", AnswerCache())
+    monkeypatch.setattr(chat_rag, "session_store", SessionStore())
+    return calls
+
+
+def ask(question, session_id):
+    async def run():
+        return [event async for event in chat_rag.async_get_answer_and_docs(question, session_id)]
+
+    events = asyncio.run(run())
+    return "".join(event["content"] for event in events if event["event_type"] == "on_chat_model_stream")
+
+
+def test_follow_up_questions_are_answered_from_the_cache(rag):
+    for session_id in ("socket-1", "socket-2"):
+        assert ask("What is in the attic?", session_id) == "Answer to What is in the attic?"
+        assert ask("What does that word mean?", session_id) == "Answer to What does that word mean?"
+    # The second socket asked the same two questions in the same order
+    assert rag["completions"] == 2
+    assert chat_rag.answer_cache.stats()["hits"] == 2
+
+
+def test_follow_up_is_not_replayed_after_a_different_previous_question(rag):
+    ask("What is in the attic?", "socket-1")
+    ask("What does that word mean?", "socket-1")
+    ask("Who wrote the letter?", "socket-2")
+    ask("What does that word mean?", "socket-2")
+    assert rag["completions"] == 4
+    # The follow-up is still recorded in its own session's history
+    assert chat_rag.session_store.history("socket-2")[1][-1]["content"] == "Answer to What does that word mean?"
+
+
+def test_only_follow_ups_are_searched_with_the_previous_question(rag):
+    ask("What is in the attic of the old house?", "socket-1")
+    ask("What does that word mean?", "socket-1")
+    ask("They found a letter, who wrote it?", "socket-1")
+    ask("Where does the story of the lighthouse keeper take place?", "socket-1")
+    assert rag["searches"] == [
+        "What is in the attic of the old house?",
+        "What is in the attic of the old house?\nWhat does that word mean?",
+        "What does that word mean?\nThey found a letter, who wrote it?",
+        "Where does the story of the lighthouse keeper take place?",
+    ]
+
+
+def test_question_matching_nothing_on_its_own_is_searched_again_with_the_previous_one(rag):
+    ask("What is in the attic of the old house?", "socket-1")
+    rag["score"] = 0.5
+    ask("Where did the keeper hide the brass key?", "socket-1")
+    assert rag["searches"][1:] == [
+        "Where did the keeper hide the brass key?",
+        "What is in the attic of the old house?\nWhere did the keeper hide the brass key?",
+    ]
+
+
+def test_image_to_json_runs_on_the_event_loop():
+    clients.registry.set("async_http", FakeAsyncHttp(content=camera_frame(640, 480), latency=0.2))
+    clients.registry.set("async_openai", FakeAsyncOpenAI(first_token_latency=0.2, token_latency=0.0, tokens=3))
+
+    async def request():
+        return [event async for event in chat_rag.async_get_text()]
+
+    async def run():
+        return await asyncio.gather(*(request() for _ in range(4)))
+
+    started = time.perf_counter()
+    results = asyncio.run(run())
+    # Four requests overlap instead of queueing behind each other's download and completion
+    assert time.perf_counter() - started < 1.2
+    for events in results:
+        assert events == [{"event_type": "on_image_process", "content": "token0 token1 token2"}, {"event_type": "done"}]
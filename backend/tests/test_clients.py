@@ -0,0 +1,81 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import httpx
+import pytest
+from src.utils import clients
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        Handler.connections += 1
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    Handler.connections = 0
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_accessors_return_one_client_per_name():
+    assert clients.http_client() is clients.http_client()
+    assert clients.async_http_client() is clients.async_http_client()
+    assert clients.boto3_client("s3", "us-east-2") is clients.boto3_client("s3", "us-east-2")
+    assert clients.boto3_client("s3", "us-east-2") is not clients.boto3_client("polly", "us-east-2")
+
+
+def test_openai_clients_share_the_pooled_http_clients():
+    assert clients.openai_client()._client is clients.http_client()
+    assert clients.async_openai_client()._client is clients.async_http_client()
+
+
+def test_factory_runs_once_under_concurrent_first_use():
+    registry = clients.ClientRegistry()
+    built = []
+
+    def factory():
+        built.append(object())
+        return built[-1]
+
+    with ThreadPoolExecutor(16) as pool:
+        results = list(pool.map(lambda _: registry.get("client", factory), range(64)))
+    assert len(built) == 1 and all(result is built[0] for result in results)
+
+
+def test_repeat_requests_reuse_one_connection(server):
+    for _ in range(5):
+        assert clients.http_client().get(server).content == b"ok"
+    assert Handler.connections == 1
+
+
+def test_async_requests_reuse_the_pool_and_close_at_shutdown(server):
+    async def run():
+        for _ in range(5):
+            assert (await clients.async_http_client().get(server)).content == b"ok"
+        client = clients.async_http_client()
+        await clients.registry.aclose()
+        return client
+
+    client = asyncio.run(run())
+    assert Handler.connections == 1
+    assert client.is_closed
+    assert isinstance(clients.async_http_client(), httpx.AsyncClient) and clients.async_http_client() is not client
@@ -0,0 +1,17 @@
+from qdrant_client import models
+from src.utils.collection_profiles import PROFILES, collection_profile
+
+
+def test_default_profile_sends_no_search_params():
+    assert collection_profile("default").search_params() is None
+
+
+def test_quantized_profiles_set_hnsw_ef_and_rescoring():
+    params = PROFILES["binary"].search_params()
+    assert params.hnsw_ef == 128
+    assert params.quantization == models.QuantizationSearchParams(rescore=True, oversampling=3.0)
+
+
+def test_search_ef_override_applies_to_the_default_profile(monkeypatch):
+    monkeypatch.setenv("QDRANT_SEARCH_EF", "64")
+    assert collection_profile("default").search_params() == models.SearchParams(hnsw_ef=64)
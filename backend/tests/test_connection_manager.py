@@ -0,0 +1,80 @@
+import json
+import asyncio
+from src.utils.connection_manager import ConnectionManager
+
+
+class SlowWebSocket:
+    """Accepts sends only once ``release`` is set."""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.sent = []
+        self.closed = False
+
+    async def send_text(self, message):
+        await self.release.wait()
+        self.sent.append(json.loads(message))
+
+    async def close(self):
+        self.closed = True
+
+
+def test_drop_oldest_broadcasts_never_evict_direct_answer_tokens():
+    async def run():
+        manager = ConnectionManager(queue_size=3, policy="drop_oldest")
+        websocket = SlowWebSocket()
+        client = manager.connect(websocket)
+        await asyncio.sleep(0)
+
+        async def answer():
+            for token in range(6):
+                await manager.send(client, {"token": token})
+
+        answering = asyncio.create_task(answer())
+        await asyncio.sleep(0.01)
+        for n in range(10):
+            manager.broadcast({"broadcast": n})
+        websocket.release.set()
+        await answering
+        await manager.disconnect(client)
+        return websocket.sent, client.dropped
+
+    sent, dropped = asyncio.run(run())
+    # The sender holds the first token while blocked, so the queues are full after tokens 0-3
+    assert [event["token"] for event in sent if "token" in event] == list(range(6))
+    assert [event["broadcast"] for event in sent if "broadcast" in event] == [7, 8, 9]
+    assert dropped == 7
+
+
+def test_direct_and_broadcast_messages_keep_their_order():
+    async def run():
+        manager = ConnectionManager(queue_size=10)
+        websocket = SlowWebSocket()
+        client = manager.connect(websocket)
+        await manager.send(client, {"n": 0})
+        manager.broadcast({"n": 1})
+        await manager.send(client, {"n": 2})
+        manager.broadcast({"n": 3})
+        websocket.release.set()
+        await manager.disconnect(client)
+        return websocket
+
+    websocket = asyncio.run(run())
+    assert [event["n"] for event in websocket.sent] == [0, 1, 2, 3]
+    assert websocket.closed
+
+
+def test_drop_newest_and_disconnect_policies():
+    async def run(policy):
+        manager = ConnectionManager(queue_size=2, policy=policy)
+        websocket = SlowWebSocket()
+        client = manager.connect(websocket)
+        delivered = [manager.broadcast({"n": n}) for n in range(4)]
+        await asyncio.sleep(0.01)
+        return manager, delivered, websocket
+
+    manager, delivered, _ = asyncio.run(run("drop_newest"))
+    assert delivered == [1, 1, 0, 0]
+    manager, delivered, websocket = asyncio.run(run("disconnect"))
+    assert delivered == [1, 1, 0, 0]
+    assert manager.stats()["clients"] == 0 and websocket.closed
@@ -0,0 +1,35 @@
+from src.utils import context_packer
+from src.utils.context_packer import CONTEXT_TOKENS, pack_context
+
+
+def doc(text, source="book.pdf", page=1):
+    return {"page_content": text, "metadata": {"source": source, "page": page}}
+
+
+def test_overlapping_chunks_are_merged_and_duplicates_dropped():
+    sentence = "The quick brown fox jumps over the lazy dog near the river bank. "
+    first, second = sentence * 6, sentence * 3 + "A heron watches from the reeds."
+    context, stats = pack_context([doc(first), doc(first), doc(second, page=2)])
+    assert stats["packed"]
+    assert stats["duplicates"] + stats["merged"] >= 1
+    assert stats["context_tokens"] < stats["naive_tokens"]
+    assert context.count(first.strip()) == 1
+
+
+def test_falls_back_to_the_naive_context_when_packing_grows_it(monkeypatch):
+    # Single-token chunks: the blank-line separators cost more than packing saves
+    monkeypatch.setattr(context_packer, "count_tokens", lambda text: len(text))
+    docs = [doc("alpha", source="a.pdf"), doc("beta", source="b.pdf")]
+    context, stats = pack_context(docs)
+    assert context == "alpha\nbeta"
+    assert not stats["packed"]
+    assert stats["context_tokens"] == stats["naive_tokens"]
+    assert stats["tokens_saved"] == 0
+
+
+def test_packing_stats_are_recorded_as_metrics():
+    before = CONTEXT_TOKENS.samples()
+    _, stats = pack_context([doc("Some retrieved text about a page.")])
+    after = CONTEXT_TOKENS.samples()
+    assert after[("naive",)] - before.get(("naive",), 0) == stats["naive_tokens"]
+    assert after[("packed",)] - before.get(("packed",), 0) == stats["context_tokens"]
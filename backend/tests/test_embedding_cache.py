@@ -0,0 +1,81 @@
+import asyncio
+from src.utils.embedding_cache import EmbeddingCache
+
+MODEL = "text-embedding-ada-002"
+
+
+# Small whole numbers survive the cache's float32 storage exactly
+def vector(text: str):
+    return [float(ord(c)) for c in text.ljust(8)[:8]]
+
+
+class Embedder:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return [vector(text) for text in texts]
+
+
+def test_hits_and_misses_are_counted():
+    cache = EmbeddingCache(path=None)
+    embed = Embedder()
+    first = cache.get_or_embed_many(MODEL, ["a page", "another page"], embed)
+    # Whitespace differences share one entry
+    second = cache.get_or_embed_many(MODEL, ["a  page ", "another page"], embed)
+    assert embed.calls == [["a page", "another page"]]
+    assert second == first
+    stats = cache.stats()
+    assert (stats["misses"], stats["memory_hits"], stats["disk_hits"]) == (2, 2, 0)
+    assert stats["hit_rate"] == 0.5
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = EmbeddingCache(path=None, memory_items=2)
+    embed = Embedder()
+    cache.get_or_embed_many(MODEL, ["one", "two"], embed)
+    cache.get_or_embed(MODEL, "one", lambda text: embed([text])[0])
+    cache.get_or_embed(MODEL, "three", lambda text: embed([text])[0])
+    assert cache.stats()["memory_items"] == 2
+    cache.get_or_embed_many(MODEL, ["one", "two"], embed)
+    # "two" was the least recently used, so it is the one embedded again
+    assert embed.calls[-1] == ["two"]
+
+
+def test_disk_tier_serves_what_memory_evicted(tmp_path):
+    cache = EmbeddingCache(path=str(tmp_path / "embeddings.sqlite3"), memory_items=1)
+    embed = Embedder()
+    vectors = cache.get_or_embed_many(MODEL, ["one", "two"], embed)
+    assert cache.get_many(MODEL, ["one"]) == [vectors[0]]
+    stats = cache.stats()
+    assert stats["disk_hits"] == 1 and len(embed.calls) == 1
+
+    reopened = EmbeddingCache(path=str(tmp_path / "embeddings.sqlite3"))
+    assert reopened.get_many(MODEL, ["two"]) == [vectors[1]]
+    assert reopened.stats()["disk_bytes"] == 2 * 8 * 4
+
+
+def test_disk_tier_is_trimmed_to_its_budget(tmp_path):
+    cache = EmbeddingCache(path=str(tmp_path / "embeddings.sqlite3"), memory_items=1, max_disk_bytes=10 * 8 * 4)
+    cache.get_or_embed_many(MODEL, [f"chunk {i}" for i in range(20)], Embedder())
+    stats = cache.stats()
+    assert stats["evictions"] >= 10
+    assert stats["disk_bytes"] <= cache.max_disk_bytes * 0.9
+
+
+def test_async_lookups_embed_only_what_is_missing():
+    cache = EmbeddingCache(path=None)
+    embed = Embedder()
+
+    async def aembed(texts):
+        return embed(texts)
+
+    async def run():
+        await cache.aget_or_embed_many(MODEL, ["one", "two"], aembed)
+        return await cache.aget_or_embed_many(MODEL, ["two", "three"], aembed)
+
+    vectors = asyncio.run(run())
+    assert embed.calls == [["one", "two"], ["three"]]
+    assert vectors == [vector("two"), vector("three")]
+    assert cache.stats()["misses"] == 3
@@ -0,0 +1,88 @@
+import asyncio
+from io import BytesIO
+import pytest
+from PIL import Image
+from src.utils import image_prep
+from src.utils.image_prep import normalize_image, prepare_image
+from tests.fakes import camera_frame
+
+
+def encode(image, image_format="JPEG", **params):
+    output = BytesIO()
+    image.save(output, format=image_format, **params)
+    return output.getvalue()
+
+
+def decode(normalized):
+    return Image.open(BytesIO(normalized.data))
+
+
+def test_exif_orientation_is_applied():
+    # Red in the top-left corner as stored; orientation 6 displays it rotated 90 degrees clockwise
+    image = Image.new("RGB", (400, 200), (255, 255, 255))
+    image.paste((255, 0, 0), (0, 0, 100, 100))
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    normalized = normalize_image(encode(image, exif=exif), max_edge=1000)
+    assert normalized.size == (200, 400)
+    output = decode(normalized)
+    assert output.getpixel((150, 50))[0] > 200 and output.getpixel((150, 50))[1] < 60
+    assert output.getpixel((50, 50)) > (200, 200, 200)
+    assert output.getexif().get(0x0112, 1) == 1
+
+
+def test_camera_frame_is_rotated_and_downscaled_to_max_edge():
+    normalized = normalize_image(camera_frame(1600, 1200, orientation=6), max_edge=1280, image_format="jpeg")
+    assert normalized.size == (960, 1280)
+    assert normalized.mime_type == "image/jpeg" and normalized.source_format == "JPEG"
+    assert normalized.bytes_out < normalized.bytes_in
+    assert decode(normalized).size == (960, 1280)
+
+    normalized = normalize_image(camera_frame(1600, 1200, orientation=1), max_edge=800)
+    assert normalized.size == (800, 600)
+
+
+def test_webp_output():
+    normalized = normalize_image(camera_frame(640, 480), max_edge=320, image_format="webp")
+    assert normalized.mime_type == "image/webp"
+    assert normalized.data[:4] == b"RIFF" and normalized.data[8:12] == b"WEBP"
+    assert decode(normalized).format == "WEBP"
+
+
+def test_grayscale_output():
+    normalized = normalize_image(camera_frame(640, 480), max_edge=320, grayscale=True)
+    assert decode(normalized).mode == "L"
+
+
+def test_transparency_is_flattened_onto_white():
+    image = Image.new("RGBA", (64, 64), (0, 0, 0, 0))
+    image.paste((0, 0, 255, 255), (0, 0, 32, 64))
+    normalized = normalize_image(encode(image, "PNG"), max_edge=32)
+    output = decode(normalized)
+    assert normalized.source_format == "PNG" and normalized.mime_type == "image/jpeg"
+    assert output.getpixel((24, 16)) > (240, 240, 240)
+    assert output.getpixel((8, 16))[2] > 200
+
+
+def test_small_image_keeps_its_original_bytes():
+    data = camera_frame(320, 240, quality=30, orientation=1)
+    normalized = normalize_image(data, max_edge=1000, quality=95)
+    assert normalized.data == data and normalized.mime_type == "image/jpeg"
+
+
+def test_unreadable_data_is_a_value_error():
+    with pytest.raises(ValueError):
+        normalize_image(b"not an image")
+
+
+def test_prepare_image_normalizes_in_a_thread():
+    normalized = asyncio.run(prepare_image(camera_frame(1600, 1200), caller="test"))
+    assert max(normalized.size) == image_prep.IMAGE_MAX_EDGE
+
+
+def test_prepare_image_passes_through_when_disabled(monkeypatch):
+    monkeypatch.setattr(image_prep, "IMAGE_NORMALIZE", False)
+    data = encode(Image.new("RGB", (32, 16)), "PNG")
+    normalized = asyncio.run(prepare_image(data))
+    assert normalized.data == data
+    assert normalized.mime_type == "image/png" and normalized.size == (32, 16)
@@ -0,0 +1,66 @@
+import asyncio
+from src.utils.indexing_jobs import IndexingJobManager
+
+
+def states(events):
+    return [event["content"]["state"] for event in events]
+
+
+def test_subscriber_gets_final_event_when_job_finishes_while_consumer_is_busy():
+    async def run():
+        manager = IndexingJobManager(workers=1)
+        started = asyncio.Event()
+        finish = asyncio.Event()
+
+        async def job_run(on_progress):
+            started.set()
+            await finish.wait()
+            return {"chunks": 3}
+
+        job = manager.submit("url", "https://example.com", job_run)
+        await started.wait()
+        received = []
+        async for event in manager.subscribe(job.id):
+            received.append(event)
+            if len(received) == 1:
+                # The job finishes while the consumer is still handling the running event
+                finish.set()
+                await asyncio.sleep(0.05)
+        return job, received
+
+    job, received = asyncio.run(run())
+    assert job.state == "succeeded"
+    assert states(received) == ["running", "succeeded"]
+    assert received[-1]["content"]["result"] == {"chunks": 3}
+
+
+def test_subscriber_of_failed_job_gets_failed_event():
+    async def run():
+        manager = IndexingJobManager(workers=1)
+
+        async def job_run(on_progress):
+            on_progress({"chunks": 1, "batches": 1, "chunks_per_second": 1.0})
+            raise ValueError("bad source")
+
+        job = manager.submit("doc", "book.pdf", job_run)
+        return [event async for event in manager.subscribe(job.id)]
+
+    received = asyncio.run(run())
+    assert states(received)[0] == "queued"
+    assert states(received)[-1] == "failed"
+    assert received[-1]["content"]["error"] == "bad source"
+
+
+def test_subscribing_to_finished_job_yields_its_final_snapshot_only():
+    async def run():
+        manager = IndexingJobManager(workers=1)
+
+        async def job_run(on_progress):
+            return {}
+
+        job = manager.submit("url", "https://example.com", job_run)
+        while job.state != "succeeded":
+            await asyncio.sleep(0.01)
+        return [event async for event in manager.subscribe(job.id)]
+
+    assert states(asyncio.run(run())) == ["succeeded"]
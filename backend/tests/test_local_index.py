@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+from qdrant_client import models
+from src.utils import local_index
+from src.utils.local_index import LocalCollection, LocalIndexClient
+
+DIM = 16
+
+
+def vectors(count, seed):
+    return np.random.default_rng(seed).normal(size=(count, DIM)).astype(np.float32)
+
+
+def list_contents(collection):
+    return {list_id: sorted(rows.tolist()) for list_id, rows in collection._lists.items() if len(rows)}
+
+
+def test_ivf_lists_are_updated_incrementally_and_match_a_full_rebuild(tmp_path, monkeypatch):
+    monkeypatch.setattr(local_index, "LOCAL_INDEX_MIN_TRAIN", 200)
+    collection = LocalCollection(str(tmp_path / "docs"), DIM, approximate=True)
+    collection.upsert([f"p{i}" for i in range(200)], vectors(200, 0), [{}] * 200)
+    assert collection._centroids is not None
+
+    rebuilds = []
+    monkeypatch.setattr(collection, "_rebuild_lists", lambda: rebuilds.append(1))
+    collection.upsert([f"p{i}" for i in range(200, 260)], vectors(60, 1), [{}] * 60)
+    # Existing points moved to new vectors, one of them twice in the same batch
+    collection.upsert(["p3", "p7", "p3", "p250"], vectors(4, 2), [{}] * 4)
+    collection.delete(["p5", "p6", "p255", "missing"])
+    assert not rebuilds
+
+    incremental = list_contents(collection)
+    monkeypatch.undo()
+    collection._rebuild_lists()
+    assert incremental == list_contents(collection)
+    assert sum(len(rows) for rows in incremental.values()) == len(collection) == 257
+
+    reopened = LocalCollection(str(tmp_path / "docs"), approximate=True)
+    assert list_contents(reopened) == incremental
+
+
+def test_scroll_filters(tmp_path):
+    client = LocalIndexClient(str(tmp_path), approximate=False)
+    client.create_collection("docs", models.VectorParams(size=DIM, distance=models.Distance.COSINE))
+    payloads = [{"page_content": f"chunk {i}", "metadata": {"source": f"book{i % 3}.pdf", "page": i % 4,
+                                                             "tags": ["a", "b"] if i % 2 else ["c"]}}
+                for i in range(12)]
+    client.upsert("docs", [models.PointStruct(id=i, vector=v.tolist(), payload=p)
+                           for i, (v, p) in enumerate(zip(vectors(12, 3), payloads))])
+
+    def ids(scroll_filter, limit=100):
+        records, _ = client.scroll("docs", scroll_filter=scroll_filter, limit=limit)
+        return [int(record.id) for record in records]
+
+    def match(key, value):
+        return models.FieldCondition(key=key, match=models.MatchValue(value=value))
+
+    assert ids(models.Filter(must=[match("metadata.source", "book1.pdf")])) == [1, 4, 7, 10]
+    assert ids(models.Filter(must=[match("metadata.source", "book1.pdf"), match("metadata.page", 0)])) == [4]
+    assert ids(models.Filter(must=match("metadata.tags", "c"),
+                             must_not=[match("metadata.source", "book0.pdf")])) == [2, 4, 8, 10]
+    assert ids(models.Filter(should=[models.FieldCondition(key="metadata.page",
+                                                           match=models.MatchAny(any=[1, 3]))])) == [1, 3, 5, 7, 9, 11]
+    records, next_offset = client.scroll("docs", scroll_filter=models.Filter(must=[match("metadata.tags", "a")]),
+                                         limit=2)
+    assert [int(r.id) for r in records] == [1, 3] and next_offset == 5
+
+    with pytest.raises(ValueError):
+        ids(models.Filter(must=[models.FieldCondition(key="metadata.page", range=models.Range(gte=2))]))
+    assert client.create_payload_index("docs", "metadata.page") is None
@@ -0,0 +1,120 @@
+import uuid
+import asyncio
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from qdrant_client import QdrantClient, AsyncQdrantClient, models
+from tests import fakes
+from src.utils import clients
+from src.utils.collection_profiles import collection_profile
+from src.utils.ingest_pipeline import ingest_documents, existing_chunk_ids
+from src.utils.local_index import LocalIndexClient, AsyncLocalIndexClient
+
+# Same fixture as benchmarks/parity_local_index.py, at a size that runs in a few seconds
+COLLECTION = "parity"
+K = 4
+
+
+def make_vectors(points, queries, dim, clusters, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=points + queries)
+    vectors = centers[labels] + 0.6 * rng.normal(size=(points + queries, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors[:points], vectors[points:]
+
+
+def recall(found, truth):
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+
+def load(client, data):
+    client.create_collection(COLLECTION, **collection_profile().create_collection_kwargs(size=data.shape[1]))
+    client.upsert(COLLECTION, points=[
+        models.PointStruct(
+            id=str(uuid.UUID(int=i)),
+            vector=data[i].tolist(),
+            payload={"page_content": f"chunk {i}", "metadata": {"source": f"doc{i % 7}", "page": i}},
+        )
+        for i in range(len(data))
+    ], wait=True)
+    # Drop every 10th point, so deleted points must not come back from searches
+    client.delete(COLLECTION, points_selector=models.PointIdsList(
+        points=[str(uuid.UUID(int=i)) for i in range(0, len(data), 10)]
+    ), wait=True)
+
+
+def top_k(client, queries, k):
+    return [
+        [(str(hit.id), hit.payload["page_content"])
+         for hit in client.search(COLLECTION, query_vector=query.tolist(), limit=k,
+                                  search_params=collection_profile().search_params())]
+        for query in queries
+    ]
+
+
+def scrolled(client, source):
+    ids, offset = set(), None
+    source_filter = models.Filter(
+        must=[models.FieldCondition(key="metadata.source", match=models.MatchValue(value=source))]
+    )
+    while True:
+        points, offset = client.scroll(COLLECTION, scroll_filter=source_filter, limit=100, offset=offset,
+                                       with_payload=False, with_vectors=False)
+        ids.update(str(point.id) for point in points)
+        if offset is None:
+            return ids
+
+
+async def ingested(client):
+    collection = "parity_ingest"
+    await client.create_collection(collection, **collection_profile().create_collection_kwargs())
+    docs = [Document(page_content=f"ingest chunk {i}", metadata={"source": "ingest"}) for i in range(300)]
+    await ingest_documents(client, collection, docs, batch_size=64, concurrency=4)
+    hits = await client.search(collection, query_vector=fakes.fake_vector("ingest chunk 42"), limit=3)
+    return await existing_chunk_ids(client, collection, "ingest"), [str(hit.id) for hit in hits]
+
+
+@pytest.fixture(scope="module")
+def results(tmp_path_factory):
+    """Top-k, scroll-by-source and ingestion results of each backend on the same fixture."""
+    workdir = tmp_path_factory.mktemp("parity")
+    # Enough points for the approximate backend to train its IVF index
+    data, queries = make_vectors(3000, 50, 256, 50)
+    # Module-scoped, so it runs before the per-test fake environment is installed
+    monkeypatch = pytest.MonkeyPatch()
+    fakes.install_fake_environment(monkeypatch)
+    clients.registry.set("async_openai", fakes.FakeAsyncOpenAI(embed_latency=0))
+    backends = {
+        "qdrant": (QdrantClient(location=":memory:"), AsyncQdrantClient(location=":memory:")),
+        "numpy": (LocalIndexClient(str(workdir / "numpy")), None),
+        "mmap": (LocalIndexClient(str(workdir / "mmap"), approximate=True), None),
+    }
+    found = {}
+    try:
+        for name, (client, async_client) in backends.items():
+            load(client, data)
+            found[name] = {
+                "top_k": top_k(client, queries, K),
+                "scroll": [scrolled(client, f"doc{i}") for i in range(7)],
+                "ingest": asyncio.run(ingested(async_client or AsyncLocalIndexClient(client))),
+            }
+    finally:
+        clients.registry.clear()
+        monkeypatch.undo()
+    return found
+
+
+def test_exact_backend_returns_qdrants_top_k(results):
+    assert results["numpy"]["top_k"] == results["qdrant"]["top_k"]
+
+
+def test_approximate_backend_recall(results):
+    ids = {name: [[point_id for point_id, _ in hits] for hits in results[name]["top_k"]] for name in results}
+    assert recall(ids["mmap"], ids["qdrant"]) >= 0.9
+
+
+@pytest.mark.parametrize("backend", ["numpy", "mmap"])
+def test_scroll_and_ingestion_match_qdrant(results, backend):
+    assert results[backend]["scroll"] == results["qdrant"]["scroll"]
+    assert results[backend]["ingest"] == results["qdrant"]["ingest"]
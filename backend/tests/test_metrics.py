@@ -0,0 +1,77 @@
+import pytest
+from src.utils import metrics as metrics_module
+from src.utils.metrics import MetricsRegistry
+
+
+def test_counter_and_gauge_render_in_the_text_format():
+    registry = MetricsRegistry()
+    requests = registry.counter("app_requests_total", "Requests by path.", ("path", "status"))
+    requests.inc(path="/b", status="200")
+    requests.inc(2, path="/a", status="200")
+    registry.gauge("app_sessions", "Open sessions.", function=lambda: 3)
+    assert registry.render() == (
+        "# HELP app_requests_total Requests by path.\n"
+        "# TYPE app_requests_total counter\n"
+        'app_requests_total{path="/a",status="200"} 2\n'
+        'app_requests_total{path="/b",status="200"} 1\n'
+        "# HELP app_sessions Open sessions.\n"
+        "# TYPE app_sessions gauge\n"
+        "app_sessions 3\n"
+    )
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    latency = registry.histogram("app_seconds", "Latency.", ("op",), buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        latency.observe(value, op="read")
+    assert registry.render().splitlines()[2:] == [
+        'app_seconds_bucket{op="read",le="0.1"} 2',
+        'app_seconds_bucket{op="read",le="1.0"} 3',
+        'app_seconds_bucket{op="read",le="+Inf"} 4',
+        'app_seconds_sum{op="read"} 3.65',
+        'app_seconds_count{op="read"} 4',
+    ]
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    registry.counter("app_errors_total", "Errors.", ("message",)).inc(message='bad "quote"\\\n')
+    assert registry.render().splitlines()[-1] == 'app_errors_total{message="bad \\"quote\\"\\\\\\n"} 1'
+
+
+def test_labelled_gauge_function_and_failing_function():
+    registry = MetricsRegistry()
+    registry.gauge("app_pool", "Pool size.", ("pool",), function=lambda: {("http",): 4, ("qdrant",): 1.5})
+    registry.gauge("app_broken", "Raises.", function=lambda: 1 / 0)
+    assert registry.render().splitlines() == [
+        "# HELP app_pool Pool size.",
+        "# TYPE app_pool gauge",
+        'app_pool{pool="http"} 4',
+        'app_pool{pool="qdrant"} 1.5',
+        "# HELP app_broken Raises.",
+        "# TYPE app_broken gauge",
+    ]
+
+
+def test_wrong_labels_and_conflicting_registration_are_errors():
+    registry = MetricsRegistry()
+    counter = registry.counter("app_total", "Total.", ("kind",))
+    assert registry.counter("app_total", "Total.", ("kind",)) is counter
+    with pytest.raises(ValueError):
+        counter.inc(other="x")
+    with pytest.raises(ValueError):
+        registry.gauge("app_total", "Total.", ("kind",))
+
+
+def test_span_records_the_outcome(monkeypatch):
+    registry = MetricsRegistry()
+    histogram = registry.histogram("upstream_seconds", "Upstream calls.", ("upstream", "operation", "outcome"))
+    monkeypatch.setattr(metrics_module, "UPSTREAM_SECONDS", histogram)
+    monkeypatch.setattr(metrics_module, "METRICS_ENABLED", True)
+    with metrics_module.span("qdrant", "search"):
+        pass
+    with pytest.raises(RuntimeError):
+        with metrics_module.span("qdrant", "search"):
+            raise RuntimeError("timeout")
+    assert {key[2] for key in histogram.samples()} == {"ok", "error"}
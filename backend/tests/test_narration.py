@@ -0,0 +1,54 @@
+import base64
+import asyncio
+from src.utils.narration import Narrator, SentenceSegmenter
+
+TEXT = ("The fox walks through the dark forest. She hears the river far away. "
+        "At last she finds her family near the old tree.")
+
+
+def narrate(synthesize, text=TEXT):
+    events = []
+
+    async def emit(event_type, content):
+        events.append((event_type, content))
+
+    async def run():
+        narrator = Narrator(synthesize, emit, concurrency=2)
+        for word in text.split(" "):
+            narrator.feed(word + " ")
+        narrator.close()
+        return await narrator.run()
+
+    return asyncio.run(run()), events
+
+
+def test_segmenter_keeps_abbreviations_and_short_sentences_together():
+    segmenter = SentenceSegmenter(min_chars=10)
+    assert segmenter.feed("Wow! Dr. Smith reads the book. Then ") == ["Wow! Dr. Smith reads the book."]
+    assert segmenter.flush() == "Then"
+
+
+def test_sentences_are_narrated_in_order():
+    async def synthesize(sentence):
+        await asyncio.sleep(0.03 if sentence.startswith("The fox") else 0.0)
+        return sentence.encode()
+
+    audio, events = narrate(synthesize)
+    chunks = [content for event_type, content in events if event_type == "on_image_audio_chunk"]
+    assert [chunk["index"] for chunk in chunks] == [0, 1, 2]
+    assert b"".join(base64.b64decode(chunk["audio"]) for chunk in chunks) == audio
+    assert audio.startswith(b"The fox")
+
+
+def test_failed_sentence_is_reported_as_skipped():
+    async def synthesize(sentence):
+        if "river" in sentence:
+            raise RuntimeError("Polly throttled")
+        return sentence.encode()
+
+    audio, events = narrate(synthesize)
+    assert [event_type for event_type, _ in events] == [
+        "on_image_audio_chunk", "on_image_audio_skipped", "on_image_audio_chunk"]
+    skipped = events[1][1]
+    assert skipped == {"index": 1, "text": "She hears the river far away.", "error": "Polly throttled"}
+    assert b"river" not in audio
@@ -0,0 +1,75 @@
+from io import BytesIO
+from PIL import Image, ImageEnhance
+from src.utils.page_cache import HASH_SIZE, PageCache, perceptual_hash
+from tests.fakes import camera_frame
+
+RESULT = {"text": "Once upon a time.", "image_url": "https://example.com/a.bmp"}
+
+
+def recapture(frame: bytes) -> bytes:
+    # The same page again, a little brighter and saved at another quality. A camera that moved
+    # gets a different hash, and is matched by the OCR text instead
+    with Image.open(BytesIO(frame)) as image:
+        exif = image.getexif()
+        brighter = ImageEnhance.Brightness(image).enhance(1.08)
+    output = BytesIO()
+    brighter.save(output, format="JPEG", quality=75, exif=exif)
+    return output.getvalue()
+
+
+def test_hash_of_a_recaptured_page_is_close_and_of_another_page_is_far():
+    page = perceptual_hash(camera_frame(seed=1))
+    again = perceptual_hash(recapture(camera_frame(seed=1)))
+    other = perceptual_hash(camera_frame(seed=2))
+    assert page < 2 ** (HASH_SIZE * HASH_SIZE)
+    assert (page ^ again).bit_count() <= PageCache().max_distance < (page ^ other).bit_count()
+
+
+def test_frame_lookup_matches_within_the_hamming_distance():
+    cache = PageCache(max_distance=2)
+    cache.store("Once upon a time.", RESULT, frame_hash=0b1111_0000)
+    assert cache.lookup_frame(0b1111_0011) == RESULT
+    assert cache.lookup_frame(0b1111_0111) is None
+    assert cache.stats()["frame_hits"] == 1
+
+
+def test_closest_page_wins():
+    cache = PageCache(max_distance=4)
+    cache.store("first page", {"text": "first"}, frame_hash=0b0000_0000)
+    cache.store("second page", {"text": "second"}, frame_hash=0b0000_0111)
+    assert cache.lookup_frame(0b0000_0110) == {"text": "second"}
+    assert cache.lookup_frame(0b0000_0001) == {"text": "first"}
+
+
+def test_text_lookup_ignores_case_spacing_and_punctuation_and_remembers_the_frame():
+    cache = PageCache(max_distance=0)
+    cache.store("Once upon a time.", RESULT)
+    assert cache.lookup_text("once  upon a time", frame_hash=42) == RESULT
+    assert cache.lookup_frame(42) == RESULT
+    assert cache.lookup_text("Twice upon a time.") is None
+    stats = cache.stats()
+    assert (stats["text_hits"], stats["frame_hits"], stats["misses"]) == (1, 1, 1)
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("src.utils.page_cache.time.time", lambda: now[0])
+    cache = PageCache(ttl_seconds=60)
+    cache.store("Once upon a time.", RESULT, frame_hash=7)
+    now[0] += 59
+    assert cache.lookup_frame(7) == RESULT
+    now[0] += 2
+    assert cache.lookup_frame(7) is None
+    assert cache.lookup_text("Once upon a time.") is None
+    assert cache.stats()["expired"] == 1 and cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_page_is_evicted():
+    cache = PageCache(max_entries=2, max_distance=0)
+    cache.store("first page", {"text": "first"}, frame_hash=1)
+    cache.store("second page", {"text": "second"}, frame_hash=2)
+    cache.lookup_frame(1)
+    cache.store("third page", {"text": "third"}, frame_hash=3)
+    assert cache.lookup_frame(2) is None
+    assert cache.lookup_frame(1) == {"text": "first"}
+    assert cache.stats()["evicted"] == 1
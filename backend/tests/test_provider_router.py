@@ -0,0 +1,246 @@
+import time
+import asyncio
+import pytest
+from tests.fakes import (Faults, FakeAsyncHttp, FakeAsyncOpenAI, FakeGemini, FakePolly, FakeProvider, FakeS3,
+                         camera_frame)
+from src.utils import upload_s3
+from src.utils.page_cache import page_cache
+from src.utils.provider_router import (ROUTER_MIN_SAMPLES, CircuitBreaker, Deadline, DeadlineExceeded, PinnedRouter,
+                                       Provider, ProviderRouter, ProviderUnavailable)
+
+
+def router(*fakes, **kwargs):
+    providers = [Provider(name, fake) for name, fake in fakes]
+    return ProviderRouter("test", providers, **{"hedge": True, "hedge_after": 1.0, **kwargs})
+
+
+async def timed(call):
+    started = time.perf_counter()
+    try:
+        result = await call
+    except Exception as e:
+        result = e
+    return result, time.perf_counter() - started
+
+
+def test_slow_call_is_hedged_after_the_p95_and_the_loser_cancelled():
+    slow_call = ROUTER_MIN_SAMPLES + 1
+    primary = FakeProvider("primary", latency=lambda call: 2.0 if call == slow_call else 0.01)
+    alternate = FakeProvider("alternate", latency=0.05)
+    test_router = router(("primary", primary), ("alternate", alternate))
+
+    async def run():
+        for _ in range(ROUTER_MIN_SAMPLES):
+            assert await test_router.call() == ("primary", "primary")
+        calls_before = alternate.calls
+        outcome = await timed(test_router.call())
+        await asyncio.sleep(0)
+        return calls_before, outcome
+
+    calls_before, ((result, provider), elapsed) = asyncio.run(run())
+    assert calls_before == 0
+    assert (result, provider) == ("alternate", "alternate")
+    # Hedged after the primary's p95 (about 10ms), far sooner than hedge_after
+    assert elapsed < 0.5
+    assert primary.cancelled == 1
+    assert test_router.stats()["hedges"] == 1
+
+
+def test_without_hedging_a_slow_call_waits_for_its_provider():
+    primary = FakeProvider("primary", latency=0.3)
+    alternate = FakeProvider("alternate", latency=0.01)
+    test_router = router(("primary", primary), ("alternate", alternate), hedge=False, hedge_after=0.05)
+    (result, provider), elapsed = asyncio.run(timed(test_router.call()))
+    assert provider == "primary" and elapsed >= 0.3
+    assert alternate.calls == 0
+
+
+def test_failing_provider_fails_over_at_once():
+    primary = FakeProvider("primary", faults=Faults(down=True, failure_latency=0.01))
+    alternate = FakeProvider("alternate", latency=0.01)
+    test_router = router(("primary", primary), ("alternate", alternate))
+    (result, provider), elapsed = asyncio.run(timed(test_router.call()))
+    assert provider == "alternate" and elapsed < 0.5
+    assert test_router.stats()["failovers"] == 1
+
+
+def test_circuit_opens_after_repeated_failures_and_closes_after_a_successful_trial():
+    primary = FakeProvider("primary", latency=0.01, faults=Faults(down=True))
+    alternate = FakeProvider("alternate", latency=0.01)
+    test_router = router(("primary", primary), ("alternate", alternate))
+    breaker = test_router.providers[0].breaker
+    breaker.reset_seconds = 0.2
+
+    async def run():
+        for _ in range(10):
+            assert (await test_router.call())[1] == "alternate"
+        assert breaker.state == "open"
+        assert primary.calls == breaker.failure_threshold
+        assert test_router.stats()["rejected"] == 10 - breaker.failure_threshold
+
+        # Still down when the reset time is up: the trial call fails and the circuit opens again
+        await asyncio.sleep(0.2)
+        assert (await test_router.call())[1] == "alternate"
+        assert breaker.state == "open" and primary.calls == breaker.failure_threshold + 1
+
+        primary.faults.down = False
+        await asyncio.sleep(0.2)
+        assert (await test_router.call())[1] == "primary"
+        assert breaker.state == "closed"
+
+    asyncio.run(run())
+
+
+def test_half_open_circuit_lets_one_trial_call_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.0)
+    assert breaker.record_failure() is True
+    assert breaker.allow() is True
+    assert breaker.allow() is False
+    breaker.release()
+    assert breaker.allow() is True
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_deadline_ends_the_call_without_blaming_the_providers():
+    primary = FakeProvider("primary", latency=5.0)
+    alternate = FakeProvider("alternate", latency=5.0)
+    test_router = router(("primary", primary), ("alternate", alternate), hedge_after=0.05)
+
+    async def run():
+        outcome = await timed(test_router.call(deadline=Deadline(0.3)))
+        await asyncio.sleep(0)
+        return outcome
+
+    error, elapsed = asyncio.run(run())
+    assert isinstance(error, DeadlineExceeded)
+    assert 0.29 < elapsed < 0.5
+    assert primary.cancelled == alternate.cancelled == 1
+    assert all(p.breaker.state == "closed" and p.breaker.failures == 0 for p in test_router.providers)
+
+
+
+def test_failure_seen_after_the_deadline_raises_deadline_exceeded():
+    primary = FakeProvider("primary", faults=Faults(down=True, failure_latency=0.1))
+    alternate = FakeProvider("alternate", latency=0.01)
+    test_router = router(("primary", primary), ("alternate", alternate), hedge=False)
+
+    async def block_the_loop():
+        # Busy on the event loop past the deadline, so the primary's failure and the
+        # deadline are seen in the same wakeup
+        await asyncio.sleep(0.05)
+        time.sleep(0.25)
+
+    async def run(provider):
+        blocker = asyncio.ensure_future(block_the_loop())
+        outcome = await timed(test_router.call(deadline=Deadline(0.15), provider=provider))
+        await blocker
+        return outcome
+
+    for provider in ("primary", None):
+        error, elapsed = asyncio.run(run(provider))
+        assert isinstance(error, DeadlineExceeded)
+    assert test_router.stats()["deadline_exceeded"] == 2
+    assert test_router.stats()["failovers"] == 0
+
+
+def test_attempt_timeout_counts_as_a_failure():
+    slow = FakeProvider("slow", latency=1.0)
+    fallback = FakeProvider("fallback", latency=0.01)
+    test_router = ProviderRouter("test", [Provider("slow", slow, attempt_timeout=0.05),
+                                          Provider("fallback", fallback)], hedge=False)
+    (result, provider), elapsed = asyncio.run(timed(test_router.call()))
+    assert provider == "fallback" and elapsed < 0.5
+    assert test_router.providers[0].breaker.failures == 1
+
+
+def test_every_circuit_open_fails_immediately():
+    primary = FakeProvider("primary", latency=0.01)
+    alternate = FakeProvider("alternate", latency=0.01)
+    test_router = router(("primary", primary), ("alternate", alternate))
+    for provider in test_router.providers:
+        for _ in range(provider.breaker.failure_threshold):
+            provider.breaker.record_failure()
+    with pytest.raises(ProviderUnavailable):
+        asyncio.run(test_router.call())
+    assert primary.calls == alternate.calls == 0
+
+
+def test_every_provider_failing_raises_provider_unavailable():
+    test_router = router(("primary", FakeProvider("primary", faults=Faults(down=True))),
+                         ("alternate", FakeProvider("alternate", faults=Faults(down=True))))
+    with pytest.raises(ProviderUnavailable):
+        asyncio.run(test_router.call())
+
+
+def test_discarded_results_are_closed_by_a_task_the_router_keeps():
+    async def run():
+        closed = []
+
+        async def close(result):
+            await asyncio.sleep(0.01)
+            closed.append(result)
+
+        test_router = router(("primary", FakeProvider("primary")), on_discard=close)
+        late = asyncio.get_running_loop().create_future()
+        late.set_result("late stream")
+        test_router._discard(late)
+        pending = len(test_router._discarding)
+        await asyncio.sleep(0.05)
+        return pending, closed, len(test_router._discarding)
+
+    pending, closed, remaining = asyncio.run(run())
+    assert pending == 1
+    assert closed == ["late stream"]
+    assert remaining == 0
+
+
+def test_pinned_calls_stay_with_the_provider_that_answered_first():
+    primary = FakeProvider("primary", faults=Faults(down=True, failure_latency=0.01))
+    alternate = FakeProvider("alternate", latency=0.01)
+    pinned = PinnedRouter(router(("primary", primary), ("alternate", alternate)))
+
+    async def run():
+        return await asyncio.gather(*(pinned.call() for _ in range(4)))
+
+    results = asyncio.run(run())
+    assert results == [("alternate", "alternate")] * 4
+    # Only the first call tried the primary; the others waited for it and went straight to the alternate
+    assert primary.calls == 1
+
+
+def test_pinned_provider_is_not_failed_over():
+    primary = FakeProvider("primary", latency=0.01)
+    alternate = FakeProvider("alternate", latency=0.01)
+    test_router = router(("primary", primary), ("alternate", alternate))
+    pinned = PinnedRouter(test_router)
+
+    async def run():
+        first = await pinned.call()
+        primary.faults = Faults(down=True, failure_latency=0.01)
+        return first, await timed(pinned.call())
+
+    first, (error, _) = asyncio.run(run())
+    assert first == ("primary", "primary")
+    assert isinstance(error, ProviderUnavailable)
+    assert alternate.calls == 0
+
+
+@pytest.mark.parametrize("slow", ["download", "upload"])
+def test_image_download_and_uploads_stop_at_the_deadline(slow, fresh_clients, monkeypatch):
+    fresh_clients.set("gemini:gemini-1.5-pro", FakeGemini(latency=0.01, text=lambda parts: "Once upon a time."))
+    fresh_clients.set("async_openai", FakeAsyncOpenAI(first_token_latency=0.01, token_latency=0.001,
+                                                      text="A short explanation."))
+    fresh_clients.set("async_http", FakeAsyncHttp(content=camera_frame(64, 64), latency=5.0 if slow == "download" else 0.01))
+    fresh_clients.set(f"boto3:s3:{upload_s3.S3_REGION}", FakeS3(latency=2.0 if slow == "upload" else 0.01))
+    fresh_clients.set(f"boto3:polly:{upload_s3.S3_REGION}", FakePolly(latency=0.01))
+    monkeypatch.setattr(page_cache, "max_entries", 0)
+    monkeypatch.setattr(upload_s3, "_known_keys", type(upload_s3._known_keys)())
+
+    async def run():
+        return await timed(upload_s3.process_image(camera_frame(320, 240), deadline=Deadline(0.5)))
+
+    result, elapsed = asyncio.run(run())
+    assert elapsed < 1.0
+    assert result["explanation_text"] and result["image_url"] is None
+    assert (result.get("mp3_url") is None) == (slow == "upload")
@@ -0,0 +1,102 @@
+import json
+import asyncio
+from src.utils.question_mux import QuestionMultiplexer
+
+
+def answerer(log, tokens=3, token_latency=0.01):
+    async def answer(question):
+        log.append(("start", question))
+        yield {"event_type": "on_retriever_end", "content": []}
+        for n in range(tokens):
+            await asyncio.sleep(token_latency)
+            yield {"event_type": "on_chat_model_stream", "content": f"{question}:{n}"}
+        log.append(("end", question))
+        yield {"event_type": "done"}
+
+    return answer
+
+
+async def settle(mux):
+    while mux.tasks or not mux.queued.empty():
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.05)
+    await mux.close()
+
+
+def test_plain_text_questions_keep_the_original_protocol():
+    log, sent = [], []
+
+    async def send(event):
+        sent.append(event)
+
+    async def run():
+        mux = QuestionMultiplexer(answerer(log), send)
+        await mux.handle("first")
+        await mux.handle("second")
+        await settle(mux)
+
+    asyncio.run(run())
+    # Answered one after the other, in order, none cancelled
+    assert log == [("start", "first"), ("end", "first"), ("start", "second"), ("end", "second")]
+    assert all("request_id" not in event for event in sent)
+    assert [event["event_type"] for event in sent].count("done") == 0
+    assert [event["content"] for event in sent if event["event_type"] == "on_chat_model_stream"] == [
+        "first:0", "first:1", "first:2", "second:0", "second:1", "second:2"]
+
+
+def test_json_questions_are_multiplexed_with_request_ids():
+    log, sent = [], []
+
+    async def send(event):
+        sent.append(event)
+
+    async def run():
+        mux = QuestionMultiplexer(answerer(log), send)
+        await mux.handle(json.dumps({"type": "question", "question": "a", "request_id": "q1"}))
+        await mux.handle(json.dumps({"type": "question", "question": "b", "request_id": "q2"}))
+        await settle(mux)
+
+    asyncio.run(run())
+    # Both started before either finished
+    assert log[:2] == [("start", "a"), ("start", "b")]
+    assert all(event["request_id"] in ("q1", "q2") for event in sent)
+    assert sorted(event["request_id"] for event in sent if event["event_type"] == "done") == ["q1", "q2"]
+
+
+def test_superseding_and_cancelling_json_questions():
+    log, sent = [], []
+
+    async def send(event):
+        sent.append(event)
+
+    async def run():
+        mux = QuestionMultiplexer(answerer(log, tokens=50), send)
+        await mux.handle(json.dumps({"type": "question", "question": "a", "request_id": "q1"}))
+        await asyncio.sleep(0.05)
+        await mux.handle(json.dumps({"type": "question", "question": "b", "request_id": "q2", "supersede": True}))
+        await asyncio.sleep(0.05)
+        await mux.handle(json.dumps({"type": "cancel", "request_id": "q2"}))
+        await settle(mux)
+
+    asyncio.run(run())
+    assert [(e["request_id"], e["content"]) for e in sent if e["event_type"] == "cancelled"] == [
+        ("q1", "superseded"), ("q2", "cancelled")]
+    assert not any(e["event_type"] == "done" for e in sent)
+
+
+def test_close_stops_queued_plain_text_questions():
+    log = []
+
+    async def send(event):
+        pass
+
+    async def run():
+        mux = QuestionMultiplexer(answerer(log, tokens=50), send)
+        await mux.handle("first")
+        await mux.handle("second")
+        await asyncio.sleep(0.05)
+        await mux.close()
+        await asyncio.sleep(0.05)
+
+    asyncio.run(run())
+    assert log == [("start", "first")]
@@ -0,0 +1,127 @@
+import time
+import asyncio
+import hashlib
+from io import BytesIO
+import pytest
+from PIL import Image
+from src.utils import renditions
+from src.utils.renditions import Rendition, RenditionStore, choose_format, etag_matches, parse_range, rendition_response
+
+RGB565_BYTES = renditions.RENDITION_SIZE[0] * renditions.RENDITION_SIZE[1] * 2
+
+
+def image_id(n: int) -> str:
+    return hashlib.sha256(str(n).encode()).hexdigest()
+
+
+def png(color) -> bytes:
+    output = BytesIO()
+    Image.new("RGB", (32, 32), color).save(output, format="PNG")
+    return output.getvalue()
+
+
+def test_parse_range():
+    assert parse_range(None, 100) is None
+    assert parse_range("bytes=0-9", 100) == (0, 9)
+    assert parse_range("bytes=90-", 100) == (90, 99)
+    assert parse_range("bytes=50-500", 100) == (50, 99)
+    assert parse_range("bytes=0-1,5-6", 100) is None
+    assert parse_range("items=0-9", 100) is None
+
+
+def test_parse_range_suffix():
+    assert parse_range("bytes=-10", 100) == (90, 99)
+    assert parse_range("bytes=-500", 100) == (0, 99)
+    with pytest.raises(ValueError):
+        parse_range("bytes=-0", 100)
+
+
+def test_parse_range_past_the_end_is_not_satisfiable():
+    with pytest.raises(ValueError):
+        parse_range("bytes=100-", 100)
+    with pytest.raises(ValueError):
+        parse_range("bytes=9-5", 100)
+
+
+def test_range_past_the_end_is_a_416_response():
+    rendition = Rendition(b"x" * 100, "jpeg", '"etag"', renditions.RENDITION_SIZE)
+    response = rendition_response(rendition, {"range": "bytes=200-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */100"
+
+    response = rendition_response(rendition, {"range": "bytes=-10"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == "bytes 90-99/100"
+    assert response.body == b"x" * 10
+
+
+def test_choose_format_by_query_parameter():
+    assert choose_format("jpg") == "jpeg"
+    assert choose_format("RAW") == "rgb565"
+    assert choose_format("gif") is None
+
+
+def test_choose_format_by_q_value():
+    assert choose_format(accept="image/jpeg;q=0.5, image/webp") == "webp"
+    assert choose_format(accept="image/webp;q=0.4, image/x-rgb565;q=0.9") == "rgb565"
+    # Among equal q-values a specific type beats a wildcard
+    assert choose_format(accept="*/*, image/bmp") == "bmp"
+    assert choose_format(accept="image/webp;q=0, image/bmp;q=0.1") == "bmp"
+    assert choose_format(accept="text/html, image/gif") is None
+    assert choose_format(accept=None) == renditions.RENDITION_DEFAULT_FORMAT
+
+
+def test_etag_matches():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('"other", W/"abc"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches('"abcd"', '"abc"')
+    assert not etag_matches(None, '"abc"')
+
+
+def test_store_is_bounded_by_bytes_and_evicts_sources_first():
+    store = RenditionStore(max_bytes=int(RGB565_BYTES * 2.5))
+
+    async def run():
+        for n in range(3):
+            store.add_source(image_id(n), png((n * 80, 0, 0)))
+            await store.get(image_id(n), "rgb565", lambda: None)
+
+    asyncio.run(run())
+    stats = store.stats()
+    assert stats["bytes"] <= store.max_bytes
+    assert stats["renditions"] == 2 and stats["sources"] == 0
+    # The oldest rendition went, so asking for it again needs its source
+    loads = []
+    asyncio.run(store.get(image_id(0), "rgb565", lambda: loads.append(1) or png((0, 0, 0))))
+    assert loads == [1]
+
+
+def test_concurrent_requests_share_one_render():
+    store = RenditionStore()
+    loads = []
+
+    def load():
+        time.sleep(0.05)
+        loads.append(1)
+        return png((0, 128, 0))
+
+    async def run():
+        return await asyncio.gather(*(store.get(image_id(1), "jpeg", load) for _ in range(8)))
+
+    results = asyncio.run(run())
+    assert len(loads) == 1 and store.stats()["renders"] == 1
+    assert all(result is results[0] for result in results)
+    assert results[0].data.startswith(b"\xff\xd8")
+
+
+def test_missing_source_is_none():
+    store = RenditionStore()
+    assert asyncio.run(store.get(image_id(1), "jpeg", lambda: None)) is None
+    assert store.stats()["renditions"] == 0
+
+
+def test_rgb565_is_big_endian_565():
+    data = renditions.render(png((255, 0, 0)), "rgb565")
+    assert len(data) == RGB565_BYTES
+    assert data[:2] == b"\xf8\x00"
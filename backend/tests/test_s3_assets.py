@@ -0,0 +1,116 @@
+import os
+import asyncio
+import hashlib
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import requests
+from src.utils import clients, upload_s3
+from src.utils.page_cache import page_cache
+from tests.fakes import FakeAsyncHttp, FakeAsyncOpenAI, FakeGemini, FakePolly, camera_frame
+
+moto = pytest.importorskip("moto")
+
+
+class Unseekable:
+    def __init__(self, data: bytes):
+        self._stream = BytesIO(data)
+
+    def read(self, size=-1):
+        return self._stream.read(size)
+
+    def seekable(self):
+        return False
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    """A moto bucket behind the boto3 client the app builds itself, and no keys remembered from other tests."""
+    monkeypatch.setattr(upload_s3, "_known_keys", type(upload_s3._known_keys)())
+    with moto.mock_aws():
+        client = clients.boto3_client("s3", upload_s3.S3_REGION)
+        client.create_bucket(Bucket=upload_s3.S3_BUCKET,
+                             CreateBucketConfiguration={"LocationConstraint": upload_s3.S3_REGION})
+        yield client
+
+
+def stored(s3, key):
+    return s3.get_object(Bucket=upload_s3.S3_BUCKET, Key=key)["Body"].read()
+
+
+def object_count(s3):
+    return s3.list_objects_v2(Bucket=upload_s3.S3_BUCKET).get("KeyCount", 0)
+
+
+def test_same_content_is_stored_once_under_its_hash(s3):
+    first = upload_s3.upload_to_s3(BytesIO(b"page one"), "scan.jpg", "image/jpeg")
+    upload_s3._known_keys.clear()  # a fresh process only has the HEAD request to go on
+    second = upload_s3.upload_to_s3(BytesIO(b"page one"), "other-name.JPG", "image/jpeg")
+    assert first["uploaded"] and not second["uploaded"]
+    assert first["key"] == second["key"] == (
+        f"{upload_s3.S3_ASSET_PREFIX}{hashlib.sha256(b'page one').hexdigest()}.jpg")
+    assert object_count(s3) == 1
+
+
+def test_concurrent_uploads_of_different_content_keep_their_own_objects(s3):
+    payloads = [f"illustration {i}".encode() * 1000 for i in range(32)]
+    with ThreadPoolExecutor(16) as pool:
+        results = list(pool.map(lambda data: upload_s3.upload_to_s3(BytesIO(data), "image.bmp", "image/bmp"), payloads))
+    assert len({r["key"] for r in results}) == len(payloads)
+    assert all(stored(s3, r["key"]) == data for r, data in zip(results, payloads))
+
+
+def test_concurrent_uploads_of_the_same_content_upload_it_once(s3):
+    shared = b"explanation audio" * 5000
+    with ThreadPoolExecutor(16) as pool:
+        results = list(pool.map(lambda _: upload_s3.upload_to_s3(BytesIO(shared), "a.mp3", "audio/mpeg"), range(16)))
+    assert sum(r["uploaded"] for r in results) == 1
+    assert object_count(s3) == 1
+    assert stored(s3, results[0]["key"]) == shared
+
+    head = s3.head_object(Bucket=upload_s3.S3_BUCKET, Key=results[0]["key"])
+    assert head["CacheControl"] == upload_s3.S3_CACHE_CONTROL
+    assert head["ContentType"] == "audio/mpeg"
+
+
+def test_large_file_is_a_multipart_upload(s3):
+    large = os.urandom(upload_s3.transfer_config.multipart_threshold + 3 * 1024 * 1024)
+    result = upload_s3.upload_to_s3(BytesIO(large), "book.pdf", "application/pdf")
+    assert "-" in s3.head_object(Bucket=upload_s3.S3_BUCKET, Key=result["key"])["ETag"]
+    assert stored(s3, result["key"]) == large
+
+
+def test_unseekable_stream_is_hashed_and_uploaded(s3):
+    result = upload_s3.upload_to_s3(Unseekable(b"streamed upload"), "stream.txt", "text/plain")
+    assert result["key"].endswith(hashlib.sha256(b"streamed upload").hexdigest() + ".txt")
+    assert stored(s3, result["key"]) == b"streamed upload"
+
+
+def test_presigned_url_names_the_content_key(s3, monkeypatch):
+    monkeypatch.setattr(upload_s3, "S3_PRESIGN_URLS", True)
+    result = upload_s3.upload_to_s3(BytesIO(b"page one"), "scan.jpg", "image/jpeg")
+    assert result["key"] in result["file_url"] and "Signature" in result["file_url"]
+    # moto intercepts requests (not httpx) for URLs outside botocore
+    assert requests.get(result["file_url"]).content == b"page one"
+
+
+def test_concurrent_pages_get_their_own_illustrations(s3, monkeypatch, fresh_clients):
+    # Each request OCRs its own page, and each DALL-E URL downloads a different picture
+    fresh_clients.set("gemini:gemini-1.5-pro", FakeGemini(
+        latency=0.01, text=lambda parts: f"Page {hashlib.sha256(parts[0]['data'].encode()).hexdigest()[:8]}."))
+    fresh_clients.set("async_openai", FakeAsyncOpenAI(first_token_latency=0.01, token_latency=0.001,
+                                                      image_latency=0.02, text="A short explanation. " * 5))
+    fresh_clients.set("async_http", FakeAsyncHttp(
+        content=lambda url: camera_frame(320, 320, seed=int(url.rsplit("/", 1)[1].split(".")[0])), latency=0.01))
+    fresh_clients.set(f"boto3:polly:{upload_s3.S3_REGION}", FakePolly(latency=0.01))
+    monkeypatch.setattr(page_cache, "max_entries", 0)
+
+    async def run():
+        return await asyncio.gather(*(upload_s3.process_image(camera_frame(seed=seed)) for seed in (1, 2)))
+
+    results = asyncio.run(run())
+    image_urls = {r["image_url"] for r in results}
+    assert None not in image_urls and len(image_urls) == 2
+    # Both pages are narrated from the same explanation, so the MP3 is the same bytes
+    audio_urls = {r["mp3_url"] for r in results}
+    assert None not in audio_urls and len(audio_urls) == 1
@@ -0,0 +1,42 @@
+import asyncio
+import threading
+from src.utils import session_store as session_store_module
+from src.utils.session_store import SessionStore
+
+
+def test_persistent_store_keeps_sqlite_off_the_event_loop(tmp_path, monkeypatch):
+    store = SessionStore(path=str(tmp_path / "sessions.db"))
+    db_threads = []
+    save, load = store._save, store._load
+    monkeypatch.setattr(store, "_save", lambda *args: (db_threads.append(threading.get_ident()), save(*args))[1])
+    monkeypatch.setattr(store, "_load", lambda *args: (db_threads.append(threading.get_ident()), load(*args))[1])
+    monkeypatch.setattr(session_store_module, "SESSION_RECENT_MESSAGES", 2)
+
+    async def summarize(summary, messages):
+        return f"{summary} {len(messages)} messages".strip()
+
+    async def run():
+        for n in range(3):
+            await store.async_history("s1")
+            await store.async_append("s1", f"question {n}", f"answer {n}")
+        await store.compact("s1", summarize)
+        return threading.get_ident(), await store.async_history("s1")
+
+    loop_thread, (summary, messages) = asyncio.run(run())
+    assert db_threads and loop_thread not in db_threads
+    assert summary == "4 messages"
+    assert [m["content"] for m in messages] == ["question 2", "answer 2"]
+
+    reopened = SessionStore(path=str(tmp_path / "sessions.db"))
+    assert reopened.history("s1") == (summary, messages)
+
+
+def test_in_memory_store_needs_no_thread():
+    store = SessionStore()
+
+    async def run():
+        await store.async_append("s1", "question", "answer")
+        return await store.async_history("s1")
+
+    assert asyncio.run(run()) == ("", [{"role": "user", "content": "question"},
+                                       {"role": "assistant", "content": "answer"}])
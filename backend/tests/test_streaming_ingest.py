@@ -0,0 +1,90 @@
+import asyncio
+import tracemalloc
+import pytest
+from fastapi import UploadFile
+from tests import fakes
+from src.utils import clients, index_qdrant, ingest_pipeline, openai_utils
+from src.utils.embedding_cache import EmbeddingCache
+
+
+@pytest.fixture
+def ingest(monkeypatch, tmp_path):
+    # Small batches so even a 10-page document fills the embedding pipeline, and no
+    # embedding cache, whose memory tier would grow with the document
+    monkeypatch.setattr(ingest_pipeline, "INGEST_BATCH_SIZE", 4)
+    monkeypatch.setattr(ingest_pipeline, "INGEST_CONCURRENCY", 2)
+    monkeypatch.setattr(openai_utils, "embedding_cache", EmbeddingCache(path=None, memory_items=0))
+    clients.registry.set("async_openai", fakes.FakeAsyncOpenAI(embed_latency=0.0))
+    qdrant = fakes.FakeAsyncQdrant()
+    clients.registry.set("async_qdrant", qdrant)
+
+    def run(pages):
+        path = tmp_path / f"book{pages}.pdf"
+        fakes.write_pdf(path, pages)
+
+        async def upload():
+            with open(path, "rb") as f:
+                return await index_qdrant.upload_file(UploadFile(file=f, filename="book.pdf"))
+
+        tracemalloc.start()
+        try:
+            result = asyncio.run(upload())
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return result, peak
+
+    return run
+
+
+def test_peak_memory_is_flat_in_document_size(ingest):
+    small_result, small = ingest(10)
+    large_result, large = ingest(1000)
+    assert small_result.startswith("Successfully uploaded")
+    assert large_result.startswith("Successfully uploaded")
+    # 100x the pages; the difference is the spool buffer (the small file fits a shorter read)
+    # and pypdf's cross-reference table, a few hundred bytes per page
+    assert large - small <= index_qdrant.SPOOL_CHUNK_SIZE + 2**19, f"peak {small / 2**20:.1f} MiB for 10 pages, {large / 2**20:.1f} MiB for 1000"
+
+
+def write_nested_pdf(path, texts):
+    """Pages under an intermediate /Pages node that holds their font, plus one page at the root."""
+    streams = [f"BT /F1 10 Tf 40 800 Td ({text}) Tj ET".encode("latin-1") for text in texts]
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R 6 0 R] /Count %d /MediaBox [0 0 612 842] >>" % len(texts),
+        b"<< /Type /Pages /Parent 2 0 R /Kids [4 0 R 5 0 R] /Count 2 "
+        b"/Resources << /Font << /F1 7 0 R >> >> >>",
+        b"<< /Type /Page /Parent 3 0 R /Contents 8 0 R >>",
+        b"<< /Type /Page /Parent 3 0 R /Contents 9 0 R >>",
+        b"<< /Type /Page /Parent 2 0 R /Resources << /Font << /F1 7 0 R >> >> /Contents 10 0 R >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ] + [b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream) for stream in streams]
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        f.writelines(b"%010d 00000 n \n" % offset for offset in offsets)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+
+def test_nested_page_tree_is_read_in_order_across_readers(monkeypatch, tmp_path):
+    # One page per reader, so every page is found again from the root of a fresh reader
+    monkeypatch.setattr(index_qdrant, "PDF_READER_PAGES", 1)
+    path = tmp_path / "nested.pdf"
+    write_nested_pdf(path, ["First page", "Second page", "Third page"])
+    pages = list(index_qdrant._iter_pages(str(path), "nested.pdf"))
+    assert [page.page_content for page in pages] == ["First page", "Second page", "Third page"]
+    assert [page.metadata["page"] for page in pages] == [0, 1, 2]
+
+
+def test_unreadable_pdf_returns_an_error(ingest, tmp_path):
+    path = tmp_path / "broken.pdf"
+    path.write_bytes(b"%PDF-1.4\nnot really a pdf\n")
+    result = asyncio.run(index_qdrant.upload_spooled_file(str(path), "broken.pdf"))
+    assert result["error"].startswith("Failed to load PDF file")
+    assert not path.exists()
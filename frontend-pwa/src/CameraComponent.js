@@ -2,6 +2,8 @@ import React, { useRef, useState, useEffect } from 'react';
 import './CameraComponent.css';
 
 const baseURL = 'https://nathang2022--readbuddy-backend-endpoint.modal.run' // 'http://localhost:8000'
+// Give up on an image request's events after this long (OCR, explanation and illustration together)
+const imageResultTimeoutMs = 180000;
 
 const CameraComponent = () => {
   const [isCameraOpen, setIsCameraOpen] = useState(false);
@@ -76,6 +78,45 @@ const CameraComponent = () => {
     }
   };
 
+	// Follow an image request's events, showing the explanation and image as they arrive.
+	// Rejects if the connection fails or closes before the result, or after imageResultTimeoutMs
+	const waitForImageResult = (requestId) => {
+		return new Promise((resolve, reject) => {
+			const socket = new WebSocket(`${baseURL.replace(/^http/, 'ws')}/process_image/${requestId}/events`);
+			let explanation = '';
+			let settled = false;
+
+			const finish = (settle, value) => {
+				if (settled) return;
+				settled = true;
+				clearTimeout(timer);
+				socket.close();
+				settle(value);
+			};
+			const timer = setTimeout(
+				() => finish(reject, new Error('Timed out waiting for the image result')),
+				imageResultTimeoutMs
+			);
+
+			socket.onmessage = (event) => {
+				const data = JSON.parse(event.data);
+				if (data.event_type === 'on_image_explanation_stream') {
+					explanation += data.content;
+					setProcessedResult((prev) => ({ ...prev, text: explanation }));
+				} else if (data.event_type === 'on_image_url') {
+					setProcessedResult((prev) => ({ ...prev, image_url: data.content }));
+				} else if (data.event_type === 'on_image_process') {
+					finish(resolve, data.content);
+				} else if (data.event_type === 'error') {
+					finish(reject, new Error(data.content));
+				}
+			};
+
+			socket.onerror = () => finish(reject, new Error('Image events connection failed'));
+			socket.onclose = () => finish(reject, new Error('Image events connection closed before the result'));
+		});
+	};
+
 	const processImage = async (url) => {
 		try {
 			const payload = JSON.stringify({ url });
@@ -95,7 +136,10 @@ const CameraComponent = () => {
 			}
 	
 			const data = await response.json();
-			return data.response;
+			if (data.error) {
+				throw new Error(data.error);
+			}
+			return await waitForImageResult(data.request_id);
 		} catch (error) {
 			console.error('Error processing image:', error);
 			throw error;
@@ -13,6 +13,10 @@ const api = axios.create({
     baseURL: baseURL
 });
 
+// Stop polling an indexing job after this long; large PDFs take a few minutes
+const jobTimeoutMs = 15 * 60 * 1000;
+const jobPollIntervalMs = 1000;
+
 const Expander = ({ title, content, metadata }) => {
     const [isOpen, setIsOpen] = useState(false);
     const { source, page } = metadata; // Destructure the metadata
@@ -180,9 +184,35 @@ function QuestionForm() {
 
         setQuestion('');
         setAnswer(response.data.response);
+        setAnswer(await waitForJob(response.data.job_id));
         setIsLoading(false);
     };
 
+    // Indexing runs as a background job on the server; poll until it finishes, the server
+    // no longer knows the job (404, e.g. after a restart), the request fails or the deadline passes
+    const waitForJob = async (jobId) => {
+        const deadline = Date.now() + jobTimeoutMs;
+        while (Date.now() < deadline) {
+            let job;
+            try {
+                ({ data: job } = await api.get(`/jobs/${jobId}`));
+            } catch (error) {
+                if (error.response?.status === 404) {
+                    return 'Indexing status is no longer available; the server may have restarted. Please try again.';
+                }
+                return `Could not check the indexing status: ${error.message}`;
+            }
+            if (job.state === 'succeeded') {
+                return job.result;
+            }
+            if (job.state === 'failed') {
+                return `Indexing failed: ${job.error}`;
+            }
+            await new Promise((resolve) => setTimeout(resolve, jobPollIntervalMs));
+        }
+        return 'Indexing is taking longer than expected; it may still finish in the background.';
+    };
+
     const handleIndexingDoc = async (e) => {
         const fileName = e.target.files[0]?.name;  // Safely access the file name
         const file = e.target.files[0];  // Get the file
@@ -209,8 +239,9 @@ function QuestionForm() {
                 },
             });
     
-            // Set the answer based on the API response
+            // Set the answer based on the API response, then on the finished job
             setAnswer(response.data.response);
+            setAnswer(await waitForJob(response.data.job_id));
         } catch (error) {
             console.error('Error uploading document:', error);
             // Optionally handle the error state (e.g., show an error message)